@@ -1,94 +1,172 @@
-from solutions.SUM.sum_solution import SumSolution
-from solutions.HLO.hello_solution import HelloSolution
-from solutions.FIZ.fizz_buzz_solution import FizzBuzzSolution
-from solutions.CHK.checkout_solution import CheckoutSolution
-from solutions.RBT.rabbit_hole_solution import RabbitHoleSolution
-from solutions.AMZ.amazing_solution import AmazingSolution
-from solutions.ULT.ultimate_solution import UltimateSolution
-from solutions.DMO.demo_round1_solution import DemoRound1Solution
-from solutions.DMO.demo_round2_solution import DemoRound2Solution
-from solutions.DMO.demo_round3_solution import DemoRound3Solution
-from solutions.DMO.inventory_item import InventoryItem
-from solutions.DMO.demo_round4n5_solution import DemoRound4n5Solution
-
-from dataclasses import is_dataclass, asdict
+import importlib
+import threading
 
-class EntryPointMapping:
-    def __init__(self):
-        self.sum_solution = SumSolution()
-        self.hello_solution = HelloSolution()
-        self.fizz_buzz_solution = FizzBuzzSolution()
-        self.checkout_solution = CheckoutSolution()
-        self.rabbit_hole_solution = RabbitHoleSolution()
-        self.amazing_solution = AmazingSolution()
-        self.ultimate_solution = UltimateSolution()
-        self.demo_round1_solution = DemoRound1Solution()
-        self.demo_round2_solution = DemoRound2Solution()
-        self.demo_round3_solution = DemoRound3Solution()
-        self.demo_round4n5_solution = DemoRound4n5Solution()
+from runner.response_cache import ResponseCache
 
+# Method name -> "module:Class.method" of the solution serving it. Modules are
+# only imported, and solution classes only instantiated, on first use; methods
+# of the same class share one instance.
+SOLUTIONS = {
     # ~~~~~~~~ Single method challenges ~~~~~~
-    
-    def sum(self, *args):
-        return self.sum_solution.compute(*args)
-
-    def hello(self, *args):
-        return self.hello_solution.hello(*args)
-
-    def fizz_buzz(self, *args):
-        return self.fizz_buzz_solution.fizz_buzz(*args)
-
-    def checkout(self, *args):
-        return self.checkout_solution.checkout(*args)
-
-    def rabbit_hole(self, *args):
-        return self.rabbit_hole_solution.rabbit_hole(*args)
-
-    def amazing_maze(self, *args):
-        return self.amazing_solution.amazing_maze(*args)
-
-    def ultimate_maze(self, *args):
-        return self.ultimate_solution.ultimate_maze(*args)
-
+    "sum": "solutions.SUM.sum_solution:SumSolution.compute",
+    "hello": "solutions.HLO.hello_solution:HelloSolution.hello",
+    "fizz_buzz": "solutions.FIZ.fizz_buzz_solution:FizzBuzzSolution.fizz_buzz",
+    "checkout": "solutions.CHK.checkout_solution:CheckoutSolution.checkout",
+    "rabbit_hole": "solutions.RBT.rabbit_hole_solution:RabbitHoleSolution.rabbit_hole",
+    "amazing_maze": "solutions.AMZ.amazing_solution:AmazingSolution.amazing_maze",
+    "ultimate_maze": "solutions.ULT.ultimate_solution:UltimateSolution.ultimate_maze",
     # ~~~~~~~~ Demo rounds ~~~~~~
-    
-    def increment(self, *args):
-        return self.demo_round1_solution.increment(*args)
-
-    def to_uppercase(self, *args):
-        return self.demo_round1_solution.to_uppercase(*args)
+    "increment": "solutions.DMO.demo_round1_solution:DemoRound1Solution.increment",
+    "to_uppercase": "solutions.DMO.demo_round1_solution:DemoRound1Solution.to_uppercase",
+    "letter_to_santa": "solutions.DMO.demo_round1_solution:DemoRound1Solution.letter_to_santa",
+    "count_lines": "solutions.DMO.demo_round1_solution:DemoRound1Solution.count_lines",
+    # Round 2
+    "array_sum": "solutions.DMO.demo_round2_solution:DemoRound2Solution.array_sum",
+    "int_range": "solutions.DMO.demo_round2_solution:DemoRound2Solution.int_range",
+    "filter_pass": "solutions.DMO.demo_round2_solution:DemoRound2Solution.filter_pass",
+    # Round 3
+    "inventory_add": "solutions.DMO.demo_round3_solution:DemoRound3Solution.inventory_add",
+    "inventory_size": "solutions.DMO.demo_round3_solution:DemoRound3Solution.inventory_size",
+    "inventory_get": "solutions.DMO.demo_round3_solution:DemoRound3Solution.inventory_get",
+    # Round 4 & 5
+    "waves": "solutions.DMO.demo_round4n5_solution:DemoRound4n5Solution.waves",
+}
+
+# Methods the concurrent runner runs in worker processes, each worker with its
+# own EntryPointMapping: they are CPU-bound, and a request never depends on
+# state an earlier one left behind (rabbit_hole only reuses it when it can)
+PROCESS_METHODS = ("checkout", "rabbit_hole", "amazing_maze", "ultimate_maze")
+
+# Methods the concurrent runner runs one at a time, in request order, because
+# each must see what the previous ones did to the round 3 inventory
+SERIAL_METHODS = ("inventory_add", "inventory_size", "inventory_get")
+
+# Method name -> LRU capacity for methods whose result depends only on their
+# arguments, for EntryPointMapping(pure_methods=PURE_METHODS) to memoize. A
+# method may only be listed if every registry method served by the same class
+# is listed too, so a reader can never be cached next to a writer that changes
+# what it would return (the inventory methods, say). checkout is pure here
+# because the mapping never installs a catalog watcher. A cache hit returns
+# without calling the solution, so the checkout metrics and basket cache never
+# see it: cache_stats() counts it instead.
+PURE_METHODS = {
+    "sum": 1024,
+    "hello": 1024,
+    "fizz_buzz": 1024,
+    "checkout": 4096,
+    "increment": 1024,
+    "to_uppercase": 1024,
+    "letter_to_santa": 1,
+    "count_lines": 1024,
+}
 
-    def letter_to_santa(self):
-        return self.demo_round1_solution.letter_to_santa()
 
-    def count_lines(self, *args):
-        return self.demo_round1_solution.count_lines(*args)
+class EntryPointMapping:
+    """Serves every method in the registry as an attribute, e.g. mapping.sum(1, 2).
+
+    Nothing is imported until a method is first called, so a worker only pays
+    for the solutions it serves. prewarm names methods to load up front.
+    Methods in pure_methods, method name -> LRU capacity, are memoized; none
+    are unless asked, see PURE_METHODS. Names the registry does not serve
+    are skipped when pure_methods is PURE_METHODS itself.
+    """
+
+    def __init__(self, registry=None, prewarm=(), pure_methods=None):
+        self._registry = dict(SOLUTIONS if registry is None else registry)
+        if pure_methods is None:
+            pure_methods = {}
+        elif pure_methods is PURE_METHODS:
+            pure_methods = {
+                name: capacity
+                for name, capacity in PURE_METHODS.items()
+                if name in self._registry
+            }
+        self._pure_methods = dict(pure_methods)
+        self._check_pure_methods()
+        self._instances = {}
+        self._methods = {}
+        self._caches = {}
+        self._lock = threading.Lock()
+        self.prewarm(*prewarm)
+
+    def _check_pure_methods(self):
+        classes = {}
+        for method_name, target in self._registry.items():
+            classes.setdefault(target.rpartition(".")[0], []).append(method_name)
+        for method_name in self._pure_methods:
+            if method_name not in self._registry:
+                raise ValueError(f"Pure method {method_name!r} is not in the registry")
+            siblings = classes[self._registry[method_name].rpartition(".")[0]]
+            impure = [name for name in siblings if name not in self._pure_methods]
+            if impure:
+                raise ValueError(
+                    f"{method_name!r} cannot be pure: it shares a solution "
+                    f"instance with {', '.join(map(repr, impure))}"
+                )
+
+    def prewarm(self, *method_names):
+        """Import and instantiate the solutions behind these methods now."""
+        for method_name in method_names:
+            self.resolve(method_name)
+
+    def resolve(self, method_name):
+        """Return the bound solution method serving method_name."""
+        method = self._methods.get(method_name)
+        if method is not None:
+            return method
+        with self._lock:
+            method = self._methods.get(method_name)
+            if method is None:
+                module_name, _, qualified_name = self._registry[method_name].partition(":")
+                class_name, _, attribute = qualified_name.rpartition(".")
+                instance = self._instances.get((module_name, class_name))
+                if instance is None:
+                    solution_class = getattr(importlib.import_module(module_name), class_name)
+                    instance = self._instances[module_name, class_name] = solution_class()
+                method = getattr(instance, attribute)
+                capacity = self._pure_methods.get(method_name)
+                if capacity is not None:
+                    method = self._caches[method_name] = ResponseCache(method, capacity)
+                self._methods[method_name] = method
+        return method
+
+    @property
+    def method_names(self):
+        """Every method the mapping serves."""
+        return tuple(self._registry)
+
+    def solution(self, method_name):
+        """The solution instance serving method_name, e.g. to call its other methods."""
+        method = self.resolve(method_name)
+        if isinstance(method, ResponseCache):
+            method = method.method
+        return method.__self__
+
+    def cache_stats(self):
+        """Hits, misses and evictions of each memoized method resolved so far."""
+        return {name: cache.stats() for name, cache in list(self._caches.items())}
+
+    def __getattr__(self, method_name):
+        if method_name not in self.__dict__.get("_registry", ()):
+            raise AttributeError(
+                f"{type(self).__name__!r} object has no attribute {method_name!r}"
+            )
+
+        def entry_point(*args):
+            return self.resolve(method_name)(*args)
+
+        entry_point.__name__ = method_name
+        return entry_point
+
+    # ~~~~~~~~ Argument and result conversions ~~~~~~
 
     # Round 2
-    def array_sum(self, *args):
-        return self.demo_round2_solution.array_sum(*args)
-
-    def int_range(self, *args):
-        return self.demo_round2_solution.int_range(*args)
-
-    def filter_pass(self, *args):
-        return self.demo_round2_solution.filter_pass(*args)
+    def int_range(self, start, end):
+        return list(self.resolve("int_range")(start, end))
 
     # Round 3
     def inventory_add(self, inventory_item, number):
-        item = InventoryItem(**inventory_item)
-        return self.demo_round3_solution.inventory_add(item, number)
-
-    def inventory_size(self):
-        return self.demo_round3_solution.inventory_size()
-
-    def inventory_get(self, *args):
-        response = self.demo_round3_solution.inventory_get(*args)
-        if is_dataclass(response):
-            # noinspection PyDataclass
-            return asdict(response)
-        return response
+        from solutions.DMO.inventory_item import InventoryItem
 
-    # Round 4 & 5
-    def waves(self, *args):
-        return self.demo_round4n5_solution.waves(*args)
+        item = InventoryItem(**inventory_item)
+        return self.resolve("inventory_add")(item, number)
@@ -0,0 +1,277 @@
+import datetime
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from tdl.queue.abstractions.response.fatal_error_response import FatalErrorResponse
+from tdl.queue.abstractions.response.valid_response import ValidResponse
+from tdl.queue.queue_based_implementation_runner import (
+    QueueBasedImplementationRunner,
+    QueueBasedImplementationRunnerBuilder,
+)
+from tdl.queue.transport.remote_broker import RemoteBroker
+
+
+class OrderedDispatcher:
+    """Runs requests concurrently and publishes their responses in request order.
+
+    Drop-in replacement for the runner's ApplyProcessingRules. Requests run on
+    a thread pool, on a single thread for methods that must see each other's
+    effects in order, or on a pool of processes each holding its own entry
+    point mapping. At most max_in_flight requests are accepted but not yet
+    answered: beyond that, the broker's receiving thread waits, so the broker
+    stops delivering. A fatal response stops the broker and nothing after it
+    is published, exactly as when requests run one by one.
+    """
+
+    def __init__(
+        self,
+        processing_rules,
+        audit,
+        max_in_flight=64,
+        worker_threads=None,
+        serial_methods=(),
+        process_methods=(),
+        entry_point_factory=None,
+        worker_processes=None,
+    ):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        if process_methods and entry_point_factory is None:
+            raise ValueError("Process methods need an entry point factory")
+        self._processing_rules = processing_rules
+        self._audit = audit
+        self._serial_methods = frozenset(serial_methods)
+        self._process_methods = frozenset(process_methods)
+        self._threads = ThreadPoolExecutor(worker_threads, "dispatch")
+        self._serial = ThreadPoolExecutor(1, "dispatch-serial")
+        self._processes = None
+        if self._process_methods:
+            self._processes = ProcessPoolExecutor(
+                worker_processes,
+                initializer=_init_worker,
+                initargs=(entry_point_factory,),
+            )
+        self._window = threading.BoundedSemaphore(max_in_flight)
+        # Accepted requests in arrival order: [headers, request, future]
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._stopped = False
+
+    def start(self):
+        """Start the worker processes now, before the broker's threads exist."""
+        if self._processes is not None:
+            self._processes.submit(int).result()
+
+    def process_next_request_from(self, remote_broker, headers, request):
+        self._window.acquire()
+        with self._lock:
+            if self._stopped:
+                self._window.release()
+                return None
+            entry = [headers, request, None]
+            self._pending.append(entry)
+
+        future = self._submit(request)
+        with self._lock:
+            entry[2] = future
+        future.add_done_callback(lambda _: self._publish_ready(remote_broker))
+        return None
+
+    def drain(self, timeout=None):
+        """Wait until every accepted request is answered; False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def shutdown(self):
+        self._threads.shutdown()
+        self._serial.shutdown()
+        if self._processes is not None:
+            self._processes.shutdown()
+
+    def _submit(self, request):
+        if request.method in self._process_methods:
+            try:
+                return self._processes.submit(
+                    _call_in_worker, request.method, request.params, request.id
+                )
+            except RuntimeError as e:
+                # The pool broke down, e.g. a worker process was killed
+                future = Future()
+                future.set_exception(e)
+                return future
+        if request.method in self._serial_methods:
+            executor = self._serial
+        else:
+            executor = self._threads
+        return executor.submit(self._processing_rules.get_response_for, request)
+
+    def _publish_ready(self, remote_broker):
+        with self._lock:
+            while self._pending:
+                headers, request, future = self._pending[0]
+                if future is None or not future.done():
+                    break
+                self._pending.popleft()
+                self._window.release()
+                if self._stopped:
+                    # Left unacknowledged, so the broker delivers it again
+                    continue
+
+                try:
+                    response = future.result()
+                except Exception as e:
+                    print(getattr(e, "message", str(e)))
+                    response = FatalErrorResponse(
+                        "user implementation raised exception"
+                    )
+
+                self._audit.start_line()
+                self._audit.log_request(request)
+                self._audit.log_response(response)
+                if isinstance(response, FatalErrorResponse):
+                    self._stopped = True
+                    remote_broker.stop()
+                else:
+                    remote_broker.respond_to(headers, response)
+                self._audit.end_line()
+
+            if not self._pending:
+                self._idle.notify_all()
+
+
+class DrainingRemoteBroker(RemoteBroker):
+    """Remote broker that answers every accepted request before disconnecting."""
+
+    def __init__(self, dispatcher, *args):
+        super().__init__(*args)
+        self._dispatcher = dispatcher
+
+    def close(self):
+        self._dispatcher.drain()
+        # A request that arrived while draining restarted the idle timer, and
+        # that newer timer closes the connection instead
+        current = threading.current_thread()
+        if isinstance(current, threading.Timer) and current is not self._timer:
+            return
+        super().close()
+
+
+class ConcurrentImplementationRunner(QueueBasedImplementationRunner):
+    def __init__(self, config, deploy_processing_rules, dispatcher_options):
+        super().__init__(config, deploy_processing_rules)
+        self._dispatcher_options = dispatcher_options
+
+    def run(self):
+        start_time = datetime.datetime.now()
+
+        dispatcher = OrderedDispatcher(
+            self._deploy_processing_rules, self._audit, **self._dispatcher_options
+        )
+        try:
+            dispatcher.start()
+            self._audit.log_line("Starting client")
+
+            remote_broker = DrainingRemoteBroker(
+                dispatcher,
+                self._config.get_hostname(),
+                self._config.get_port(),
+                self._config.get_request_queue_name(),
+                self._config.get_response_queue_name(),
+                self._config.get_time_to_wait_for_request(),
+            )
+
+            self._audit.log_line("Waiting for requests")
+
+            remote_broker.subscribe(dispatcher, self._audit)
+
+            while remote_broker.is_connected():
+                time.sleep(0.1)
+
+            self._audit.log_line("Stopping client")
+        except Exception as e:
+            self._audit.log_exception("There was a problem processing messages", e)
+        finally:
+            dispatcher.shutdown()
+
+        end_time = datetime.datetime.now()
+
+        self.total_processing_time_millis = (
+            end_time - start_time
+        ).total_seconds() * 1000.00
+
+
+class ConcurrentImplementationRunnerBuilder(QueueBasedImplementationRunnerBuilder):
+    """Builds a runner that handles requests concurrently, answering in order."""
+
+    def __init__(self):
+        super().__init__()
+        self._dispatcher_options = {}
+        self._method_names = set()
+
+    def with_solution_for(self, method_name, user_implementation):
+        self._method_names.add(method_name)
+        return super().with_solution_for(method_name, user_implementation)
+
+    def with_max_in_flight(self, max_in_flight):
+        self._dispatcher_options["max_in_flight"] = max_in_flight
+        return self
+
+    def with_worker_threads(self, worker_threads):
+        self._dispatcher_options["worker_threads"] = worker_threads
+        return self
+
+    def with_serial_methods(self, *method_names):
+        """Run these methods one at a time, in the order they were requested."""
+        self._dispatcher_options["serial_methods"] = method_names
+        return self
+
+    def with_process_pool(self, entry_point_factory, *method_names, processes=None):
+        """Run these methods in worker processes.
+
+        Each worker builds its own entry point mapping by calling
+        entry_point_factory, and calls the method of the same name on it:
+        the implementation given to with_solution_for() is bound to objects
+        in this process and never runs there. Every method must still have
+        one, so the methods served are the same as without workers, and it
+        should be that same method of a mapping built by the factory.
+        """
+        self._dispatcher_options["entry_point_factory"] = entry_point_factory
+        self._dispatcher_options["process_methods"] = method_names
+        self._dispatcher_options["worker_processes"] = processes
+        return self
+
+    def create(self):
+        unregistered = [
+            method_name
+            for method_name in self._dispatcher_options.get("process_methods", ())
+            if method_name not in self._method_names
+        ]
+        if unregistered:
+            raise ValueError(
+                f"Process methods without a solution: {', '.join(unregistered)}"
+            )
+        return ConcurrentImplementationRunner(
+            self._config, self._deploy_processing_rules, self._dispatcher_options
+        )
+
+
+# ~~~~ Worker processes
+
+_entry_points = None
+
+
+def _init_worker(entry_point_factory):
+    global _entry_points
+    _entry_points = entry_point_factory()
+
+
+def _call_in_worker(method_name, params, request_id):
+    try:
+        result = getattr(_entry_points, method_name)(*params)
+    except Exception as e:
+        print(getattr(e, "message", str(e)))
+        return FatalErrorResponse("user implementation raised exception")
+    return ValidResponse(request_id, result)
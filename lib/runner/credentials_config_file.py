@@ -1,23 +1,77 @@
 import os
+import threading
+
+_MISSING = object()
+
+
+class CredentialsConfig:
+    """
+    A properties file parsed once and re-read only when its mtime or size changes.
+
+    Any key can be overridden by an environment variable named after it in
+    upper case, e.g. TDL_HOSTNAME for tdl_hostname. Values from either place
+    are typed the same way: "true" and "false" become booleans.
+    """
+
+    def __init__(self, filepath, environ=os.environ):
+        self.filepath = filepath
+        self._environ = environ
+        self._properties = None
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def get(self, key, default=_MISSING):
+        override = self._environ.get(key.upper())
+        if override is not None:
+            return _typed(override.strip().strip('"'))
+        properties = self.properties()
+        if default is _MISSING:
+            return properties[key]
+        return properties.get(key, default)
+
+    def properties(self):
+        """The parsed file, re-read if it changed since the last call."""
+        try:
+            stat = os.stat(self.filepath)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            # Keep serving the last good version if the file goes away
+            if self._properties is not None:
+                return self._properties
+            signature = None
+        if signature != self._signature or self._properties is None:
+            with self._lock:
+                if signature != self._signature or self._properties is None:
+                    self._properties = load_properties(self.filepath)
+                    self._signature = signature
+        return self._properties
 
 
 def read_from_config_file(key):
-    properties = read_properties_file()
-    return properties[key]
+    return _credentials_config().get(key)
 
 
 def read_from_config_file_with_default(key, default_value):
-    properties = read_properties_file()
-    return properties.get(key, default_value)
+    return _credentials_config().get(key, default_value)
 
 
 # ~~~~ Helpers
 
+_config = None
+
+
+def _credentials_config():
+    global _config
+    if _config is None:
+        current_dir = os.path.dirname(__file__)
+        _config = CredentialsConfig(
+            os.path.join(current_dir, "..", "..", "config", "credentials.config")
+        )
+    return _config
+
 
 def read_properties_file():
-    current_dir = os.path.dirname(__file__)
-    properties = load_properties(os.path.join(current_dir, "..", "..", "config", "credentials.config"))
-    return properties
+    return dict(_credentials_config().properties())
 
 
 def load_properties(filepath, sep='=', comment_char='#'):
@@ -33,11 +87,15 @@ def load_properties(filepath, sep='=', comment_char='#'):
                     key_value = l.split(sep)
                     key = key_value[0].strip()
                     value = sep.join(key_value[1:]).strip().strip('"')
-                    value = value.replace("\=", "=")
-                    if value in ['true', 'false']:
-                        value = value == 'true'
-                    props[key] = value
+                    value = value.replace("\\=", "=")
+                    props[key] = _typed(value)
         return props
     except IOError as e:
         print('ERROR: You need to download the credentials.config file before you can run this.')
         exit(1)
+
+
+def _typed(value):
+    if value in ['true', 'false']:
+        return value == 'true'
+    return value
@@ -0,0 +1,412 @@
+"""
+Replays request streams against the runner through a local broker.
+
+    PYTHONPATH=lib python -m runner.load_generator --methods sum,checkout --count 20000 --rate 5000
+    PYTHONPATH=lib python -m runner.load_generator --replay requests.jsonl --sequential
+
+Nothing leaves the machine: the runner connects to a LocalBroker on
+localhost, exactly as it would to the challenge server, and answers the
+requests through EntryPointMapping. Recorded streams are files of JSON
+request messages, one per line, e.g. {"method": "sum", "params": [1, 2]}.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import string
+import sys
+import threading
+import time
+from typing import NamedTuple
+
+from tdl.queue.implementation_runner_config import ImplementationRunnerConfig
+from tdl.queue.queue_based_implementation_runner import (
+    QueueBasedImplementationRunnerBuilder,
+)
+
+from entry_point_mapping import (
+    PROCESS_METHODS,
+    SERIAL_METHODS,
+    SOLUTIONS,
+    EntryPointMapping,
+)
+from runner.concurrent_runner import ConcurrentImplementationRunnerBuilder
+from runner.local_broker import LocalBroker
+
+REQUEST_QUEUE = "load.req"
+RESPONSE_QUEUE = "load.resp"
+
+
+class LoadRequest(NamedTuple):
+    method: str
+    params: list
+
+
+class MethodLatency(NamedTuple):
+    """Latencies of the answered requests for one method, in milliseconds."""
+
+    method: str
+    count: int
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+
+class LoadReport(NamedTuple):
+    sent: int
+    answered: int
+    seconds: float
+    throughput: float
+    overall: MethodLatency
+    methods: tuple
+
+    @property
+    def unanswered(self):
+        return self.sent - self.answered
+
+
+# ~~~~ Request streams
+
+
+def _word(rng, alphabet=string.ascii_letters, longest=12):
+    return "".join(rng.choices(alphabet, k=rng.randint(1, longest)))
+
+
+def _integers(rng, longest=100):
+    return [rng.randint(-1000, 1000) for _ in range(rng.randint(0, longest))]
+
+
+def _inventory_item(rng):
+    sku = rng.choice(string.ascii_uppercase)
+    return {"sku": sku, "name": f"Item {sku}", "price": rng.randint(1, 100)}
+
+
+def _maze(rng):
+    options = {"seed": rng.randrange(2**32)}
+    return [rng.randint(1, 40), rng.randint(1, 40), options]
+
+
+# Method name -> random params for one request
+SYNTHETIC = {
+    "sum": lambda rng: [rng.randint(0, 100), rng.randint(0, 100)],
+    "hello": lambda rng: [_word(rng)],
+    "fizz_buzz": lambda rng: [rng.randint(1, 9999)],
+    "checkout": lambda rng: [_word(rng, "ABCDEFGHIJKLMNOPQRSTUVWXYZ", 40)],
+    "rabbit_hole": lambda rng: [
+        rng.randint(1, 40),
+        rng.randint(1, 40),
+        _word(rng, "UDLR", 400),
+        {},
+    ],
+    "amazing_maze": lambda rng: _maze(rng),
+    "ultimate_maze": lambda rng: _maze(rng),
+    "increment": lambda rng: [rng.randint(-1000, 1000)],
+    "to_uppercase": lambda rng: [_word(rng)],
+    "letter_to_santa": lambda rng: [],
+    "count_lines": lambda rng: [
+        "\n".join(_word(rng) for _ in range(rng.randint(0, 20)))
+    ],
+    "array_sum": lambda rng: [_integers(rng)],
+    "int_range": lambda rng: sorted([rng.randint(0, 100), rng.randint(0, 100)]),
+    "filter_pass": lambda rng: [_integers(rng), rng.randint(-1000, 1000)],
+    "inventory_add": lambda rng: [_inventory_item(rng), rng.randint(1, 5)],
+    "inventory_size": lambda rng: [],
+    "inventory_get": lambda rng: [rng.choice(string.ascii_uppercase)],
+    "waves": lambda rng: [rng.randint(1, 10)],
+}
+
+
+def synthetic_requests(method_names, count, seed=0):
+    """count requests for method_names, picked uniformly at random."""
+    unknown = [name for name in method_names if name not in SYNTHETIC]
+    if unknown:
+        raise ValueError(f"No synthetic requests for {', '.join(unknown)}")
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        method = rng.choice(method_names)
+        requests.append(LoadRequest(method, SYNTHETIC[method](rng)))
+    return requests
+
+
+def load_requests(path):
+    """Read a recorded stream: one JSON request message per line."""
+    requests = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+                requests.append(LoadRequest(message["method"], message["params"]))
+            except (ValueError, KeyError) as e:
+                raise ValueError(f"Invalid request on line {line_number}: {e}") from e
+    return requests
+
+
+# ~~~~ Runners
+
+
+class _SilentAudit:
+    @staticmethod
+    def log(value):
+        pass
+
+
+class RunnerOptions(NamedTuple):
+    """Builds a runner serving every method in SOLUTIONS: options(config).
+
+    The default is the concurrent runner, which send_command_to_server.py
+    only uses when tdl_concurrent_runner is set; sequential=True gives the
+    stock one-request-at-a-time runner it uses otherwise.
+    """
+
+    sequential: bool = False
+    max_in_flight: int = 64
+    process_methods: tuple = PROCESS_METHODS
+    serial_methods: tuple = SERIAL_METHODS
+    entry_point_factory: object = EntryPointMapping
+
+    def __call__(self, config):
+        entry_points = self.entry_point_factory()
+        if self.sequential:
+            builder = QueueBasedImplementationRunnerBuilder()
+        else:
+            builder = ConcurrentImplementationRunnerBuilder()
+            builder.with_max_in_flight(self.max_in_flight)
+            if self.process_methods:
+                builder.with_process_pool(
+                    self.entry_point_factory, *self.process_methods
+                )
+            if self.serial_methods:
+                builder.with_serial_methods(*self.serial_methods)
+        for method_name in SOLUTIONS:
+            builder.with_solution_for(method_name, getattr(entry_points, method_name))
+        return builder.set_config(config).create()
+
+
+def _run(create_runner, config):
+    create_runner(config).run()
+
+
+# ~~~~ Load
+
+
+def run_load(
+    requests,
+    create_runner=RunnerOptions(),
+    rate=None,
+    timeout=60.0,
+    idle_millis=2000,
+    isolated=True,
+    warmup=(),
+    audit=None,
+):
+    """Send requests to a runner through a local broker and time the responses.
+
+    create_runner(config) builds the runner. With isolated, the default, it
+    runs in a process of its own, so it does not compete with the broker and
+    the sender for the GIL; create_runner must then be picklable.
+
+    rate is in requests per second; None sends them all at once. Latency is
+    counted from when a request was due to be sent, not when it actually was,
+    so a runner that falls behind cannot hide it by slowing the sender down.
+    The runner stops after idle_millis without requests, as it would against
+    the challenge server. The warmup requests are answered first and left out
+    of the report, so that importing and building the solutions is too.
+    """
+    due = [0.0] * len(requests)
+    answered = [None] * len(requests)
+    remaining = [len(requests)]
+    done = threading.Event()
+    if not requests:
+        done.set()
+    warmed = threading.Semaphore(0)
+
+    def on_response(headers, body):
+        now = time.perf_counter()
+        response_id = json.loads(body)["id"]
+        if response_id.startswith("warmup-"):
+            warmed.release()
+            return
+        index = int(response_id)
+        if answered[index] is None:
+            answered[index] = now
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                done.set()
+
+    with LocalBroker() as broker:
+        broker.on_message(RESPONSE_QUEUE, on_response)
+        config = (
+            ImplementationRunnerConfig()
+            .set_hostname(broker.hostname)
+            .set_port(broker.port)
+            .set_request_queue_name(REQUEST_QUEUE)
+            .set_response_queue_name(RESPONSE_QUEUE)
+            .set_time_to_wait_for_request(idle_millis)
+            .set_audit_stream(audit or _SilentAudit)
+        )
+        if isolated:
+            context = multiprocessing.get_context("spawn")
+            runner = context.Process(target=_run, args=(create_runner, config))
+        else:
+            runner = threading.Thread(target=_run, args=(create_runner, config))
+        runner.start()
+        if not broker.wait_for_subscriber(REQUEST_QUEUE, timeout):
+            raise RuntimeError("The runner did not subscribe to the request queue")
+
+        for index, request in enumerate(warmup):
+            _send(broker, request, f"warmup-{index}")
+        deadline = time.perf_counter() + timeout
+        for _ in warmup:
+            while not warmed.acquire(timeout=0.05):
+                if not runner.is_alive() or time.perf_counter() > deadline:
+                    raise RuntimeError("The runner did not answer the warmup requests")
+
+        start = time.perf_counter()
+        for index, request in enumerate(requests):
+            if rate:
+                due[index] = start + index / rate
+                delay = due[index] - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                due[index] = time.perf_counter()
+            _send(broker, request, str(index))
+
+        deadline = time.perf_counter() + timeout
+        while not done.wait(0.05):
+            if not runner.is_alive() or time.perf_counter() > deadline:
+                break
+        finished = max((t for t in answered if t is not None), default=start)
+        runner.join(timeout + idle_millis / 1000)
+
+    return _report(requests, due, answered, start, finished)
+
+
+def _send(broker, request, request_id):
+    message = {"method": request.method, "params": request.params, "id": request_id}
+    broker.send(REQUEST_QUEUE, json.dumps(message))
+
+
+def _report(requests, due, answered, start, finished):
+    by_method = {}
+    for request, sent_at, answered_at in zip(requests, due, answered):
+        if answered_at is not None:
+            by_method.setdefault(request.method, []).append(answered_at - sent_at)
+    everything = [latency for latencies in by_method.values() for latency in latencies]
+    seconds = finished - start
+    return LoadReport(
+        sent=len(requests),
+        answered=len(everything),
+        seconds=seconds,
+        throughput=len(everything) / seconds if seconds > 0 else 0.0,
+        overall=_latency("all", everything),
+        methods=tuple(
+            _latency(method, latencies)
+            for method, latencies in sorted(by_method.items())
+        ),
+    )
+
+
+def _latency(method, latencies):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        rank = max(math.ceil(p / 100 * len(latencies)) - 1, 0)
+        return latencies[rank] * 1000
+
+    return MethodLatency(
+        method=method,
+        count=len(latencies),
+        p50=percentile(50),
+        p90=percentile(90),
+        p99=percentile(99),
+        max=percentile(100),
+    )
+
+
+def format_report(report):
+    lines = [
+        f"sent {report.sent}, answered {report.answered} in {report.seconds:.3f}s"
+        f" ({report.throughput:,.0f} req/s)",
+        f"{'method':<16}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+    ]
+    for latency in report.methods + (report.overall,):
+        lines.append(
+            f"{latency.method:<16}{latency.count:>8}{latency.p50:>10.2f}"
+            f"{latency.p90:>10.2f}{latency.p99:>10.2f}{latency.max:>10.2f}"
+        )
+    if report.unanswered:
+        lines.append(
+            f"{report.unanswered} requests were not answered: the runner stopped"
+            " on an error or timed out"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--methods",
+        default="sum,hello,checkout",
+        help="comma separated methods to generate requests for",
+    )
+    source.add_argument("--replay", help="file of recorded requests, one per line")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        help="untimed requests to send first, taken from the start of the stream "
+        "(default: 1000 generated ones, none of a replay)",
+    )
+    parser.add_argument(
+        "--rate", type=float, help="requests per second (default: all at once)"
+    )
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--sequential", action="store_true")
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--process-methods", default=",".join(PROCESS_METHODS))
+    parser.add_argument("--serial-methods", default=",".join(SERIAL_METHODS))
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        warmup = args.warmup or 0
+        requests = load_requests(args.replay)
+    else:
+        warmup = 1000 if args.warmup is None else args.warmup
+        requests = synthetic_requests(
+            args.methods.split(","), warmup + args.count, args.seed
+        )
+    if len(requests) <= warmup:
+        parser.error(
+            f"{len(requests)} requests leave nothing to measure after "
+            f"{warmup} warmup requests"
+        )
+    create_runner = RunnerOptions(
+        sequential=args.sequential,
+        max_in_flight=args.max_in_flight,
+        process_methods=tuple(filter(None, args.process_methods.split(","))),
+        serial_methods=tuple(filter(None, args.serial_methods.split(","))),
+    )
+    report = run_load(
+        requests[warmup:],
+        create_runner,
+        rate=args.rate,
+        timeout=args.timeout,
+        warmup=requests[:warmup],
+    )
+    print(format_report(report))
+    return 0 if not report.unanswered else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
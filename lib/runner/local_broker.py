@@ -0,0 +1,335 @@
+import itertools
+import queue
+import re
+import socket
+import threading
+from collections import deque
+
+from stomp.utils import Frame, convert_frame, parse_headers
+
+_HEADERS_END = re.compile(b"\r?\n\r?\n")
+_LINE_END = re.compile("\r?\n")
+_CONTENT_LENGTH = re.compile(b"^content-length:\\s*([0-9]+)", re.MULTILINE)
+_ESCAPES = str.maketrans({"\\": "\\\\", "\n": "\\n", ":": "\\c", "\r": "\\r"})
+
+
+class LocalBroker:
+    """A minimal STOMP 1.1 broker on localhost, standing in for the challenge server.
+
+    Every destination is a queue: each message goes to one subscriber, round
+    robin, and waits in the queue while nobody is subscribed. Messages taken
+    with ack "client" or "client-individual" stay owned by the subscriber until
+    acknowledged, with at most prefetch of them outstanding per subscription;
+    unacknowledged ones go back to the front of the queue when the subscriber
+    unsubscribes or disconnects. That is all RemoteBroker relies on.
+
+    The test harness can publish with send() and consume with on_message()
+    directly, without a STOMP connection of its own.
+    """
+
+    def __init__(self, hostname="127.0.0.1", port=0, prefetch=1000):
+        self.hostname = hostname
+        self.prefetch = prefetch
+        self._address = (hostname, port)
+        self._server = None
+        self._sessions = set()
+        self._queues = {}
+        self._listeners = {}
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._subscribed = threading.Condition(self._lock)
+
+    @property
+    def port(self):
+        return self._server.getsockname()[1]
+
+    def start(self):
+        self._server = socket.create_server(self._address)
+        threading.Thread(target=self._accept, name="local-broker", daemon=True).start()
+        return self
+
+    def stop(self):
+        try:
+            # Wakes up the accepting thread
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            session.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # ~~~~ In-process access
+
+    def send(self, destination, body, headers=None):
+        """Publish a message as if a client had sent it."""
+        self._route(destination, body, dict(headers or {}))
+
+    def on_message(self, destination, callback):
+        """Hand every message sent to destination to callback(headers, body).
+
+        The messages are consumed on the spot instead of being queued.
+        """
+        with self._lock:
+            self._listeners[destination] = callback
+
+    def queue_depth(self, destination):
+        with self._lock:
+            messages = self._queues.get(destination)
+            return 0 if messages is None else len(messages.messages)
+
+    def wait_for_subscriber(self, destination, timeout=None):
+        """Wait until a client subscribes to destination; False on timeout."""
+        with self._subscribed:
+            return self._subscribed.wait_for(
+                lambda: destination in self._queues
+                and self._queues[destination].subscriptions,
+                timeout,
+            )
+
+    # ~~~~ Routing
+
+    def _route(self, destination, body, headers):
+        with self._lock:
+            listener = self._listeners.get(destination)
+            if listener is None:
+                headers["message-id"] = f"ID:local-{next(self._message_ids)}"
+                self._queue(destination).messages.append((headers, body))
+                self._deliver(destination)
+                return
+        listener(headers, body)
+
+    def _queue(self, destination):
+        messages = self._queues.get(destination)
+        if messages is None:
+            messages = self._queues[destination] = _Queue()
+        return messages
+
+    def _deliver(self, destination):
+        # Called with the lock held
+        messages = self._queues[destination]
+        while messages.messages:
+            subscription = messages.next_subscription(self.prefetch)
+            if subscription is None:
+                break
+            headers, body = messages.messages.popleft()
+            if subscription.ack != "auto":
+                subscription.unacked[headers["message-id"]] = (headers, body)
+            subscription.session.write(
+                "MESSAGE",
+                dict(
+                    headers,
+                    destination=destination,
+                    subscription=subscription.id,
+                ),
+                body,
+            )
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = _Session(self, connection)
+            with self._lock:
+                self._sessions.add(session)
+            session.start()
+
+    # ~~~~ Client frames, called by sessions
+
+    def subscribe(self, session, subscription_id, destination, ack):
+        with self._lock:
+            subscription = _Subscription(session, subscription_id, destination, ack)
+            session.subscriptions[subscription_id] = subscription
+            self._queue(destination).subscriptions.append(subscription)
+            self._deliver(destination)
+            self._subscribed.notify_all()
+
+    def unsubscribe(self, session, subscription_id):
+        with self._lock:
+            subscription = session.subscriptions.pop(subscription_id, None)
+            if subscription is not None:
+                self._release(subscription)
+
+    def ack(self, session, message_id, subscription_id):
+        with self._lock:
+            subscription = session.subscriptions.get(subscription_id)
+            if subscription is None:
+                return
+            if subscription.ack == "client":
+                # Cumulative: everything delivered up to this message
+                for delivered in list(subscription.unacked):
+                    del subscription.unacked[delivered]
+                    if delivered == message_id:
+                        break
+            else:
+                subscription.unacked.pop(message_id, None)
+            self._deliver(subscription.destination)
+
+    def disconnected(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+            for subscription in session.subscriptions.values():
+                self._release(subscription)
+            session.subscriptions.clear()
+
+    def _release(self, subscription):
+        # Called with the lock held
+        messages = self._queues[subscription.destination]
+        messages.subscriptions.remove(subscription)
+        messages.messages.extendleft(reversed(subscription.unacked.values()))
+        subscription.unacked.clear()
+        self._deliver(subscription.destination)
+
+
+class _Queue:
+    def __init__(self):
+        self.messages = deque()
+        self.subscriptions = []
+        self._turn = 0
+
+    def next_subscription(self, prefetch):
+        for _ in range(len(self.subscriptions)):
+            self._turn = (self._turn + 1) % len(self.subscriptions)
+            subscription = self.subscriptions[self._turn]
+            if subscription.ack == "auto" or len(subscription.unacked) < prefetch:
+                return subscription
+        return None
+
+
+class _Subscription:
+    def __init__(self, session, subscription_id, destination, ack):
+        self.session = session
+        self.id = subscription_id
+        self.destination = destination
+        self.ack = ack
+        # message-id -> (headers, body), in delivery order
+        self.unacked = {}
+
+
+class _Session:
+    """One client connection: a reader thread and a writer thread.
+
+    Frames go out through a queue so that the broker never blocks on a client
+    that is slow to read.
+    """
+
+    def __init__(self, broker, connection):
+        self.broker = broker
+        self.subscriptions = {}
+        self._connection = connection
+        self._outbox = queue.Queue()
+
+    def start(self):
+        threading.Thread(target=self._read, name="local-broker-in", daemon=True).start()
+        threading.Thread(
+            target=self._write, name="local-broker-out", daemon=True
+        ).start()
+
+    def write(self, command, headers, body=""):
+        if command != "CONNECTED":
+            headers = {
+                key: str(value).translate(_ESCAPES) for key, value in headers.items()
+            }
+        if body:
+            headers["content-length"] = None
+        self._outbox.put(b"".join(convert_frame(Frame(command, headers, body))))
+
+    def close(self):
+        self._outbox.put(None)
+
+    def _write(self):
+        while True:
+            data = self._outbox.get()
+            if data is None:
+                break
+            try:
+                self._connection.sendall(data)
+            except OSError:
+                break
+        try:
+            self._connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._connection.close()
+
+    def _read(self):
+        buffer = b""
+        try:
+            while True:
+                frame, buffer = _next_frame(buffer)
+                if frame is None:
+                    data = self._connection.recv(65536)
+                    if not data:
+                        break
+                    buffer += data
+                elif not self._handle(*frame):
+                    break
+        except OSError:
+            pass
+        finally:
+            self.broker.disconnected(self)
+            self.close()
+
+    def _handle(self, command, headers, body):
+        if command in ("CONNECT", "STOMP"):
+            self.write(
+                "CONNECTED",
+                {"version": "1.1", "heart-beat": "0,0", "server": "local-broker"},
+            )
+        elif command == "SEND":
+            message_headers = {
+                key: value
+                for key, value in headers.items()
+                if key not in ("destination", "content-length", "receipt")
+            }
+            self.broker.send(
+                headers["destination"], body.decode("utf-8"), message_headers
+            )
+        elif command == "SUBSCRIBE":
+            self.broker.subscribe(
+                self, headers["id"], headers["destination"], headers.get("ack", "auto")
+            )
+        elif command == "UNSUBSCRIBE":
+            self.broker.unsubscribe(self, headers["id"])
+        elif command == "ACK":
+            self.broker.ack(self, headers["message-id"], headers["subscription"])
+        elif command == "DISCONNECT":
+            pass
+        else:
+            self.write("ERROR", {"message": f"Unsupported command {command}"})
+            return False
+
+        if "receipt" in headers:
+            self.write("RECEIPT", {"receipt-id": headers["receipt"]})
+        return command != "DISCONNECT"
+
+
+def _next_frame(buffer):
+    """Split the first complete frame off buffer: ((command, headers, body), rest)."""
+    buffer = buffer.lstrip(b"\r\n")
+    end_of_headers = _HEADERS_END.search(buffer)
+    if end_of_headers is None:
+        return None, buffer
+    content_length = _CONTENT_LENGTH.search(buffer, 0, end_of_headers.start() + 1)
+    body_start = end_of_headers.end()
+    if content_length is not None:
+        body_end = body_start + int(content_length.group(1))
+        if len(buffer) <= body_end:
+            return None, buffer
+    else:
+        body_end = buffer.find(b"\x00", body_start)
+        if body_end < 0:
+            return None, buffer
+    lines = _LINE_END.split(buffer[: end_of_headers.start()].decode("utf-8"))
+    frame = (lines[0], parse_headers(lines, 1), buffer[body_start:body_end])
+    return frame, buffer[body_end + 1 :]
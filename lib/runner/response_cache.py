@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+from itertools import chain
+from typing import NamedTuple
+
+# Calls whose arguments add up to more characters and items than this are
+# never cached, so capacity entries can hold at most a few MB of keys
+MAX_ARGUMENT_SIZE = 4096
+
+
+class ResponseCacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of a pure method's results, keyed by its arguments.
+
+    Arguments are normalised into a hashable key: lists and dicts become
+    tuples, and scalars keep their type so that 1, 1.0 and True stay apart.
+    Calls whose arguments cannot be normalised, or are larger than
+    max_argument_size characters and items in all, go straight to the
+    method.
+    """
+
+    def __init__(self, method, capacity, max_argument_size=MAX_ARGUMENT_SIZE):
+        if capacity < 1:
+            raise ValueError("Cache capacity must be positive")
+        self.method = method
+        self.capacity = capacity
+        self.max_argument_size = max_argument_size
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args):
+        if _size(args, self.max_argument_size) > self.max_argument_size:
+            return self.method(*args)
+        try:
+            key = _freeze(args)
+        except TypeError:
+            return self.method(*args)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key]
+            self._misses += 1
+
+        result = self.method(*args)
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            return ResponseCacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                entries=len(self._entries),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _freeze(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return list, tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return dict, tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    # hash() raises TypeError for anything else that cannot be a key
+    hash(value)
+    return type(value), value
+
+
+def _size(value, limit):
+    # Characters of strings plus items of containers, counted only until
+    # past limit
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        items = chain.from_iterable(value.items())
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        return 1
+    size = len(value)
+    for item in items:
+        if size > limit:
+            break
+        size += _size(item, limit - size)
+    return size
@@ -0,0 +1,382 @@
+"""
+JSON-RPC 2.0 over HTTP in front of EntryPointMapping.
+
+    PYTHONPATH=lib python -m runner.rpc_server --port 8080
+
+    curl -d '{"jsonrpc": "2.0", "method": "checkout", "params": ["AAB"], "id": 1}' \\
+        http://127.0.0.1:8080/
+"""
+
+import argparse
+import asyncio
+import functools
+import inspect
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from entry_point_mapping import EntryPointMapping
+from runner.response_cache import ResponseCache
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+IMPLEMENTATION_ERROR = -32000
+
+_REASONS = {
+    200: "OK",
+    204: "No Content",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+}
+
+
+class RpcError(Exception):
+    def __init__(self, code, message, data=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+def checkout_batch(entry_points):
+    """Batch handler pricing many checkout calls in one checkout_many() pass.
+
+    The checkout solution is only imported when the first batch comes in.
+    """
+
+    def price(calls):
+        if all(len(params) == 1 and isinstance(params[0], str) for params in calls):
+            solution = entry_points.solution("checkout")
+            return solution.checkout_many([params[0] for params in calls])
+        return [entry_points.checkout(*params) for params in calls]
+
+    return price
+
+
+class JsonRpcServer:
+    """Serves EntryPointMapping methods as JSON-RPC 2.0 calls over HTTP.
+
+    POST a single call or a batch (a JSON array of calls) to any path. The
+    event loop only parses and routes: every call runs on the executor. Calls
+    to methods with a batch handler, checkout by default, are held for up to
+    batch_window_ms and handed over together, so concurrent clients share
+    one pricing pass.
+
+    Calls wait in a queue of at most max_pending, and at most max_in_flight
+    calls or batches run at a time. Once both are full, connections stop
+    being read until there is room again, pushing back on the clients.
+    """
+
+    def __init__(
+        self,
+        entry_points=None,
+        host="127.0.0.1",
+        port=0,
+        executor=None,
+        batch_handlers=None,
+        batch_window_ms=2.0,
+        max_batch=512,
+        max_pending=1024,
+        max_in_flight=8,
+        max_body_bytes=16 * 1024 * 1024,
+    ):
+        self.entry_points = entry_points or EntryPointMapping()
+        self.host = host
+        self._port = port
+        self._methods = frozenset(self.entry_points.method_names)
+        self._executor = executor or ThreadPoolExecutor(max_in_flight, "rpc")
+        self._owns_executor = executor is None
+        self._batch_handlers = (
+            {"checkout": checkout_batch(self.entry_points)}
+            if batch_handlers is None
+            else dict(batch_handlers)
+        )
+        self._batch_window = batch_window_ms / 1000
+        self._max_batch = max_batch
+        self._max_pending = max_pending
+        self._max_in_flight = max_in_flight
+        self._max_body_bytes = max_body_bytes
+        self._server = None
+        self._dispatcher = None
+        # method -> (calls, flush timer) of the batch being collected
+        self._batches = {}
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._queue = asyncio.Queue(self._max_pending)
+        self._slots = asyncio.Semaphore(self._max_in_flight)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        self._server = await asyncio.start_server(
+            self._serve_connection, self.host, self._port
+        )
+        return self
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._dispatcher.cancel()
+        for method in list(self._batches):
+            self._flush(method)
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # ~~~~ JSON-RPC
+
+    async def handle(self, payload):
+        """Answer a JSON-RPC payload: the response body, or None if there is none."""
+        try:
+            message = json.loads(payload)
+        except ValueError as e:
+            return _encode(
+                _error_response(None, RpcError(PARSE_ERROR, "Parse error", str(e)))
+            )
+
+        if isinstance(message, list):
+            if not message:
+                return _encode(
+                    _error_response(None, RpcError(INVALID_REQUEST, "Empty batch"))
+                )
+            responses = await asyncio.gather(*map(self._answer, message))
+            responses = [response for response in responses if response is not None]
+            return _encode(responses) if responses else None
+        response = await self._answer(message)
+        return None if response is None else _encode(response)
+
+    async def call(self, method, params=()):
+        """Queue a call and wait for its result."""
+        if method not in self._methods:
+            raise RpcError(METHOD_NOT_FOUND, "Method not found", method)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((method, params, future))
+        return await future
+
+    async def _answer(self, message):
+        try:
+            method, params = _parse_request(message)
+        except RpcError as e:
+            return _error_response(None, e)
+        try:
+            result = await self.call(method, params)
+        except RpcError as e:
+            response = _error_response(message.get("id"), e)
+        else:
+            response = {"jsonrpc": "2.0", "result": result, "id": message.get("id")}
+        # Notifications are never answered, even when they fail
+        return response if "id" in message else None
+
+    # ~~~~ Dispatch
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            method, params, future = await self._queue.get()
+            handler = self._batch_handlers.get(method)
+            if handler is not None and isinstance(params, list):
+                if method not in self._batches:
+                    # A batch holds one slot from its first call until priced
+                    await self._slots.acquire()
+                    timer = loop.call_later(self._batch_window, self._flush, method)
+                    self._batches[method] = ([], timer)
+                calls, _ = self._batches[method]
+                calls.append((params, future))
+                if len(calls) >= self._max_batch:
+                    self._flush(method)
+            else:
+                await self._slots.acquire()
+                asyncio.create_task(self._run(method, params, future))
+
+    def _flush(self, method):
+        batch = self._batches.pop(method, None)
+        if batch is not None:
+            calls, timer = batch
+            timer.cancel()
+            asyncio.create_task(self._run_batch(method, calls))
+
+    async def _run(self, method, params, future):
+        try:
+            await self._call_entry_point(method, params, future)
+        finally:
+            self._slots.release()
+
+    async def _run_batch(self, method, calls):
+        loop = asyncio.get_running_loop()
+        handler = self._batch_handlers[method]
+        try:
+            results = await loop.run_in_executor(
+                self._executor, handler, [params for params, _ in calls]
+            )
+        except Exception:
+            # One bad call fails the whole pass: answer them one by one
+            for params, future in calls:
+                await self._call_entry_point(method, params, future)
+        else:
+            for (_, future), result in zip(calls, results):
+                _settle(future, result=result)
+        finally:
+            self._slots.release()
+
+    async def _call_entry_point(self, method, params, future):
+        call = functools.partial(_invoke, self.entry_points, method, params)
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, call
+            )
+        except RpcError as e:
+            _settle(future, exception=e)
+        except Exception as e:
+            _settle(future, exception=_implementation_error(e))
+        else:
+            _settle(future, result=result)
+
+    # ~~~~ HTTP
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                verb, _, version = request_line.decode("latin-1").strip().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = (
+                    version == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close"
+                )
+                length = int(headers.get("content-length", 0))
+
+                if length > self._max_body_bytes:
+                    await _respond(writer, 413, b"", keep_alive=False)
+                    break
+                body = await reader.readexactly(length)
+                if verb != "POST":
+                    await _respond(writer, 405, b"", keep_alive)
+                else:
+                    response = await self.handle(body)
+                    if response is None:
+                        await _respond(writer, 204, b"", keep_alive)
+                    else:
+                        await _respond(writer, 200, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def _parse_request(message):
+    if not isinstance(message, dict) or message.get("jsonrpc") != "2.0":
+        raise RpcError(INVALID_REQUEST, "Invalid Request")
+    method = message.get("method")
+    if not isinstance(method, str):
+        raise RpcError(INVALID_REQUEST, "Invalid Request")
+    params = message.get("params", [])
+    if not isinstance(params, (list, dict)):
+        raise RpcError(INVALID_PARAMS, "Invalid params")
+    return method, params
+
+
+def _invoke(entry_points, method, params):
+    entry_point = entry_points.resolve(method)
+    if isinstance(entry_point, ResponseCache):
+        signature = inspect.signature(entry_point.method)
+    else:
+        signature = inspect.signature(entry_point)
+    try:
+        if isinstance(params, dict):
+            arguments = signature.bind(**params)
+        else:
+            arguments = signature.bind(*params)
+    except TypeError as e:
+        raise RpcError(INVALID_PARAMS, "Invalid params", str(e))
+    # Through the mapping, which converts arguments and results for JSON, and
+    # positional only, so that memoized methods can key on them
+    return getattr(entry_points, method)(*arguments.args)
+
+
+def _implementation_error(e):
+    return RpcError(
+        IMPLEMENTATION_ERROR,
+        "user implementation raised exception",
+        getattr(e, "message", str(e)),
+    )
+
+
+def _error_response(request_id, error):
+    body = {"code": error.code, "message": error.message}
+    if error.data is not None:
+        body["data"] = error.data
+    return {"jsonrpc": "2.0", "error": body, "id": request_id}
+
+
+def _settle(future, result=None, exception=None):
+    # The caller may have gone away in the meantime
+    if not future.done():
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+
+def _encode(response):
+    return json.dumps(response, separators=(",", ":")).encode("utf-8")
+
+
+async def _respond(writer, status, body, keep_alive):
+    head = [f"HTTP/1.1 {status} {_REASONS[status]}", f"Content-Length: {len(body)}"]
+    if body:
+        head.append("Content-Type: application/json")
+    if not keep_alive:
+        head.append("Connection: close")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--batch-window-ms", type=float, default=2.0)
+    parser.add_argument("--max-batch", type=int, default=512)
+    parser.add_argument("--max-pending", type=int, default=1024)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    async def serve():
+        server = JsonRpcServer(
+            host=args.host,
+            port=args.port,
+            batch_window_ms=args.batch_window_ms,
+            max_batch=args.max_batch,
+            max_pending=args.max_pending,
+            max_in_flight=args.max_in_flight,
+        )
+        async with server:
+            print(f"Serving JSON-RPC on http://{server.host}:{server.port}/")
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
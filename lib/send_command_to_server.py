@@ -1,8 +1,11 @@
 import sys
+from functools import partial
 from tdl.queue.queue_based_implementation_runner import QueueBasedImplementationRunnerBuilder
 from tdl.runner.challenge_session import ChallengeSession
 
-from entry_point_mapping import EntryPointMapping
+from entry_point_mapping import EntryPointMapping, PROCESS_METHODS, PURE_METHODS, SERIAL_METHODS
+from runner.concurrent_runner import ConcurrentImplementationRunnerBuilder
+from runner.credentials_config_file import read_from_config_file_with_default
 from runner.utils import Utils
 from runner.user_input_action import get_user_input
 
@@ -19,6 +22,9 @@ from runner.user_input_action import get_user_input
     To run your unit tests locally:
        PYTHONPATH=lib python -m pytest -q test/solution_tests/
  
+    To load test the runner offline, against a local broker:
+       PYTHONPATH=lib python -m runner.load_generator --methods sum,checkout --rate 2000
+ 
   ~~~~~~~~~~ The workflow ~~~~~~~~~~~~~
  
     By running this file you interact with a challenge server.
@@ -50,9 +56,28 @@ from runner.user_input_action import get_user_input
  
 """
 
-entry_point_mapping = EntryPointMapping()
+# Set tdl_memoize_pure_methods=true to answer repeated requests to the
+# methods in PURE_METHODS from a cache
+if read_from_config_file_with_default('tdl_memoize_pure_methods', False):
+    entry_point_factory = partial(EntryPointMapping, pure_methods=PURE_METHODS)
+else:
+    entry_point_factory = EntryPointMapping
+entry_point_mapping = entry_point_factory()
+
+# Requests are answered one at a time. Set tdl_concurrent_runner=true in
+# config/credentials.config (or TDL_CONCURRENT_RUNNER=true) to run them
+# concurrently instead, still answering in order: CPU-bound challenges in
+# worker processes with their own EntryPointMapping, the inventory methods
+# one at a time.
+if read_from_config_file_with_default('tdl_concurrent_runner', False):
+    runner_builder = ConcurrentImplementationRunnerBuilder()\
+        .with_max_in_flight(64)\
+        .with_process_pool(entry_point_factory, *PROCESS_METHODS)\
+        .with_serial_methods(*SERIAL_METHODS)
+else:
+    runner_builder = QueueBasedImplementationRunnerBuilder()
 
-runner = QueueBasedImplementationRunnerBuilder()\
+runner = runner_builder\
     .set_config(Utils.get_runner_config())\
     .with_solution_for('sum', entry_point_mapping.sum)\
     .with_solution_for('hello', entry_point_mapping.hello)\
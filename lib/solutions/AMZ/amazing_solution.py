@@ -1,5 +1,7 @@
+from solutions.AMZ.maze import Maze
+
 
 class AmazingSolution:
 
     def amazing_maze(self, rows, columns, maze_generation_options):
-        raise NotImplementedError()
+        return Maze.generate(rows, columns, maze_generation_options).render()
@@ -0,0 +1,75 @@
+from collections.abc import Mapping
+
+from solutions.CHK.pricing_plan import PricingPlan
+
+
+class Basket:
+    """A basket priced incrementally as items are scanned in and out.
+
+    Each scan re-prices only the component of the pricing plan holding that
+    SKU: its multibuy curve plus any free item or group offers it triggers,
+    receives or belongs to. total() always equals checkout() of the same
+    items. The basket keeps the plan it was created with.
+    """
+
+    __slots__ = ("_plan", "_solver_budget_ns", "_counts", "_costs", "_total")
+
+    def __init__(self, plan: PricingPlan, solver_budget_ns: int | None = None):
+        self._plan = plan
+        self._solver_budget_ns = solver_budget_ns
+        # Dense for single-character catalogs, sparse for tokenized ones,
+        # so starting a basket costs nothing per catalog SKU
+        self._counts = plan.new_counts()
+        # Cost per component, keyed by component index, or by ~ordinal for
+        # SKUs outside any component
+        self._costs: dict[int, int] = {}
+        self._total = 0
+
+    def add(self, sku: str, quantity: int = 1) -> int:
+        """Scan quantity items of sku and return the new total."""
+        if quantity < 0:
+            raise ValueError("Quantity must not be negative")
+        return self._update(sku, quantity)
+
+    def remove(self, sku: str, quantity: int = 1) -> int:
+        """Unscan quantity items of sku and return the new total."""
+        if quantity < 0:
+            raise ValueError("Quantity must not be negative")
+        return self._update(sku, -quantity)
+
+    def total(self) -> int:
+        return self._total
+
+    def count(self, sku: str) -> int:
+        ordinal = self._ordinal(sku)
+        if isinstance(self._counts, Mapping):
+            return self._counts.get(ordinal, 0)
+        return self._counts[ordinal]
+
+    def _ordinal(self, sku: str) -> int:
+        ordinal = self._plan.ordinals.get(sku)
+        if ordinal is None:
+            raise ValueError(f"Invalid SKU: {sku}")
+        return ordinal
+
+    def _update(self, sku: str, change: int) -> int:
+        ordinal = self._ordinal(sku)
+        num_items = self._counts[ordinal] + change
+        if num_items < 0:
+            raise ValueError(
+                f"Cannot remove {-change} {sku}, basket has {num_items - change}"
+            )
+        self._counts[ordinal] = num_items
+
+        component = self._plan.sku_components[ordinal]
+        if component < 0:
+            key = ~ordinal
+            cost = self._plan.sku_cost(ordinal, num_items)
+        else:
+            key = component
+            cost = self._plan.price_component(
+                component, self._counts, self._solver_budget_ns
+            )
+        self._total += cost - self._costs.get(key, 0)
+        self._costs[key] = cost
+        return self._total
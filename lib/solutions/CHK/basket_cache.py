@@ -0,0 +1,111 @@
+import sys
+from collections import OrderedDict
+from collections.abc import Hashable, Mapping, Sequence
+from threading import Lock
+from typing import NamedTuple
+
+# Rough per-entry cost of the OrderedDict slot, links and the cached total
+ENTRY_OVERHEAD_BYTES = 100
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    entries: int
+    size_bytes: int
+
+
+def basket_signature(counts: Sequence[int] | Mapping[int, int]) -> tuple:
+    """The basket cache key: (ordinal, quantity, ordinal, quantity, ...).
+
+    Only SKUs in the basket appear, in ordinal order, so the key grows with
+    the basket rather than the catalog, and dense counts and sparse
+    {ordinal: quantity} maps of the same basket share it.
+    """
+    if isinstance(counts, Mapping):
+        present = sorted(item for item in counts.items() if item[1])
+    else:
+        present = [item for item in enumerate(counts) if item[1]]
+    return tuple(value for item in present for value in item)
+
+
+class BasketCache:
+    """Bounded LRU cache of basket totals keyed by a canonical basket signature.
+
+    Totals are only valid for the pricing plan they were computed with: the
+    cache remembers that plan and empties itself as soon as it is asked about
+    a different one, so price or offer changes invalidate it automatically.
+    """
+
+    def __init__(self, max_entries: int = 4096, max_bytes: int = 4 * 1024 * 1024):
+        if max_entries < 1 or max_bytes < 1:
+            raise ValueError("Cache bounds must be positive")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, tuple[int, int]] = OrderedDict()
+        self._plan: object | None = None
+        self._size_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._lock = Lock()
+
+    def get(self, plan: object, key: Hashable) -> int | None:
+        """Return the cached total for the basket, or None on a miss."""
+        with self._lock:
+            if plan is not self._plan:
+                self._reset_for(plan)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, plan: object, key: Hashable, total: int) -> None:
+        """Cache the total of a basket priced with the given plan."""
+        size = sys.getsizeof(key) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if plan is not self._plan:
+                self._reset_for(plan)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size_bytes -= previous[1]
+            self._entries[key] = (total, size)
+            self._size_bytes += size
+            while (
+                len(self._entries) > self.max_entries
+                or self._size_bytes > self.max_bytes
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size_bytes -= evicted_size
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+                entries=len(self._entries),
+                size_bytes=self._size_bytes,
+            )
+
+    def _reset_for(self, plan: object) -> None:
+        if self._plan is not None:
+            self._invalidations += 1
+        self._plan = plan
+        self._entries.clear()
+        self._size_bytes = 0
@@ -0,0 +1,294 @@
+from collections.abc import Iterable, Iterator
+from time import perf_counter_ns
+
+from solutions.CHK.checkout_metrics import MetricsRecorder
+from solutions.CHK.pricing_plan import PricingPlan
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+
+# Cells of the basket x SKU count matrix, and characters of the baskets,
+# per chunk: each chunk's int64 arrays stay within 8 x CHUNK_CELLS bytes
+# however many baskets or SKUs there are
+CHUNK_CELLS = 1 << 22
+
+
+def price_baskets(
+    plan: PricingPlan,
+    baskets: Iterable[str],
+    solver_budget_ns: int | None = None,
+    recorder: MetricsRecorder | None = None,
+) -> list[int]:
+    """Price many SKU strings at once, -1 for baskets with invalid SKUs.
+
+    Baskets of single-character SKUs are counted into a basket x SKU matrix,
+    a chunk at a time, and every offer stage runs as a whole-matrix integer
+    operation. Without numpy, or for multi-character SKU codes, whose
+    catalogs can be too large for a column per SKU, each basket goes through
+    the scalar pipeline and its sparse counts instead. With a solver budget,
+    baskets holding group offer SKUs are re-priced one by one by the offer
+    solver. With a recorder, every basket is recorded in its metrics; those
+    priced as a matrix with their share of the chunk's stage timings.
+    """
+    table = None if np is None else _byte_lookup_table(plan)
+    if table is None:
+        if recorder is None:
+            return [_price_one(plan, skus, solver_budget_ns) for skus in baskets]
+        totals = []
+        for skus in baskets:
+            totals.append(_price_one_measured(plan, skus, solver_budget_ns, recorder))
+            recorder.flush_if_full()
+        return totals
+
+    group_skus = sorted({sku for members, _, _ in plan.group_offers for sku in members})
+    if solver_budget_ns is None:
+        group_skus = []
+    totals: list[int] = []
+    for chunk in _chunks(baskets, len(plan.skus) + 1):
+        if recorder is None:
+            row_totals = _price_chunk(plan, table, chunk, solver_budget_ns, group_skus)
+        else:
+            row_totals = _price_chunk_measured(
+                plan, table, chunk, solver_budget_ns, group_skus, recorder
+            )
+        totals.extend(row_totals.tolist())
+    return totals
+
+
+def _price_chunk(
+    plan: PricingPlan,
+    table: "np.ndarray",
+    chunk: list[str],
+    solver_budget_ns: int | None,
+    group_skus: list[int],
+) -> "np.ndarray":
+    counts, invalid = _count_matrix(plan, table, chunk)
+    if group_skus:
+        solver_rows = np.flatnonzero(counts[:, group_skus].any(axis=1) & ~invalid)
+        solver_counts = counts[solver_rows].tolist()
+    row_totals = _price_matrix(plan, counts)
+    if group_skus:
+        for row, row_counts in zip(solver_rows.tolist(), solver_counts):
+            row_totals[row] = plan.price(row_counts, solver_budget_ns)
+    row_totals[invalid] = -1
+    return row_totals
+
+
+def _price_chunk_measured(
+    plan: PricingPlan,
+    table: "np.ndarray",
+    chunk: list[str],
+    solver_budget_ns: int | None,
+    group_skus: list[int],
+    recorder: MetricsRecorder,
+) -> "np.ndarray":
+    # _price_chunk() one stage at a time, timing each and counting the items
+    # it takes out of the matrix
+    start = perf_counter_ns()
+    counts, invalid = _count_matrix(plan, table, chunk)
+    parsed = perf_counter_ns()
+    valid = ~invalid
+    solver_rows = np.flatnonzero(
+        counts[:, group_skus].any(axis=1) & valid if group_skus else []
+    )
+    solver_counts = counts[solver_rows].tolist()
+    num_items = counts.sum(axis=1)
+
+    _apply_matrix_free_items(plan, counts)
+    freed = perf_counter_ns()
+    after_free = counts.sum(axis=1)
+    row_totals = _apply_matrix_groups(plan, counts)
+    grouped = perf_counter_ns()
+    after_groups = counts.sum(axis=1)
+    row_totals += _matrix_multibuy_cost(plan, counts)
+    priced = perf_counter_ns()
+
+    # The solver re-prices its rows instead of the greedy passes: its time
+    # counts as the group stage and its items replace theirs
+    greedy = valid.copy()
+    greedy[solver_rows] = False
+    free_items = int((num_items - after_free)[greedy].sum())
+    group_items = int((after_free - after_groups)[greedy].sum())
+    for row, row_counts in zip(solver_rows.tolist(), solver_counts):
+        row_items = sum(row_counts)
+        row_free_items, total_cost = plan.resolve_offers(row_counts, solver_budget_ns)
+        free_items += row_free_items
+        group_items += row_items - row_free_items - sum(row_counts)
+        row_totals[row] = total_cost + plan.multibuy_cost(row_counts)
+    solved = perf_counter_ns()
+
+    row_totals[invalid] = -1
+    recorder.record_batch(
+        (
+            parsed - start,
+            freed - parsed,
+            grouped - freed + solved - priced,
+            priced - grouped,
+        ),
+        num_items[valid].tolist(),
+        int(invalid.sum()),
+        free_items,
+        group_items,
+    )
+    return row_totals
+
+
+def _price_one(plan: PricingPlan, skus: str, solver_budget_ns: int | None) -> int:
+    try:
+        counts = plan.count(skus)
+    except ValueError:
+        return -1
+    return plan.price(counts, solver_budget_ns)
+
+
+def _price_one_measured(
+    plan: PricingPlan,
+    skus: str,
+    solver_budget_ns: int | None,
+    recorder: MetricsRecorder,
+) -> int:
+    # _price_one(), timing every stage
+    stages = recorder.stages
+    start = perf_counter_ns()
+    try:
+        counts = plan.count(skus)
+    except ValueError:
+        parse_ns = perf_counter_ns() - start
+        stages[0].append(parse_ns)
+        recorder.invalid.append(parse_ns)
+        return -1
+    parsed = perf_counter_ns()
+    num_items = sum(counts.values() if isinstance(counts, dict) else counts)
+    if solver_budget_ns is None:
+        free_items = plan.apply_free_item_offers(counts)
+        freed = perf_counter_ns()
+        total_cost = plan.apply_group_offers(counts)
+    else:
+        freed = parsed
+        free_items, total_cost = plan.resolve_offers(counts, solver_budget_ns)
+    grouped = perf_counter_ns()
+    group_items = (
+        num_items
+        - free_items
+        - sum(counts.values() if isinstance(counts, dict) else counts)
+    )
+    total_cost += plan.multibuy_cost(counts)
+    priced = perf_counter_ns()
+    stages[0].append(parsed - start)
+    stages[1].append(freed - parsed)
+    stages[2].append(grouped - freed)
+    stages[3].append(priced - grouped)
+    recorder.priced.extend((priced - start, num_items, free_items, group_items))
+    return total_cost
+
+
+def _chunks(baskets: Iterable[str], width: int) -> Iterator[list[str]]:
+    """Group baskets into chunks of at most CHUNK_CELLS cells and characters.
+
+    A basket longer than that makes a chunk of its own.
+    """
+    max_rows = max(1, CHUNK_CELLS // width)
+    chunk: list[str] = []
+    num_chars = 0
+    for skus in baskets:
+        if chunk and (len(chunk) == max_rows or num_chars + len(skus) > CHUNK_CELLS):
+            yield chunk
+            chunk = []
+            num_chars = 0
+        chunk.append(skus)
+        num_chars += len(skus)
+    if chunk:
+        yield chunk
+
+
+def _byte_lookup_table(plan: PricingPlan) -> "np.ndarray | None":
+    """Map each byte to its SKU ordinal, or to an extra 'invalid' column.
+
+    Returns None when some SKU is not a single ASCII character.
+    """
+    num_skus = len(plan.skus)
+    table = np.full(256, num_skus, dtype=np.int64)
+    for sku, ordinal in plan.ordinals.items():
+        if len(sku) != 1 or not sku.isascii():
+            return None
+        table[ord(sku)] = ordinal
+    return table
+
+
+def _count_matrix(
+    plan: PricingPlan, table: "np.ndarray", baskets: list[str]
+) -> tuple["np.ndarray", "np.ndarray"]:
+    """Count baskets into a matrix, returning it with a mask of invalid rows."""
+    num_rows = len(baskets)
+    num_skus = len(plan.skus)
+
+    # Non-ASCII characters are replaced by a byte that is never a valid SKU
+    # once mapped, but flag those rows explicitly in case '?' is a SKU.
+    non_ascii = np.fromiter(
+        (not skus.isascii() for skus in baskets), dtype=bool, count=num_rows
+    )
+    data = "".join(baskets).encode("ascii", errors="replace")
+    lengths = np.fromiter(map(len, baskets), dtype=np.int64, count=num_rows)
+    rows = np.repeat(np.arange(num_rows, dtype=np.int64), lengths)
+    codes = table[np.frombuffer(data, dtype=np.uint8)]
+
+    width = num_skus + 1
+    counts = np.bincount(rows * width + codes, minlength=num_rows * width)
+    counts = counts.reshape(num_rows, width)
+    invalid = (counts[:, num_skus] > 0) | non_ascii
+    return counts[:, :num_skus], invalid
+
+
+def _price_matrix(plan: PricingPlan, counts: "np.ndarray") -> "np.ndarray":
+    """Run the offer pipeline over every row of the count matrix, in place."""
+    _apply_matrix_free_items(plan, counts)
+    totals = _apply_matrix_groups(plan, counts)
+    return totals + _matrix_multibuy_cost(plan, counts)
+
+
+def _apply_matrix_free_items(plan: PricingPlan, counts: "np.ndarray") -> None:
+    for trigger, quantity, gift, gift_quantity in plan.free_item_offers:
+        free_items = (counts[:, trigger] // quantity) * gift_quantity
+        counts[:, gift] = np.maximum(0, counts[:, gift] - free_items)
+
+
+def _apply_matrix_groups(plan: PricingPlan, counts: "np.ndarray") -> "np.ndarray":
+    # Remove the most expensive members first by clamping the running total
+    # of members to the number of items to remove
+    totals = np.zeros(counts.shape[0], dtype=np.int64)
+    for members, quantity, price in plan.group_offers:
+        member_counts = counts[:, members]
+        num_offers = member_counts.sum(axis=1) // quantity
+        removed_so_far = np.minimum(
+            np.cumsum(member_counts, axis=1), (num_offers * quantity)[:, None]
+        )
+        removed = np.diff(removed_so_far, axis=1, prepend=0)
+        counts[:, members] = member_counts - removed
+        totals += num_offers * price
+    return totals
+
+
+def _matrix_multibuy_cost(plan: PricingPlan, counts: "np.ndarray") -> "np.ndarray":
+    # Multibuy offers along each SKU's cost curve, for the SKUs left in some
+    # basket of the chunk, then base prices
+    totals = np.zeros(counts.shape[0], dtype=np.int64)
+    base_prices = np.asarray(plan.base_prices, dtype=np.int64)
+    for ordinal in np.flatnonzero(counts.any(axis=0)).tolist():
+        if plan.multibuy_tiers[ordinal]:
+            curve = plan.cost_curves[ordinal]
+            table_size = len(curve.costs)
+            num_items = counts[:, ordinal]
+            repeats = np.where(
+                num_items < table_size,
+                0,
+                (num_items - table_size) // curve.period + 1,
+            )
+            totals += np.asarray(curve.costs, dtype=np.int64)[
+                num_items - repeats * curve.period
+            ]
+            totals += repeats * curve.period_price
+            counts[:, ordinal] = 0
+    totals += counts @ base_prices
+    return totals
@@ -0,0 +1,83 @@
+import codecs
+import re
+from collections.abc import Iterable, Iterator, MutableMapping, MutableSequence
+
+from solutions.CHK.pricing_plan import Counts, PricingPlan
+from solutions.CHK.sku_parser import SkuInput
+from solutions.CHK.sku_tokenizer import SkuTokenizer
+
+_WHITESPACE = " \t\r\n\f\v"
+_WHITESPACE_BYTES = _WHITESPACE.encode("ascii")
+_STRIP_WHITESPACE = str.maketrans("", "", _WHITESPACE)
+
+_RUN = re.compile(r"\S+")
+
+
+def count_stream(plan: PricingPlan, chunks: Iterable[SkuInput]) -> Counts:
+    """Count a basket delivered as a stream of chunks.
+
+    Chunks may be str or bytes, e.g. a file object or
+    iter(partial(sock.recv, 65536), b""). Whitespace between or inside
+    chunks is ignored. Only one chunk and the count vector are held in
+    memory, however long the basket is. The counts come in a buffer from
+    plan.new_counts().
+
+    Multi-character SKU codes may straddle chunks: a token running on into
+    the next chunk is split as it arrives, so only its last few characters
+    are carried over, however long it runs without a delimiter.
+    """
+    counts = plan.new_counts()
+    if isinstance(plan.parser, SkuTokenizer):
+        _count_tokens(plan.parser, counts, chunks)
+        return counts
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.translate(_STRIP_WHITESPACE)
+        else:
+            chunk = bytes(chunk).translate(None, _WHITESPACE_BYTES)
+        _add_counts(counts, plan.count(chunk))
+    return counts
+
+
+def count_run_length(plan: PricingPlan, encoded: str) -> Counts:
+    """Count a run-length encoded basket such as "A*1000000 B*3 C".
+
+    Runs are separated by whitespace; a run without "*N" counts once.
+    """
+    counts = plan.new_counts()
+    ordinals = plan.ordinals
+    for match in _RUN.finditer(encoded):
+        run = match.group()
+        sku, star, num_items = run.rpartition("*")
+        if not star:
+            sku, num_items = run, "1"
+        ordinal = ordinals.get(sku)
+        if ordinal is None:
+            raise ValueError(f"Invalid SKU {sku!r} at position {match.start()}")
+        if not (num_items.isascii() and num_items.isdigit()):
+            raise ValueError(
+                f"Invalid quantity {num_items!r} at position {match.start()}"
+            )
+        counts[ordinal] += int(num_items)
+    return counts
+
+
+def _count_tokens(
+    tokenizer: SkuTokenizer,
+    counts: MutableMapping[int, int],
+    chunks: Iterable[SkuInput],
+) -> None:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def texts() -> Iterator[str]:
+        for chunk in chunks:
+            yield chunk if isinstance(chunk, str) else decoder.decode(bytes(chunk))
+        yield decoder.decode(b"", final=True)
+
+    tokenizer.count_chunks(texts(), counts)
+
+
+def _add_counts(totals: MutableSequence[int], counts: MutableSequence[int]) -> None:
+    for ordinal, num_items in enumerate(counts):
+        if num_items:
+            totals[ordinal] += num_items
@@ -0,0 +1,177 @@
+import csv
+import json
+import os
+import threading
+from collections.abc import Iterable
+from typing import NamedTuple
+
+from solutions.CHK.checkout_solution import (
+    CheckoutSolution,
+    FreeItemOffer,
+    GroupDiscountOffer,
+    MultiBuyOffer,
+)
+from solutions.CHK.pricing_plan import PricingPlan
+
+
+class CatalogSnapshot(NamedTuple):
+    """A price table and its offers, already compiled into a pricing plan."""
+
+    base_prices: dict[str, int]
+    multibuy_offers: dict[str, list[MultiBuyOffer]]
+    free_item_offers: list[FreeItemOffer]
+    group_discount_offers: list[GroupDiscountOffer]
+    pricing_plan: PricingPlan
+
+    def install(self, solution: CheckoutSolution) -> None:
+        solution.apply_pricing(
+            self.base_prices,
+            self.multibuy_offers,
+            self.free_item_offers,
+            self.group_discount_offers,
+            pricing_plan=self.pricing_plan,
+        )
+
+
+def load_catalog(path: str | os.PathLike) -> CatalogSnapshot:
+    """Read a JSON or CSV catalog and compile it.
+
+    JSON catalogs hold "base_prices", "multibuy_offers", "free_item_offers"
+    and "group_discount_offers" shaped like the CheckoutSolution arguments.
+
+    CSV catalogs have one row per price or offer, with the columns
+    type,sku,price,quantity,gift_sku,gift_quantity,skus where type is one of
+    price, multibuy, free_item or group, and skus lists group members most
+    expensive first, separated by spaces.
+    """
+    with open(path, newline="") as catalog_file:
+        if os.fspath(path).lower().endswith(".csv"):
+            config = _read_csv(catalog_file)
+        else:
+            config = json.load(catalog_file)
+
+    base_prices = {sku: int(price) for sku, price in config["base_prices"].items()}
+    multibuy_offers = {
+        sku: [MultiBuyOffer.model_validate(offer) for offer in offers]
+        for sku, offers in config.get("multibuy_offers", {}).items()
+    }
+    free_item_offers = [
+        FreeItemOffer.model_validate(offer)
+        for offer in config.get("free_item_offers", [])
+    ]
+    group_discount_offers = [
+        GroupDiscountOffer.model_validate(offer)
+        for offer in config.get("group_discount_offers", [])
+    ]
+    return CatalogSnapshot(
+        base_prices,
+        multibuy_offers,
+        free_item_offers,
+        group_discount_offers,
+        PricingPlan.compile(
+            base_prices, multibuy_offers, free_item_offers, group_discount_offers
+        ),
+    )
+
+
+def _read_csv(rows: Iterable[str]) -> dict:
+    config: dict = {
+        "base_prices": {},
+        "multibuy_offers": {},
+        "free_item_offers": [],
+        "group_discount_offers": [],
+    }
+    for line, row in enumerate(csv.DictReader(rows), start=2):
+        kind = row["type"]
+        if kind == "price":
+            config["base_prices"][row["sku"]] = row["price"]
+        elif kind == "multibuy":
+            config["multibuy_offers"].setdefault(row["sku"], []).append(
+                {"quantity": row["quantity"], "price": row["price"]}
+            )
+        elif kind == "free_item":
+            config["free_item_offers"].append(
+                {
+                    "sku": row["sku"],
+                    "quantity": row["quantity"],
+                    "gift_sku": row["gift_sku"],
+                    "gift_quantity": row["gift_quantity"],
+                }
+            )
+        elif kind == "group":
+            config["group_discount_offers"].append(
+                {
+                    "skus": row["skus"].split(),
+                    "quantity": row["quantity"],
+                    "price": row["price"],
+                }
+            )
+        else:
+            raise ValueError(f"Unknown catalog row type {kind!r} on line {line}")
+    return config
+
+
+class CatalogWatcher:
+    """Reloads a catalog file into a CheckoutSolution whenever it changes.
+
+    Each reload reads and compiles the whole catalog before swapping the new
+    plan in with a single assignment, so checkouts already running finish on
+    the old plan and new ones see the new one, without any lock on the
+    checkout path. A catalog that fails to load leaves the current plan in
+    place and is kept in last_error.
+    """
+
+    def __init__(self, path: str | os.PathLike, solution: CheckoutSolution):
+        self.path = path
+        self.solution = solution
+        self.last_error: Exception | None = None
+        self._signature: tuple[int, int] | None = None
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.reload()
+
+    def reload(self) -> None:
+        """Load and install the catalog, whether or not it changed."""
+        self._signature = self._stat()
+        load_catalog(self.path).install(self.solution)
+        self.last_error = None
+
+    def poll(self) -> bool:
+        """Reload the catalog if its mtime or size changed; True if reloaded.
+
+        A version that fails to load is not retried until the file changes.
+        """
+        try:
+            if self._stat() == self._signature:
+                return False
+            self.reload()
+        # Whatever a malformed catalog raises, a list where a dict belongs
+        # included, must not end the thread polling it
+        except Exception as e:
+            self.last_error = e
+            return False
+        return True
+
+    def start(self, interval: float = 1.0) -> None:
+        """Poll the catalog from a background thread every interval seconds."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name="catalog-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval: float) -> None:
+        while not self._stopped.wait(interval):
+            self.poll()
+
+    def _stat(self) -> tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,391 @@
+import threading
+from collections.abc import Sequence
+from typing import NamedTuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+
+STAGES = ("parse", "free_items", "group_offers", "multibuy", "total")
+
+# Histograms count into one bucket per power of two: bucket k holds the
+# values v with 2**(k-1) < v <= 2**k, found as (v - 1).bit_length(), and
+# bucket 0 holds 0 as well as 1, hence max(v, 1)
+_NUM_BUCKETS = 65
+
+# Exported latency buckets run from 2**10 ns (about 1us) to 2**30 ns (about
+# 1s), basket size buckets from 1 to 2**20 items
+LATENCY_EXPONENTS = range(10, 31)
+BASKET_SIZE_EXPONENTS = range(0, 21)
+
+# Checkouts per thread between two timed stage by stage; the others take
+# two clock readings instead of five
+DEFAULT_SAMPLE_INTERVAL = 16
+
+# Pending values per thread bucketed in one pass, and the fewest worth
+# bucketing with numpy
+FLUSH_SIZE = 8192
+_MIN_VECTOR_SIZE = 64
+
+
+class HistogramSnapshot(NamedTuple):
+    # Upper bound of every bucket but the last, which has none
+    bounds: tuple[int, ...]
+    # Observations per bucket, not cumulative
+    counts: tuple[int, ...]
+    total: int
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+class MetricsSnapshot(NamedTuple):
+    # Stage name -> durations in nanoseconds
+    stages: dict[str, HistogramSnapshot]
+    # Items per valid basket
+    basket_sizes: HistogramSnapshot
+    priced: int
+    invalid: int
+    cache_hits: int
+    # Items given away by free item offers
+    free_items: int
+    # Items sold in group offers
+    group_items: int
+
+
+class MetricsRecorder:
+    """One thread's share of the metrics, updated without any lock.
+
+    Each checkout extends the pending lists with its raw values, which are
+    bucketed a batch at a time, every FLUSH_SIZE values or so, rather than
+    one checkout at a time. Get one from CheckoutMetrics.recorder() and keep
+    it: looking it up takes a thread-local access.
+    """
+
+    __slots__ = (
+        "buckets",
+        "totals",
+        "counters",
+        "priced",
+        "cache_hits",
+        "invalid",
+        "stages",
+        "countdown",
+        "sample_interval",
+        "lock",
+    )
+
+    def __init__(self, sample_interval: int):
+        # One histogram per stage, then one for basket sizes
+        self.buckets = [[0] * _NUM_BUCKETS for _ in range(len(STAGES) + 1)]
+        self.totals = [0] * (len(STAGES) + 1)
+        # priced, invalid, cache hits, free items, group items
+        self.counters = [0] * 5
+        # Pending total ns, items, free items, group items of each priced
+        # basket, flattened
+        self.priced: list[int] = []
+        # Pending total ns, items of each basket priced from the basket
+        # cache, flattened
+        self.cache_hits: list[int] = []
+        # Pending total ns of each invalid basket
+        self.invalid: list[int] = []
+        # Pending ns of the sampled checkouts, per stage but the total
+        self.stages: list[list[int]] = [[] for _ in STAGES[:-1]]
+        # Checkouts left until the next sampled one, which is the first
+        self.countdown = 1
+        self.sample_interval = sample_interval
+        # Taken by flushes, snapshots and resets only
+        self.lock = threading.Lock()
+
+    def sample(self) -> None:
+        """Start the next sampling interval, flushing if enough is pending."""
+        self.countdown = self.sample_interval
+        self.flush_if_full()
+
+    def flush_if_full(self) -> None:
+        """Bucket the pending records if there are enough of them."""
+        if len(self.priced) + len(self.cache_hits) + len(self.invalid) >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        """Bucket the pending records."""
+        with self.lock:
+            pending = self._take_pending()
+            _bucket_records(self.buckets, self.totals, self.counters, *pending)
+
+    def record_batch(
+        self,
+        stage_ns: Sequence[int],
+        num_items: Sequence[int],
+        invalid: int,
+        free_items: int,
+        group_items: int,
+    ) -> None:
+        """Record a batch of baskets priced together.
+
+        stage_ns holds the batch's parse, free items, group offers and
+        multibuy time and num_items the items in each valid basket. Every
+        basket is recorded with its share of the batch's time.
+        """
+        num_valid = len(num_items)
+        num_baskets = num_valid + invalid
+        if not num_baskets:
+            return
+        parse_ns = stage_ns[0] // num_baskets
+        priced_ns = [ns // num_valid for ns in stage_ns[1:]] if num_valid else []
+        with self.lock:
+            buckets = self.buckets
+            totals = self.totals
+            buckets[0][_bucket(parse_ns)] += num_baskets
+            totals[0] += parse_ns * num_baskets
+            for stage, ns in enumerate(priced_ns, 1):
+                buckets[stage][_bucket(ns)] += num_valid
+                totals[stage] += ns * num_valid
+            if num_valid:
+                total_ns = parse_ns + sum(priced_ns)
+                buckets[4][_bucket(total_ns)] += num_valid
+                totals[4] += total_ns * num_valid
+            if invalid:
+                buckets[4][_bucket(parse_ns)] += invalid
+                totals[4] += parse_ns * invalid
+            totals[5] += _count_buckets(num_items, buckets[5])
+            counters = self.counters
+            counters[0] += num_valid
+            counters[1] += invalid
+            counters[3] += free_items
+            counters[4] += group_items
+
+    def _take_pending(self) -> tuple:
+        pending = (self.priced, self.cache_hits, self.invalid, self.stages)
+        self.priced = []
+        self.cache_hits = []
+        self.invalid = []
+        self.stages = [[] for _ in STAGES[:-1]]
+        return pending
+
+    def _copy(self) -> tuple[list[list[int]], list[int], list[int]]:
+        # The histograms and counters with the pending records bucketed in
+        with self.lock:
+            buckets = [list(stage_buckets) for stage_buckets in self.buckets]
+            totals = list(self.totals)
+            counters = list(self.counters)
+            pending = (
+                list(self.priced),
+                list(self.cache_hits),
+                list(self.invalid),
+                [list(values) for values in self.stages],
+            )
+        _bucket_records(buckets, totals, counters, *pending)
+        return buckets, totals, counters
+
+    def _clear(self) -> None:
+        with self.lock:
+            for buckets in self.buckets:
+                buckets[:] = [0] * _NUM_BUCKETS
+            self.totals[:] = [0] * len(self.totals)
+            self.counters[:] = [0] * len(self.counters)
+            self._take_pending()
+
+
+class CheckoutMetrics:
+    """Per-stage timings and basket statistics of instrumented checkouts.
+
+    Each thread records into its own fixed-size recorder, so recording a
+    checkout takes no lock. snapshot() merges the recorders; taken while
+    checkouts run it may be off by the checkouts in flight. checkout() times
+    the stages of one basket in every sample_interval on each thread and
+    only the total of the others; the other checkout methods time every
+    stage. Basket sizes and counters cover every basket. Pass an instance to
+    CheckoutSolution to turn instrumentation on.
+    """
+
+    def __init__(self, sample_interval: int = DEFAULT_SAMPLE_INTERVAL):
+        if sample_interval < 1:
+            raise ValueError("sample_interval must be at least 1")
+        self.sample_interval = sample_interval
+        self._local = threading.local()
+        self._recorders: list[MetricsRecorder] = []
+        self._lock = threading.Lock()
+
+    def recorder(self) -> MetricsRecorder:
+        """The calling thread's recorder, for callers to keep and reuse."""
+        try:
+            return self._local.recorder
+        except AttributeError:
+            recorder = self._local.recorder = MetricsRecorder(self.sample_interval)
+            with self._lock:
+                self._recorders.append(recorder)
+            return recorder
+
+    def snapshot(self) -> MetricsSnapshot:
+        with self._lock:
+            recorders = list(self._recorders)
+        merged_buckets = [[0] * _NUM_BUCKETS for _ in range(len(STAGES) + 1)]
+        merged_totals = [0] * (len(STAGES) + 1)
+        merged_counters = [0] * 5
+        for recorder in recorders:
+            buckets, totals, counters = recorder._copy()
+            for total_buckets, stage_buckets in zip(merged_buckets, buckets):
+                for index, count in enumerate(stage_buckets):
+                    total_buckets[index] += count
+            for index, total in enumerate(totals):
+                merged_totals[index] += total
+            for index, count in enumerate(counters):
+                merged_counters[index] += count
+
+        priced, invalid, cache_hits, free_items, group_items = merged_counters
+        return MetricsSnapshot(
+            stages={
+                stage: _histogram(
+                    merged_buckets[index], merged_totals[index], LATENCY_EXPONENTS
+                )
+                for index, stage in enumerate(STAGES)
+            },
+            basket_sizes=_histogram(
+                merged_buckets[-1], merged_totals[-1], BASKET_SIZE_EXPONENTS
+            ),
+            priced=priced,
+            invalid=invalid,
+            cache_hits=cache_hits,
+            free_items=free_items,
+            group_items=group_items,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            recorders = list(self._recorders)
+        for recorder in recorders:
+            recorder._clear()
+
+
+def _bucket(value: int) -> int:
+    return (max(value, 1) - 1).bit_length()
+
+
+def _count_buckets(values: Sequence[int], buckets: list[int]) -> int:
+    """Add each value to its power-of-two bucket and return their sum."""
+    if np is None or len(values) < _MIN_VECTOR_SIZE:
+        total = 0
+        for value in values:
+            buckets[(max(value, 1) - 1).bit_length()] += 1
+            total += value
+        return total
+    array = np.fromiter(values, dtype=np.int64, count=len(values))
+    # frexp's exponent is the bit length of a positive integer, exact for
+    # values below 2**53: about 104 days in nanoseconds
+    _, exponents = np.frexp(np.maximum(array, 1) - 1)
+    counts = np.bincount(exponents, minlength=_NUM_BUCKETS)
+    for index in np.flatnonzero(counts).tolist():
+        buckets[index] += int(counts[index])
+    return int(array.sum())
+
+
+def _bucket_records(
+    buckets: list[list[int]],
+    totals: list[int],
+    counters: list[int],
+    priced: list[int],
+    cache_hits: list[int],
+    invalid: list[int],
+    stages: list[list[int]],
+) -> None:
+    # Bucket the pending values, a column at a time
+    for stage, values in enumerate(stages):
+        totals[stage] += _count_buckets(values, buckets[stage])
+    if priced:
+        totals[4] += _count_buckets(priced[0::4], buckets[4])
+        totals[5] += _count_buckets(priced[1::4], buckets[5])
+        counters[0] += len(priced) // 4
+        counters[3] += sum(priced[2::4])
+        counters[4] += sum(priced[3::4])
+    if cache_hits:
+        totals[4] += _count_buckets(cache_hits[0::2], buckets[4])
+        totals[5] += _count_buckets(cache_hits[1::2], buckets[5])
+        counters[0] += len(cache_hits) // 2
+        counters[2] += len(cache_hits) // 2
+    if invalid:
+        totals[4] += _count_buckets(invalid, buckets[4])
+        counters[1] += len(invalid)
+
+
+def _histogram(
+    buckets: Sequence[int], total: int, exponents: range
+) -> HistogramSnapshot:
+    # Fold the power-of-two buckets outside the exported range into its ends
+    first, last = exponents.start, exponents.stop - 1
+    counts = [sum(buckets[: first + 1]), *buckets[first + 1 : last + 1]]
+    counts.append(sum(buckets[last + 1 :]))
+    return HistogramSnapshot(
+        tuple(2**exponent for exponent in exponents), tuple(counts), total
+    )
+
+
+def to_prometheus(snapshot: MetricsSnapshot, prefix: str = "checkout") -> str:
+    """Render a metrics snapshot in the Prometheus text exposition format."""
+    lines: list[str] = []
+
+    def histogram(
+        name: str,
+        help_text: str,
+        series: Sequence[tuple[str, HistogramSnapshot]],
+        divisor: int,
+    ) -> None:
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} histogram")
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(values.bounds + (None,), values.counts):
+                cumulative += count
+                le = "+Inf" if bound is None else _number(bound / divisor)
+                lines.append(
+                    f'{prefix}_{name}_bucket{{{labels}le="{le}"}} {cumulative}'
+                )
+            braces = f"{{{labels.rstrip(',')}}}" if labels else ""
+            total = _number(values.total / divisor)
+            lines.append(f"{prefix}_{name}_sum{braces} {total}")
+            lines.append(f"{prefix}_{name}_count{braces} {cumulative}")
+
+    def counter(name: str, help_text: str, series: Sequence[tuple[str, int]]) -> None:
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} counter")
+        for labels, value in series:
+            braces = f"{{{labels}}}" if labels else ""
+            lines.append(f"{prefix}_{name}{braces} {value}")
+
+    histogram(
+        "stage_duration_seconds",
+        "Time spent in each checkout stage.",
+        [(f'stage="{stage}",', values) for stage, values in snapshot.stages.items()],
+        1_000_000_000,
+    )
+    histogram(
+        "basket_items",
+        "Number of items in each valid basket.",
+        [("", snapshot.basket_sizes)],
+        1,
+    )
+    counter(
+        "baskets_total",
+        "Baskets checked out, by result.",
+        [('result="priced"', snapshot.priced), ('result="invalid"', snapshot.invalid)],
+    )
+    counter(
+        "cache_hits_total",
+        "Baskets priced from the basket cache.",
+        [("", snapshot.cache_hits)],
+    )
+    counter(
+        "offer_items_total",
+        "Items given away or bundled by offers, by offer type.",
+        [
+            ('offer="free_item"', snapshot.free_items),
+            ('offer="group"', snapshot.group_items),
+        ],
+    )
+    return "\n".join(lines) + "\n"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
@@ -1,6 +1,23 @@
+import threading
 from collections import Counter
-
-from pydantic import BaseModel, field_validator
+from collections.abc import Iterable
+from functools import lru_cache
+from operator import attrgetter
+from time import perf_counter_ns
+from typing import NamedTuple
+
+from pydantic import BaseModel
+
+from solutions.CHK.basket import Basket
+from solutions.CHK.basket_cache import BasketCache, basket_signature
+from solutions.CHK.batch_pricing import price_baskets
+from solutions.CHK.bulk_input import count_run_length, count_stream
+from solutions.CHK.checkout_metrics import CheckoutMetrics, MetricsRecorder
+from solutions.CHK.cost_curve import cost_curve
+from solutions.CHK.offer_graph import order_free_item_offers
+from solutions.CHK.pricing_plan import Counts, PricingPlan
+from solutions.CHK.sku_parser import SkuInput, SkuParser
+from solutions.CHK.sku_tokenizer import SkuTokenizer
 
 
 class MultiBuyOffer(BaseModel, frozen=True):
@@ -26,16 +43,10 @@ class GroupDiscountOffer(BaseModel, frozen=True):
     price: int
 
 
-class GroupOfferResult(BaseModel, frozen=True):
+class GroupOfferResult(NamedTuple):
     remaining_items: Counter[str]
     offer_cost: int
 
-    @field_validator("remaining_items", mode="before")
-    @classmethod
-    def normalize_counter(cls, v: Counter[str]) -> Counter[str]:
-        # Remove zero and negative counts
-        return +v
-
 
 # Default constants
 DEFAULT_FREE_ITEM_OFFERS = [
@@ -105,41 +116,196 @@ DEFAULT_BASE_PRICES = {
 }
 
 
+@lru_cache(maxsize=64)
+def _free_item_offers_by_trigger(
+    offers: tuple[FreeItemOffer, ...],
+) -> dict[str, tuple[int, tuple[FreeItemOffer, ...]]]:
+    """Trigger SKU -> (rank, its offers), ranked so gifts are settled first."""
+    by_trigger: dict[str, list[FreeItemOffer]] = {}
+    ordered_offers = order_free_item_offers(
+        offers, trigger=attrgetter("sku"), gift=attrgetter("gift_sku")
+    )
+    for offer in ordered_offers:
+        by_trigger.setdefault(offer.sku, []).append(offer)
+    return {
+        sku: (rank, tuple(trigger_offers))
+        for rank, (sku, trigger_offers) in enumerate(by_trigger.items())
+    }
+
+
+def _multibuy_tiers(offers: list[MultiBuyOffer]) -> tuple[tuple[int, int], ...]:
+    return tuple((offer.quantity, offer.price) for offer in offers)
+
+
+# (plan, thread's count buffer, whether the plan has free groups, thread's
+# metrics recorder)
+MeasuredScratch = tuple[PricingPlan, Counts, bool, MetricsRecorder]
+
+
+def _record_invalid(recorder: MetricsRecorder, start: int) -> int:
+    # Invalid baskets only get as far as parsing
+    parse_ns = perf_counter_ns() - start
+    recorder.stages[0].append(parse_ns)
+    recorder.invalid.append(parse_ns)
+    return -1
+
+
+def _group_items(counts: Counts, num_items: int, free_items: int) -> int:
+    # Whatever free items and groups did not take is left for multibuy
+    return (
+        num_items
+        - free_items
+        - sum(counts.values() if isinstance(counts, dict) else counts)
+    )
+
+
 class CheckoutSolution:
+    """Prices SKU strings against a price table and promotional offers.
+
+    The price table and offers are compiled into a PricingPlan. Assigning a
+    new value to any of them recompiles the plan, and apply_pricing() swaps
+    them all at once; mutating them in place is not picked up.
+    """
+
     def __init__(
         self,
         free_item_offers: list[FreeItemOffer] | None = None,
         multibuy_offers: dict[str, list[MultiBuyOffer]] | None = None,
         group_discount_offers: list[GroupDiscountOffer] | None = None,
         base_prices: dict[str, int] | None = None,
+        basket_cache: BasketCache | None = None,
+        solver_budget_ms: float | None = None,
+        metrics: CheckoutMetrics | None = None,
     ):
         # Define free item offers
-        self.free_item_offers = (
+        self._free_item_offers = (
             free_item_offers
             if free_item_offers is not None
             else DEFAULT_FREE_ITEM_OFFERS
         )
 
-        # Define multibuy offers per SKU (sorted by quantity descending)
-        self.multibuy_offers = (
+        # Define multibuy offers per SKU
+        self._multibuy_offers = (
             multibuy_offers if multibuy_offers is not None else DEFAULT_MULTIBUY_OFFERS
         )
 
         # Define group discount offers
-        self.group_discount_offers = (
+        self._group_discount_offers = (
             group_discount_offers
             if group_discount_offers is not None
             else DEFAULT_GROUP_DISCOUNT_OFFERS
         )
 
         # Define base prices
-        self.base_prices = (
+        self._base_prices = (
             base_prices if base_prices is not None else DEFAULT_BASE_PRICES
         )
 
+        # Per-thread count buffer reused across checkouts
+        self._scratch = threading.local()
+
+        # Opt-in cache of basket totals, invalidated whenever the plan changes
+        self.basket_cache = basket_cache
+
+        # Opt-in optimal solver for overlapping group offers, with a time
+        # budget per checkout; None keeps the greedy most-expensive-first pass
+        self.solver_budget_ns = (
+            int(solver_budget_ms * 1_000_000) if solver_budget_ms is not None else None
+        )
+
+        # Opt-in instrumentation of every checkout method
+        self._metrics = metrics
+
+        self._compile()
+
+    def _compile(self) -> None:
+        # Compile the offers once so checkout only works on flat lookup tables
+        self.pricing_plan = PricingPlan.compile(
+            self._base_prices,
+            self._multibuy_offers,
+            self._free_item_offers,
+            self._group_discount_offers,
+        )
+
+    def apply_pricing(
+        self,
+        base_prices: dict[str, int],
+        multibuy_offers: dict[str, list[MultiBuyOffer]],
+        free_item_offers: list[FreeItemOffer],
+        group_discount_offers: list[GroupDiscountOffer],
+        pricing_plan: PricingPlan | None = None,
+    ) -> None:
+        """Switch to a new price table and offers in one step.
+
+        The plan is compiled first, unless one is given, then swapped in with
+        a single assignment: checkouts already running finish on the old plan.
+        """
+        if pricing_plan is None:
+            pricing_plan = PricingPlan.compile(
+                base_prices, multibuy_offers, free_item_offers, group_discount_offers
+            )
+        self._base_prices = base_prices
+        self._multibuy_offers = multibuy_offers
+        self._free_item_offers = free_item_offers
+        self._group_discount_offers = group_discount_offers
+        self.pricing_plan = pricing_plan
+
+    @property
+    def free_item_offers(self) -> list[FreeItemOffer]:
+        return self._free_item_offers
+
+    @free_item_offers.setter
+    def free_item_offers(self, offers: list[FreeItemOffer]) -> None:
+        self._free_item_offers = offers
+        self._compile()
+
+    @property
+    def multibuy_offers(self) -> dict[str, list[MultiBuyOffer]]:
+        return self._multibuy_offers
+
+    @multibuy_offers.setter
+    def multibuy_offers(self, offers: dict[str, list[MultiBuyOffer]]) -> None:
+        self._multibuy_offers = offers
+        self._compile()
+
+    @property
+    def group_discount_offers(self) -> list[GroupDiscountOffer]:
+        return self._group_discount_offers
+
+    @group_discount_offers.setter
+    def group_discount_offers(self, offers: list[GroupDiscountOffer]) -> None:
+        self._group_discount_offers = offers
+        self._compile()
+
+    @property
+    def base_prices(self) -> dict[str, int]:
+        return self._base_prices
+
+    @base_prices.setter
+    def base_prices(self, base_prices: dict[str, int]) -> None:
+        self._base_prices = base_prices
+        self._compile()
+
+    @property
+    def metrics(self) -> CheckoutMetrics | None:
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics: CheckoutMetrics | None) -> None:
+        self._metrics = metrics
+        # Threads keep their recorder in the scratch space: start it afresh
+        self._scratch = threading.local()
+
     @staticmethod
     def parse_skus(skus: str, base_prices: dict[str, int]) -> Counter[str]:
-        """Parse SKU string into a Counter of items."""
+        """Parse SKU string into a Counter of items.
+
+        Price tables with multi-character SKU codes are tokenized with a
+        SkuTokenizer.
+        """
+        if not SkuParser.supports(base_prices):
+            tokenizer = SkuTokenizer(list(base_prices))
+            return Counter(map(tokenizer.skus.__getitem__, tokenizer.tokens(skus)))
         counter = Counter(skus)
         # Check that all SKUs are valid
         for sku in counter:
@@ -153,11 +319,15 @@ class CheckoutSolution:
     ) -> Counter[str]:
         """Apply free item offers to the item counts.
 
-        Note: We assume there are no cycles in the Buy N get X offers.
+        Offers giving a SKU away are applied before offers triggered by that
+        SKU. Cycles in the Buy N get X offers raise OfferCycleError.
         """
         items = items.copy()
-        for offer in offers:
-            if offer.sku in items:
+        by_trigger = _free_item_offers_by_trigger(tuple(offers))
+        # Only SKUs in the basket can trigger an offer, visited in offer order
+        triggered = sorted(by_trigger[sku] for sku in items if sku in by_trigger)
+        for _, trigger_offers in triggered:
+            for offer in trigger_offers:
                 free_items = (items[offer.sku] // offer.quantity) * offer.gift_quantity
                 items[offer.gift_sku] = max(0, items[offer.gift_sku] - free_items)
         return items
@@ -204,7 +374,8 @@ class CheckoutSolution:
 
                 total_offer_cost += num_offers * offer.price
 
-        return GroupOfferResult(remaining_items=items, offer_cost=total_offer_cost)
+        # Remove zero and negative counts
+        return GroupOfferResult(remaining_items=+items, offer_cost=total_offer_cost)
 
     @staticmethod
     def calculate_multibuy_cost(
@@ -216,16 +387,8 @@ class CheckoutSolution:
         total_cost = 0
 
         for sku, num_items in items.items():
-            if sku in multibuy_offers:
-                remaining = num_items
-                for offer in multibuy_offers[sku]:
-                    total_cost += (remaining // offer.quantity) * offer.price
-                    remaining = remaining % offer.quantity
-                # Add cost for remaining items at base price
-                total_cost += remaining * base_prices[sku]
-            else:
-                # No multibuy offer, use base price
-                total_cost += num_items * base_prices[sku]
+            tiers = _multibuy_tiers(multibuy_offers.get(sku, []))
+            total_cost += cost_curve(base_prices[sku], tiers)(num_items)
 
         return total_cost
 
@@ -236,22 +399,15 @@ class CheckoutSolution:
         base_prices: dict[str, int],
         multibuy_offers: dict[str, list[MultiBuyOffer]],
     ) -> int:
-        """Calculate total cost for a single SKU including multibuy offers."""
+        """Calculate total cost for a single SKU including multibuy offers.
+
+        The cheapest mix of multibuy offers is used, whatever their order.
+        """
         if sku not in base_prices:
             raise ValueError("Invalid SKU")
 
-        cost = 0
-        remaining = num_items
-
-        # Apply multibuy offers if available
-        if sku in multibuy_offers:
-            for offer in multibuy_offers[sku]:
-                cost += (remaining // offer.quantity) * offer.price
-                remaining = remaining % offer.quantity
-
-        # Add cost for remaining items at base price
-        cost += remaining * base_prices[sku]
-        return cost
+        tiers = _multibuy_tiers(multibuy_offers.get(sku, []))
+        return cost_curve(base_prices[sku], tiers)(num_items)
 
     def calculate_total_cost(
         self,
@@ -266,31 +422,204 @@ class CheckoutSolution:
             total_cost += cost
         return total_cost
 
-    def checkout(self, skus: str) -> int:
-        # skus = unicode string
+    def checkout(self, skus: SkuInput) -> int:
+        # skus = unicode string, or ASCII bytes straight off the queue
+        plan = self.pricing_plan
+        if self._metrics is not None:
+            return self._checkout_measured(plan, skus)
+        counts = self._scratch_counts(plan)
         try:
-            # Parse SKUs into item counts
-            ordered_items = self.parse_skus(skus, self.base_prices)
+            # Parse SKUs into item counts indexed by SKU ordinal
+            plan.count_into(skus, counts)
         except ValueError:
             return -1
+        return self._price(plan, counts)
+
+    def _checkout_measured(self, plan: PricingPlan, skus: SkuInput) -> int:
+        # Same pipeline as checkout(), timed from start to end. The values
+        # are left in the recorder's pending lists for it to bucket later
+        start = perf_counter_ns()
+        measured = getattr(self._scratch, "measured", None)
+        if measured is None or measured[0] is not plan:
+            measured = self._measured_scratch(plan)
+        _, counts, free_groups, recorder = measured
+        recorder.countdown -= 1
+        if not recorder.countdown:
+            recorder.sample()
+            return self._checkout_sampled(plan, skus, measured, start)
+        try:
+            num_items = plan.count_into(skus, counts)
+        except ValueError:
+            recorder.invalid.append(perf_counter_ns() - start)
+            return -1
 
-        # Apply free item offers
-        ordered_items = self.apply_free_item_offers(
-            ordered_items, self.free_item_offers
+        cache = self.basket_cache
+        if cache is not None:
+            signature = basket_signature(counts)
+            total_cost = cache.get(plan, signature)
+            if total_cost is not None:
+                recorder.cache_hits.extend((perf_counter_ns() - start, num_items))
+                return total_cost
+
+        free_items, total_cost = plan.resolve_offers(counts, self.solver_budget_ns)
+        group_items = (
+            _group_items(counts, num_items, free_items)
+            if total_cost or free_groups
+            else 0
         )
-
-        # Apply group discount offers
-        group_result = self.calculate_group_offer_discount(
-            ordered_items, self.group_discount_offers
+        total_cost += plan.multibuy_cost(counts)
+        if cache is not None:
+            cache.put(plan, signature, total_cost)
+        recorder.priced.extend(
+            (perf_counter_ns() - start, num_items, free_items, group_items)
         )
-        total_cost = group_result.offer_cost
+        return total_cost
 
-        # Calculate cost for remaining items with multibuy offers
-        total_cost += self.calculate_multibuy_cost(
-            group_result.remaining_items, self.base_prices, self.multibuy_offers
-        )
+    def _checkout_sampled(
+        self, plan: PricingPlan, skus: SkuInput, measured: MeasuredScratch, start: int
+    ) -> int:
+        _, counts, _, recorder = measured
+        try:
+            num_items = plan.count_into(skus, counts)
+        except ValueError:
+            return _record_invalid(recorder, start)
+        return self._price_sampled(plan, counts, num_items, measured, start)
 
+    def _price_sampled(
+        self,
+        plan: PricingPlan,
+        counts: Counts,
+        num_items: int,
+        measured: MeasuredScratch,
+        start: int,
+    ) -> int:
+        # Same pipeline again, timing every stage
+        parsed = perf_counter_ns()
+        _, _, free_groups, recorder = measured
+        stages = recorder.stages
+        cache = self.basket_cache
+        if cache is not None:
+            signature = basket_signature(counts)
+            total_cost = cache.get(plan, signature)
+            if total_cost is not None:
+                stages[0].append(parsed - start)
+                recorder.cache_hits.extend((perf_counter_ns() - start, num_items))
+                return total_cost
+
+        if self.solver_budget_ns is None:
+            free_items = plan.apply_free_item_offers(counts)
+            freed = perf_counter_ns()
+            total_cost = plan.apply_group_offers(counts)
+        else:
+            # The solver weighs free items and groups together: all its time
+            # counts as the group stage
+            freed = parsed
+            free_items, total_cost = plan.resolve_offers(counts, self.solver_budget_ns)
+        grouped = perf_counter_ns()
+        group_items = (
+            _group_items(counts, num_items, free_items)
+            if total_cost or free_groups
+            else 0
+        )
+        total_cost += plan.multibuy_cost(counts)
+        priced = perf_counter_ns()
+
+        if cache is not None:
+            cache.put(plan, signature, total_cost)
+        stages[0].append(parsed - start)
+        stages[1].append(freed - parsed)
+        stages[2].append(grouped - freed)
+        stages[3].append(priced - grouped)
+        recorder.priced.extend((priced - start, num_items, free_items, group_items))
         return total_cost
 
+    def _scratch_counts(self, plan: PricingPlan) -> Counts:
+        # One count buffer per thread, reused by every checkout on it
+        scratch = self._scratch
+        if getattr(scratch, "plan", None) is not plan:
+            self._fill_scratch(scratch, plan)
+        return scratch.counts
 
+    @staticmethod
+    def _fill_scratch(scratch: threading.local, plan: PricingPlan) -> None:
+        scratch.counts = plan.new_counts()
+        # Without such a group, items only go into groups that cost something
+        scratch.free_groups = any(price <= 0 for _, _, price in plan.group_offers)
+        scratch.plan = plan
+
+    def _measured_scratch(self, plan: PricingPlan) -> MeasuredScratch:
+        # What a measured checkout needs from the scratch space, cached in
+        # one tuple so it takes a single lookup, along with the thread's
+        # metrics recorder rather than looking it up in the metrics' own
+        # thread-local
+        scratch = self._scratch
+        counts = self._scratch_counts(plan)
+        try:
+            recorder = scratch.recorder
+        except AttributeError:
+            recorder = scratch.recorder = self._metrics.recorder()
+        scratch.measured = (plan, counts, scratch.free_groups, recorder)
+        return scratch.measured
+
+    def checkout_stream(self, chunks: Iterable[SkuInput]) -> int:
+        """Price a basket read chunk by chunk, e.g. from a file or socket."""
+        plan = self.pricing_plan
+        start = perf_counter_ns()
+        try:
+            counts = count_stream(plan, chunks)
+        except ValueError:
+            return self._invalid_measured(plan, start)
+        return self._price_counted(plan, counts, start)
+
+    def checkout_run_length(self, encoded: str) -> int:
+        """Price a run-length encoded basket such as "A*1000000 B*3"."""
+        plan = self.pricing_plan
+        start = perf_counter_ns()
+        try:
+            counts = count_run_length(plan, encoded)
+        except ValueError:
+            return self._invalid_measured(plan, start)
+        return self._price_counted(plan, counts, start)
+
+    def _invalid_measured(self, plan: PricingPlan, start: int) -> int:
+        if self._metrics is None:
+            return -1
+        recorder = self._measured_scratch(plan)[3]
+        recorder.flush_if_full()
+        return _record_invalid(recorder, start)
+
+    def _price_counted(self, plan: PricingPlan, counts: Counts, start: int) -> int:
+        if self._metrics is None:
+            return self._price(plan, counts)
+        # Streamed and run-length baskets, large by nature, are always timed
+        # stage by stage
+        num_items = sum(counts.values() if isinstance(counts, dict) else counts)
+        measured = self._measured_scratch(plan)
+        measured[3].flush_if_full()
+        return self._price_sampled(plan, counts, num_items, measured, start)
+
+    def _price(self, plan: PricingPlan, counts: Counts) -> int:
+        cache = self.basket_cache
+        if cache is None:
+            # Apply free item, group discount and multibuy offers
+            return plan.price(counts, self.solver_budget_ns)
+
+        # Baskets with the same counts share a total whatever the SKU order
+        signature = basket_signature(counts)
+        total_cost = cache.get(plan, signature)
+        if total_cost is None:
+            total_cost = plan.price(counts, self.solver_budget_ns)
+            cache.put(plan, signature, total_cost)
+        return total_cost
 
+    def basket(self) -> Basket:
+        """Start a basket priced incrementally as items are scanned."""
+        return Basket(self.pricing_plan, self.solver_budget_ns)
+
+    def checkout_many(self, baskets: Iterable[str]) -> list[int]:
+        """Price many SKU strings in one call, -1 for each invalid basket."""
+        plan = self.pricing_plan
+        recorder = None
+        if self._metrics is not None:
+            recorder = self._measured_scratch(plan)[3]
+        return price_baskets(plan, baskets, self.solver_budget_ns, recorder)
@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+from fractions import Fraction
+from functools import lru_cache
+
+
+@dataclass(frozen=True, slots=True)
+class CostCurve:
+    """Best-for-customer cost of buying any quantity of a single SKU.
+
+    costs[n] is the cheapest way to pay for n items using any mix of the
+    multibuy tiers and the base price. Past the end of the table the cheapest
+    bundle per item (period items for period_price) repeats, so larger
+    quantities are priced in closed form.
+    """
+
+    costs: tuple[int, ...]
+    period: int
+    period_price: int
+
+    def __call__(self, num_items: int) -> int:
+        costs = self.costs
+        if num_items < len(costs):
+            return costs[num_items]
+        period = self.period
+        repeats = (num_items - len(costs)) // period + 1
+        return costs[num_items - repeats * period] + repeats * self.period_price
+
+
+@lru_cache(maxsize=1024)
+def cost_curve(base_price: int, tiers: tuple[tuple[int, int], ...] = ()) -> CostCurve:
+    """Build the cost curve for a SKU from its (quantity, price) multibuy tiers.
+
+    The table is filled by dynamic programming over the tiers. Its length
+    comes from an exchange argument: with m the quantity of the best value
+    bundle, any m other bundles contain a subset whose quantities sum to a
+    multiple of m, which can be swapped for best value bundles at no extra
+    cost. So beyond (m - 1) * largest quantity + m - 1 items every optimal
+    basket contains at least one best value bundle, and
+    cost(n) = cost(n - m) + price(m).
+    """
+    bundles = ((1, base_price),) + tiers
+    for quantity, _ in bundles:
+        if quantity < 1:
+            raise ValueError(f"Multibuy quantity must be positive, got {quantity}")
+
+    period, period_price = min(
+        bundles, key=lambda bundle: (Fraction(bundle[1], bundle[0]), -bundle[0])
+    )
+    largest = max(quantity for quantity, _ in bundles)
+    size = (period - 1) * largest + period
+
+    costs = [0] * size
+    for num_items in range(1, size):
+        costs[num_items] = min(
+            costs[num_items - quantity] + price
+            for quantity, price in bundles
+            if quantity <= num_items
+        )
+    return CostCurve(costs=tuple(costs), period=period, period_price=period_price)
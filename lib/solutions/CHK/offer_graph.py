@@ -0,0 +1,83 @@
+import heapq
+from collections.abc import Callable, Hashable, Sequence
+from typing import TypeVar
+
+Offer = TypeVar("Offer")
+
+
+class OfferCycleError(ValueError):
+    """Free item offers give items away in a cycle, e.g. buy A get B, buy B get A."""
+
+
+def order_free_item_offers(
+    offers: Sequence[Offer],
+    trigger: Callable[[Offer], Hashable],
+    gift: Callable[[Offer], Hashable],
+) -> list[Offer]:
+    """Order free item offers so gifts are settled before they trigger offers.
+
+    Offers form a graph from trigger SKU to gift SKU. An offer is applied only
+    once every offer giving away its trigger SKU has been applied, so free
+    items never count towards further offers. Offers on the same SKU (buy 2 F
+    get 1 F free) are fine; longer cycles raise OfferCycleError. Ties keep
+    the original offer order.
+    """
+    # Nodes are ranked by first appearance so the order is deterministic
+    first_seen: dict[Hashable, int] = {}
+    successors: dict[Hashable, set[Hashable]] = {}
+    for offer in offers:
+        source, target = trigger(offer), gift(offer)
+        for node in (source, target):
+            first_seen.setdefault(node, len(first_seen))
+            successors.setdefault(node, set())
+        if source != target:
+            successors[source].add(target)
+
+    indegree = dict.fromkeys(first_seen, 0)
+    for targets in successors.values():
+        for target in targets:
+            indegree[target] += 1
+
+    ready = [(rank, node) for node, rank in first_seen.items() if not indegree[node]]
+    heapq.heapify(ready)
+    position: dict[Hashable, int] = {}
+    while ready:
+        _, node = heapq.heappop(ready)
+        position[node] = len(position)
+        for target in successors[node]:
+            indegree[target] -= 1
+            if not indegree[target]:
+                heapq.heappush(ready, (first_seen[target], target))
+
+    if len(position) < len(first_seen):
+        remaining = [node for node in first_seen if node not in position]
+        cycle = _find_cycle(successors, remaining)
+        raise OfferCycleError(
+            "Free item offers form a cycle: " + " -> ".join(map(str, cycle))
+        )
+
+    order = sorted(range(len(offers)), key=lambda i: (position[trigger(offers[i])], i))
+    return [offers[i] for i in order]
+
+
+def _find_cycle(
+    successors: dict[Hashable, set[Hashable]], remaining: list[Hashable]
+) -> list[Hashable]:
+    # Every node left over by the topological sort has a predecessor that was
+    # left over too, so walking backwards must eventually repeat a node.
+    left_over = set(remaining)
+    predecessors = {
+        target: source
+        for source in remaining
+        for target in successors[source]
+        if target in left_over
+    }
+    node = remaining[0]
+    path: list[Hashable] = []
+    seen: dict[Hashable, int] = {}
+    while node not in seen:
+        seen[node] = len(path)
+        path.append(node)
+        node = predecessors[node]
+    cycle = path[seen[node] :] + [node]
+    return cycle[::-1]
@@ -0,0 +1,212 @@
+from collections.abc import Mapping, Sequence
+from fractions import Fraction
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from solutions.CHK.pricing_plan import FreeItemRule, GroupRule, PricingPlan
+
+# How many search nodes to expand between two looks at the clock
+_CLOCK_INTERVAL = 64
+
+
+class GroupSolution(NamedTuple):
+    # Cost of the group offers plus the leftover SKUs taking part in any
+    # offer at their best multibuy price
+    cost: int
+    # Remaining count of every SKU taking part in the free item or group
+    # offers
+    remaining: dict[int, int]
+    # How many items the free item offers gave away
+    free_items: int
+    # False when the time budget ran out before the search space was exhausted
+    optimal: bool
+
+
+class _BudgetExhausted(Exception):
+    pass
+
+
+def solve_group_offers(
+    plan: "PricingPlan",
+    counts: Sequence[int] | Mapping[int, int],
+    budget_ns: int,
+    offers: "Sequence[GroupRule] | None" = None,
+    free_item_offers: "Sequence[FreeItemRule] | None" = None,
+) -> GroupSolution:
+    """Find the cheapest way to apply overlapping free item and group offers.
+
+    Group offers may share SKUs with each other, with multibuy offers and
+    with the gifts of free item offers, so removing the most expensive
+    members first, or taking every free item, is no longer always best: an
+    item given away may have done better in a group. This is a branch and
+    bound search over how many items every free item offer gives away, in
+    plan order, and then how many items of each member every group offer
+    takes, starting from the greedy result as the bound. Items the offers do
+    not take are priced along their cost curves. When budget_ns runs out
+    the best solution found so far is returned.
+
+    The counts are those of the basket as scanned, before any free items.
+    """
+    deadline = perf_counter_ns() + budget_ns
+    if isinstance(counts, Mapping):
+        # Only the offers the basket takes part in, not the whole catalog
+        if offers is None:
+            offers = plan.basket_group_offers(counts)
+        if free_item_offers is None:
+            free_item_offers = plan.basket_free_item_offers(counts)
+
+        def count_of(sku: int) -> int:
+            return counts.get(sku, 0)
+
+    else:
+        if offers is None:
+            offers = plan.group_offers
+        if free_item_offers is None:
+            free_item_offers = plan.free_item_offers
+        count_of = counts.__getitem__
+    # Free items only ever lower counts: offers missing their trigger or
+    # gift, or groups without any member, cannot come into play
+    free_item_offers = [
+        offer for offer in free_item_offers if count_of(offer[0]) and count_of(offer[2])
+    ]
+    offers = [offer for offer in offers if any(count_of(sku) for sku in offer[0])]
+    available = {sku: count_of(sku) for members, _, _ in offers for sku in members}
+    for trigger, _, gift, _ in free_item_offers:
+        available[trigger] = count_of(trigger)
+        available[gift] = count_of(gift)
+
+    # The greedy passes give the initial bound
+    greedy_remaining = dict(available)
+    best_free_items = plan.apply_free_item_offers(greedy_remaining, free_item_offers)
+    best_cost = plan.apply_group_offers(greedy_remaining, offers) + sum(
+        plan.sku_cost(sku, num_items) for sku, num_items in greedy_remaining.items()
+    )
+    best_remaining = greedy_remaining
+
+    if not offers:
+        # Free items are only worth holding back for a group
+        return GroupSolution(best_cost, best_remaining, best_free_items, True)
+
+    # A SKU's leftover count is final once the last group containing it is
+    # done; SKUs in no group are final once the free items are decided
+    last_group = {
+        sku: index for index, (members, _, _) in enumerate(offers) for sku in members
+    }
+    finished_after: list[list[int]] = [[] for _ in offers]
+    for sku, index in last_group.items():
+        finished_after[index].append(sku)
+    ungrouped = [sku for sku in available if sku not in last_group]
+
+    # Cheapest any item can possibly cost from group index onwards
+    item_bound = {}
+    for sku in available:
+        curve = plan.cost_curves[sku]
+        if curve is None:
+            bound = Fraction(plan.base_prices[sku])
+        else:
+            bound = Fraction(curve.period_price, curve.period)
+        bounds = [bound] * (len(offers) + 1)
+        for index in range(len(offers) - 1, -1, -1):
+            members, quantity, price = offers[index]
+            if sku in members:
+                bound = min(bound, Fraction(price, quantity))
+            bounds[index] = bound
+        item_bound[sku] = bounds
+
+    # SKUs free item offer index onwards may still give away, and so may
+    # cost nothing at all
+    gifts_from = [set() for _ in range(len(free_item_offers) + 1)]
+    for index in range(len(free_item_offers) - 1, -1, -1):
+        gifts_from[index] = gifts_from[index + 1] | {free_item_offers[index][2]}
+
+    nodes = 0
+    free_items = 0
+
+    def tick() -> None:
+        nonlocal nodes
+        nodes += 1
+        if not nodes % _CLOCK_INTERVAL and perf_counter_ns() > deadline:
+            raise _BudgetExhausted
+
+    def give_away(index: int) -> None:
+        nonlocal free_items
+        tick()
+        if index == len(free_item_offers):
+            fixed_cost = 0
+            for sku in ungrouped:
+                fixed_cost += plan.sku_cost(sku, available[sku])
+            if fixed_cost >= best_cost:
+                return
+            search(0, 0, fixed_cost, 0)
+            return
+
+        gifts = gifts_from[index]
+        bound = 0
+        for sku, num_items in available.items():
+            if num_items and sku not in gifts:
+                bound += num_items * item_bound[sku][0]
+        if bound >= best_cost:
+            return
+
+        trigger, quantity, gift, gift_quantity = free_item_offers[index]
+        most = min(available[gift], (available[trigger] // quantity) * gift_quantity)
+        for num_free in range(most, -1, -1):
+            available[gift] -= num_free
+            free_items += num_free
+            try:
+                give_away(index + 1)
+            finally:
+                available[gift] += num_free
+                free_items -= num_free
+
+    def lower_bound(index: int, fixed_cost: int, taken: int) -> Fraction:
+        _, quantity, price = offers[index]
+        bound = fixed_cost + Fraction(taken * price, quantity)
+        for sku, num_items in available.items():
+            if num_items and last_group.get(sku, -1) >= index:
+                bound += num_items * item_bound[sku][index]
+        return bound
+
+    def search(index: int, member: int, fixed_cost: int, taken: int) -> None:
+        nonlocal best_cost, best_remaining, best_free_items
+        tick()
+
+        members, quantity, price = offers[index]
+        if member == len(members):
+            fixed_cost += (taken // quantity) * price
+            for sku in finished_after[index]:
+                fixed_cost += plan.sku_cost(sku, available[sku])
+            if fixed_cost >= best_cost:
+                return
+            if index + 1 == len(offers):
+                best_cost = fixed_cost
+                best_remaining = dict(available)
+                best_free_items = free_items
+                return
+            search(index + 1, 0, fixed_cost, 0)
+            return
+
+        if lower_bound(index, fixed_cost, taken) >= best_cost:
+            return
+
+        sku = members[member]
+        most = available[sku]
+        if member + 1 == len(members):
+            # The last member must round the group up to whole offers
+            most -= (taken + most) % quantity
+            step = quantity
+        else:
+            step = 1
+        for num_taken in range(most, -1, -step):
+            available[sku] -= num_taken
+            try:
+                search(index, member + 1, fixed_cost, taken + num_taken)
+            finally:
+                available[sku] += num_taken
+
+    try:
+        give_away(0)
+    except _BudgetExhausted:
+        return GroupSolution(best_cost, best_remaining, best_free_items, False)
+    return GroupSolution(best_cost, best_remaining, best_free_items, True)
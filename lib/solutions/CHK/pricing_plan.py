@@ -0,0 +1,458 @@
+from array import array
+from collections import defaultdict
+from collections.abc import (
+    Iterable,
+    Mapping,
+    MutableMapping,
+    MutableSequence,
+)
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import NamedTuple
+
+from solutions.CHK.cost_curve import CostCurve, cost_curve
+from solutions.CHK.offer_graph import order_free_item_offers
+from solutions.CHK.offer_solver import solve_group_offers
+from solutions.CHK.sku_parser import SkuInput, SkuParser
+from solutions.CHK.sku_tokenizer import SkuTokenizer
+
+FreeItemRule = tuple[int, int, int, int]
+GroupRule = tuple[tuple[int, ...], int, int]
+# Item counts by SKU ordinal: dense for single-character catalogs, sparse
+# {ordinal: quantity} for tokenized ones
+Counts = MutableSequence[int] | MutableMapping[int, int]
+
+
+class PricingComponent(NamedTuple):
+    """SKUs linked by offers, which can be priced independently of the rest."""
+
+    ordinals: tuple[int, ...]
+    free_item_offers: tuple[FreeItemRule, ...]
+    group_offers: tuple[GroupRule, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class PricingPlan:
+    """Immutable, precompiled form of the checkout price table and offers.
+
+    Every SKU is mapped to a dense ordinal and all per-SKU data lives in flat
+    tuples indexed by that ordinal, so the checkout stages never touch the
+    pydantic offer models or the offer dicts.
+    """
+
+    # ordinal -> sku
+    skus: tuple[str, ...]
+    # sku -> ordinal
+    ordinals: dict[str, int]
+    # ordinal -> base price
+    base_prices: tuple[int, ...]
+    # ordinal -> ((quantity, price), ...), sorted by quantity descending
+    multibuy_tiers: tuple[tuple[tuple[int, int], ...], ...]
+    # ordinal -> optimal cost of any quantity under its multibuy tiers, or
+    # None for SKUs without tiers
+    cost_curves: tuple[CostCurve | None, ...]
+    # ordinal -> the curve's cost table, or None for SKUs without tiers
+    curve_tables: tuple[tuple[int, ...] | None, ...]
+    # (trigger ordinal, quantity, gift ordinal, gift quantity), ordered so
+    # offers giving a SKU away run before offers triggered by that SKU
+    free_item_offers: tuple[FreeItemRule, ...]
+    # (trigger ordinal, ((quantity, gift ordinal, gift quantity), ...)) in the
+    # same order, so a basket only visits offers whose trigger it contains
+    free_item_triggers: tuple[tuple[int, tuple[tuple[int, int, int], ...]], ...]
+    # trigger ordinal -> its index in free_item_triggers
+    free_item_ranks: dict[int, int]
+    # (member ordinals from most to least expensive, quantity, price)
+    group_offers: tuple[GroupRule, ...]
+    # ordinal -> indexes into group_offers the SKU belongs to
+    group_membership: tuple[tuple[int, ...], ...]
+    # SKUs with free item or group offers, partitioned by the offers that
+    # connect them
+    components: tuple[PricingComponent, ...]
+    # ordinal -> index into components, -1 for SKUs without such offers
+    sku_components: tuple[int, ...]
+    # byte-level parser when every SKU is a single ASCII character, otherwise
+    # a tokenizer for multi-character SKU codes
+    parser: SkuParser | SkuTokenizer
+
+    @classmethod
+    def compile(
+        cls,
+        base_prices: Mapping[str, int],
+        multibuy_offers: Mapping[str, Iterable] = (),
+        free_item_offers: Iterable = (),
+        group_discount_offers: Iterable = (),
+    ) -> "PricingPlan":
+        """Build a plan from the offer models used to configure the checkout."""
+        skus = tuple(base_prices)
+        ordinals = {sku: ordinal for ordinal, sku in enumerate(skus)}
+
+        def ordinal_of(sku: str) -> int:
+            try:
+                return ordinals[sku]
+            except KeyError:
+                raise ValueError(f"Offer references unknown SKU: {sku}") from None
+
+        tiers: list[tuple[tuple[int, int], ...]] = [()] * len(skus)
+        for sku, offers in dict(multibuy_offers).items():
+            tiers[ordinal_of(sku)] = tuple(
+                sorted(
+                    ((offer.quantity, offer.price) for offer in offers),
+                    key=lambda tier: -tier[0],
+                )
+            )
+
+        ordered_offers = order_free_item_offers(
+            list(free_item_offers),
+            trigger=attrgetter("sku"),
+            gift=attrgetter("gift_sku"),
+        )
+        free_items = tuple(
+            (
+                ordinal_of(offer.sku),
+                offer.quantity,
+                ordinal_of(offer.gift_sku),
+                offer.gift_quantity,
+            )
+            for offer in ordered_offers
+        )
+        triggers: dict[int, list[tuple[int, int, int]]] = {}
+        for trigger, quantity, gift, gift_quantity in free_items:
+            triggers.setdefault(trigger, []).append((quantity, gift, gift_quantity))
+
+        groups = tuple(
+            (tuple(ordinal_of(sku) for sku in offer.skus), offer.quantity, offer.price)
+            for offer in group_discount_offers
+        )
+        membership: dict[int, list[int]] = {}
+        for index, (members, _, _) in enumerate(groups):
+            for ordinal in members:
+                membership.setdefault(ordinal, []).append(index)
+
+        prices = tuple(base_prices[sku] for sku in skus)
+        curves = tuple(
+            cost_curve(price, sku_tiers) if sku_tiers else None
+            for price, sku_tiers in zip(prices, tiers)
+        )
+        components, sku_components = _partition(len(skus), free_items, groups)
+        return cls(
+            skus=skus,
+            ordinals=ordinals,
+            base_prices=prices,
+            multibuy_tiers=tuple(tiers),
+            cost_curves=curves,
+            curve_tables=tuple(curve and curve.costs for curve in curves),
+            free_item_offers=free_items,
+            free_item_triggers=tuple(
+                (trigger, tuple(offers)) for trigger, offers in triggers.items()
+            ),
+            free_item_ranks={trigger: rank for rank, trigger in enumerate(triggers)},
+            group_offers=groups,
+            group_membership=tuple(
+                tuple(membership.get(ordinal, ())) for ordinal in range(len(skus))
+            ),
+            components=components,
+            sku_components=sku_components,
+            parser=(
+                SkuParser(skus) if SkuParser.supports(skus) else SkuTokenizer(skus)
+            ),
+        )
+
+    def new_counts(self) -> Counts:
+        """An empty count buffer for count_into().
+
+        A dense array indexed by ordinal when every SKU is a single ASCII
+        character; otherwise a sparse map holding only the SKUs counted, so
+        checkouts against a large catalog cost nothing per catalog SKU. SKUs
+        missing from the map count as zero.
+        """
+        if isinstance(self.parser, SkuTokenizer):
+            return defaultdict(int)
+        return array("q", bytes(8 * len(self.skus)))
+
+    def count(self, skus: SkuInput) -> Counts:
+        """Count a basket into a new buffer from new_counts()."""
+        counts = self.new_counts()
+        self.count_into(skus, counts)
+        return counts
+
+    def count_into(self, skus: SkuInput, counts: Counts) -> int:
+        """Count a basket into a reusable buffer, overwriting its contents.
+
+        Returns the number of items in the basket.
+        """
+        return self.parser.count_into(skus, counts)
+
+    def apply_free_item_offers(
+        self,
+        counts: Counts,
+        offers: tuple[FreeItemRule, ...] | None = None,
+    ) -> int:
+        """Remove free items from the counts, in place, and return how many."""
+        total_free_items = 0
+        if offers is None:
+            triggers = self.free_item_triggers
+            if isinstance(counts, Mapping):
+                # Only SKUs in the basket can trigger an offer: visit those,
+                # in offer order, rather than every trigger in the catalog.
+                # Reads go through get() so a sparse map never grows entries
+                # for SKUs the basket does not hold
+                ranks = self.free_item_ranks
+                triggers = [
+                    triggers[rank]
+                    for rank in sorted(
+                        ranks[ordinal]
+                        for ordinal, num_items in counts.items()
+                        if num_items and ordinal in ranks
+                    )
+                ]
+                get = counts.get
+            else:
+                get = counts.__getitem__
+            for trigger, trigger_offers in triggers:
+                num_triggers = get(trigger)
+                if num_triggers:
+                    for quantity, gift, gift_quantity in trigger_offers:
+                        free_items = (num_triggers // quantity) * gift_quantity
+                        num_gifts = get(gift)
+                        if free_items and num_gifts:
+                            counts[gift] = max(0, num_gifts - free_items)
+                            total_free_items += num_gifts - counts[gift]
+                        # an offer on its own SKU shrinks its trigger count
+                        num_triggers = get(trigger)
+            return total_free_items
+
+        for trigger, quantity, gift, gift_quantity in offers:
+            num_triggers = counts[trigger]
+            if num_triggers:
+                free_items = (num_triggers // quantity) * gift_quantity
+                num_gifts = counts[gift]
+                counts[gift] = max(0, num_gifts - free_items)
+                total_free_items += num_gifts - counts[gift]
+        return total_free_items
+
+    def apply_group_offers(
+        self,
+        counts: Counts,
+        offers: tuple[GroupRule, ...] | None = None,
+    ) -> int:
+        """Remove grouped items from the counts, in place, and return their cost.
+
+        Members are removed most expensive first to favor the customer.
+        """
+        if offers is None:
+            if isinstance(counts, Mapping):
+                return self._apply_basket_group_offers(counts)
+            offers = self.group_offers
+        total_offer_cost = 0
+        for members, quantity, price in offers:
+            total_available = 0
+            for ordinal in members:
+                total_available += counts[ordinal]
+            num_offers = total_available // quantity
+            if num_offers:
+                items_to_remove = num_offers * quantity
+                for ordinal in members:
+                    removed = min(counts[ordinal], items_to_remove)
+                    counts[ordinal] -= removed
+                    items_to_remove -= removed
+                    if not items_to_remove:
+                        break
+                total_offer_cost += num_offers * price
+        return total_offer_cost
+
+    def basket_free_item_offers(self, counts: Mapping[int, int]) -> list[FreeItemRule]:
+        """The free item offers sparse counts can trigger, in plan order."""
+        triggers = self.free_item_triggers
+        ranks = self.free_item_ranks
+        return [
+            (trigger, quantity, gift, gift_quantity)
+            for rank in sorted(
+                ranks[ordinal]
+                for ordinal, num_items in counts.items()
+                if num_items and ordinal in ranks
+            )
+            for trigger, trigger_offers in (triggers[rank],)
+            for quantity, gift, gift_quantity in trigger_offers
+        ]
+
+    def basket_group_offers(self, counts: Mapping[int, int]) -> list[GroupRule]:
+        """The group offers sparse counts take part in, in plan order."""
+        membership = self.group_membership
+        group_offers = self.group_offers
+        return [
+            group_offers[index]
+            for index in sorted(
+                {
+                    index
+                    for ordinal, num_items in counts.items()
+                    if num_items
+                    for index in membership[ordinal]
+                }
+            )
+        ]
+
+    def _apply_basket_group_offers(self, counts: MutableMapping[int, int]) -> int:
+        # apply_group_offers() over sparse counts: only the offers the basket
+        # takes part in, reading with get() so the map never grows entries
+        # for members the basket does not hold
+        get = counts.get
+        total_offer_cost = 0
+        for members, quantity, price in self.basket_group_offers(counts):
+            total_available = 0
+            for ordinal in members:
+                total_available += get(ordinal, 0)
+            num_offers = total_available // quantity
+            if num_offers:
+                items_to_remove = num_offers * quantity
+                for ordinal in members:
+                    removed = min(get(ordinal, 0), items_to_remove)
+                    if removed:
+                        counts[ordinal] -= removed
+                        items_to_remove -= removed
+                        if not items_to_remove:
+                            break
+                total_offer_cost += num_offers * price
+        return total_offer_cost
+
+    def multibuy_cost(self, counts: Counts) -> int:
+        """Price the counts at the best mix of multibuy tiers and base prices."""
+        total_cost = 0
+        base_prices = self.base_prices
+        curve_tables = self.curve_tables
+        items = counts.items() if isinstance(counts, Mapping) else enumerate(counts)
+        for ordinal, num_items in items:
+            if num_items:
+                costs = curve_tables[ordinal]
+                if costs is None:
+                    total_cost += num_items * base_prices[ordinal]
+                elif num_items < len(costs):
+                    total_cost += costs[num_items]
+                else:
+                    total_cost += self.cost_curves[ordinal](num_items)
+        return total_cost
+
+    def sku_cost(self, ordinal: int, num_items: int) -> int:
+        """Price a quantity of one SKU at its best multibuy mix."""
+        costs = self.curve_tables[ordinal]
+        if costs is None:
+            return num_items * self.base_prices[ordinal]
+        if num_items < len(costs):
+            return costs[num_items]
+        return self.cost_curves[ordinal](num_items)
+
+    def price(self, counts: Counts, solver_budget_ns: int | None = None) -> int:
+        """Run the full offer pipeline over the counts, consuming them.
+
+        With a solver budget, free item and group offers are applied by the
+        optimal offer solver instead of the greedy passes.
+        """
+        _, total_cost = self.resolve_offers(counts, solver_budget_ns)
+        return total_cost + self.multibuy_cost(counts)
+
+    def resolve_offers(
+        self, counts: Counts, solver_budget_ns: int | None = None
+    ) -> tuple[int, int]:
+        """Apply free item and group offers to the counts, in place.
+
+        Returns how many items were free and the cost of the group offers.
+        Uses the greedy passes, or the optimal offer solver given a budget.
+        """
+        if solver_budget_ns is None:
+            free_items = self.apply_free_item_offers(counts)
+            return free_items, self.apply_group_offers(counts)
+        solution = solve_group_offers(self, counts, solver_budget_ns)
+        total_cost = solution.cost
+        # The solver prices the leftover items too; hand them back so they
+        # are priced with the rest of the basket
+        get = counts.get if isinstance(counts, Mapping) else counts.__getitem__
+        for ordinal, num_items in solution.remaining.items():
+            if num_items or get(ordinal):
+                counts[ordinal] = num_items
+                total_cost -= self.sku_cost(ordinal, num_items)
+        return solution.free_items, total_cost
+
+    def price_component(
+        self,
+        component: int,
+        counts: Counts,
+        solver_budget_ns: int | None = None,
+    ) -> int:
+        """Run the offer pipeline over one component's SKUs only.
+
+        The counts are left untouched. The sum over all components, plus
+        sku_cost() of every SKU outside them, equals price() of the whole
+        basket, because no offer spans two components.
+        """
+        ordinals, free_item_offers, group_offers = self.components[component]
+        if isinstance(counts, Mapping):
+            # Read through get() so sparse counts never grow entries for the
+            # component's SKUs the basket does not hold
+            scratch = {ordinal: counts.get(ordinal, 0) for ordinal in ordinals}
+        else:
+            scratch = {ordinal: counts[ordinal] for ordinal in ordinals}
+        if not (free_item_offers or group_offers):
+            return sum(
+                self.sku_cost(ordinal, num_items)
+                for ordinal, num_items in scratch.items()
+            )
+
+        if solver_budget_ns is None:
+            self.apply_free_item_offers(scratch, free_item_offers)
+            total_cost = self.apply_group_offers(scratch, group_offers)
+        else:
+            solution = solve_group_offers(
+                self, scratch, solver_budget_ns, group_offers, free_item_offers
+            )
+            total_cost = solution.cost
+            for ordinal in solution.remaining:
+                scratch[ordinal] = 0
+        for ordinal, num_items in scratch.items():
+            if num_items:
+                total_cost += self.sku_cost(ordinal, num_items)
+        return total_cost
+
+
+def _partition(
+    num_skus: int,
+    free_item_offers: tuple[FreeItemRule, ...],
+    group_offers: tuple[GroupRule, ...],
+) -> tuple[tuple[PricingComponent, ...], tuple[int, ...]]:
+    """Group SKUs linked by any offer, keeping offers in their original order."""
+    parents: dict[int, int] = {}
+
+    def find(ordinal: int) -> int:
+        parent = parents.setdefault(ordinal, ordinal)
+        while parent != ordinal:
+            grandparent = parents[parent]
+            parents[ordinal] = grandparent
+            ordinal, parent = parent, grandparent
+        return ordinal
+
+    for trigger, _, gift, _ in free_item_offers:
+        parents[find(gift)] = find(trigger)
+    for members, _, _ in group_offers:
+        for ordinal in members[1:]:
+            parents[find(ordinal)] = find(members[0])
+        if members:
+            find(members[0])
+
+    roots: dict[int, int] = {}
+    sku_components = [-1] * num_skus
+    for ordinal in sorted(parents):
+        sku_components[ordinal] = roots.setdefault(find(ordinal), len(roots))
+    ordinals: list[list[int]] = [[] for _ in roots]
+    free_items: list[list[FreeItemRule]] = [[] for _ in roots]
+    groups: list[list[GroupRule]] = [[] for _ in roots]
+    for ordinal in sorted(parents):
+        ordinals[sku_components[ordinal]].append(ordinal)
+    for offer in free_item_offers:
+        free_items[sku_components[offer[0]]].append(offer)
+    for offer in group_offers:
+        if offer[0]:
+            groups[sku_components[offer[0][0]]].append(offer)
+
+    components = tuple(
+        PricingComponent(tuple(skus), tuple(free), tuple(group))
+        for skus, free, group in zip(ordinals, free_items, groups)
+    )
+    return components, tuple(sku_components)
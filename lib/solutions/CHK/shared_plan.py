@@ -0,0 +1,467 @@
+import gc
+import multiprocessing
+from array import array
+from collections import Counter
+from collections.abc import Iterable, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+from solutions.CHK.pricing_plan import PricingPlan
+from solutions.CHK.sku_parser import SkuInput, SkuParser
+from solutions.CHK.sku_tokenizer import _CHAR_BITS, SkuTokenizer
+
+# "CHKPLAN1", marking a segment laid out by SharedPlan.create()
+_MAGIC = 0x43484B504C414E31
+
+# Flat int64 sections of a shared plan, in layout order. CSR pairs hold one
+# offset per row plus a final end offset, into the section that follows.
+_SECTIONS = (
+    # ordinal -> base price
+    "base_prices",
+    # ordinal -> its cost curve table in curve_costs, empty without tiers
+    "curve_offsets",
+    "curve_costs",
+    # ordinal -> the cost curve's repeating bundle, 0 without tiers
+    "periods",
+    "period_prices",
+    # (trigger, quantity, gift, gift quantity) per offer, in plan order
+    "free_item_offers",
+    # ordinal -> indexes of the free item offers it triggers
+    "trigger_offsets",
+    "trigger_offers",
+    # group offer -> member ordinals, most expensive first
+    "group_offsets",
+    "group_members",
+    "group_quantities",
+    "group_prices",
+    # ordinal -> indexes of the group offers it belongs to
+    "membership_offsets",
+    "memberships",
+    # byte -> ordinal, -1 for invalid bytes; empty unless every SKU is a
+    # single ASCII character
+    "byte_ordinals",
+    # open addressing table of the tokenizer trie: transition key -> state,
+    # -1 for empty slots
+    "trie_keys",
+    "trie_states",
+    # trie state -> ordinal of the SKU code ending there, or -1
+    "accepting",
+)
+
+_HEADER_LENGTH = 2 + 2 * len(_SECTIONS)
+
+# Fibonacci hashing spreads trie keys, whose low bits are just the character
+_GOLDEN = 0x9E3779B97F4A7C15
+_WORD = (1 << 64) - 1
+
+
+class SharedPlan:
+    """A PricingPlan laid out as flat int64 arrays in one shared memory segment.
+
+    The owner compiles it with create(); other processes attach() by name, or
+    inherit it across fork, and read the arrays in place through memoryviews,
+    so the catalog exists once however many processes price with it. Baskets
+    are counted into a dict of the SKUs they hold, and only the offers those
+    SKUs take part in are visited: pricing is linear in the basket, not in
+    the catalog.
+
+    Group offers are applied by the greedy most-expensive-first pass; the
+    optimal offer solver is not available here.
+    """
+
+    def __init__(self, memory: SharedMemory, owner: bool = False):
+        self._memory = memory
+        self._owner = owner
+        self._views: list[memoryview] = []
+        words = self._view(memory.buf.cast("q"))
+        if len(words) < _HEADER_LENGTH or words[0] != _MAGIC:
+            self.close()
+            raise ValueError(f"{memory.name} does not hold a shared pricing plan")
+        self.num_skus = words[1]
+        for index, section in enumerate(_SECTIONS):
+            offset = words[2 + 2 * index]
+            length = words[3 + 2 * index]
+            setattr(self, section, self._view(words[offset : offset + length]))
+
+        if len(self.byte_ordinals):
+            self._tokenizer = None
+        else:
+            transitions = _SharedTrie(self.trie_keys, self.trie_states)
+            self._tokenizer = SkuTokenizer.from_trie(
+                transitions,
+                self.accepting,
+                _WholeTokens(transitions, self.accepting),
+            )
+
+    @classmethod
+    def create(cls, plan: PricingPlan, name: str | None = None) -> "SharedPlan":
+        """Compile a plan into a new shared memory segment owned by the caller."""
+        sections = _compile(plan)
+        header = array("q", [_MAGIC, len(plan.skus)])
+        offset = _HEADER_LENGTH
+        for section in _SECTIONS:
+            header.extend((offset, len(sections[section])))
+            offset += len(sections[section])
+
+        memory = SharedMemory(name, create=True, size=8 * offset)
+        words = memory.buf.cast("q")
+        try:
+            words[:_HEADER_LENGTH] = header
+            for index, section in enumerate(_SECTIONS):
+                start = header[2 + 2 * index]
+                words[start : start + len(sections[section])] = sections[section]
+        finally:
+            words.release()
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedPlan":
+        """Map a segment created by another process."""
+        return cls(SharedMemory(name))
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    def __reduce__(self):
+        # Pickled for a spawned process: it attaches to the same segment
+        return SharedPlan.attach, (self.name,)
+
+    def close(self) -> None:
+        """Unmap the segment from this process."""
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """Free the segment once every process has closed it; owner only."""
+        if self._owner:
+            self._memory.unlink()
+
+    def _view(self, view: memoryview) -> memoryview:
+        self._views.append(view)
+        return view
+
+    def count(self, skus: SkuInput) -> dict[int, int]:
+        """Count a basket into {ordinal: quantity} for the SKUs it holds.
+
+        Raises ValueError naming the first invalid SKU and its position.
+        """
+        if self._tokenizer is not None:
+            counts: dict[int, int] = {}
+            for ordinal in self._tokenizer.tokens(skus):
+                counts[ordinal] = counts.get(ordinal, 0) + 1
+            return counts
+
+        if isinstance(skus, str):
+            if not skus.isascii():
+                position = next(i for i, sku in enumerate(skus) if not sku.isascii())
+                raise ValueError(
+                    f"Invalid SKU {skus[position]!r} at position {position}"
+                )
+            data = skus.encode("ascii")
+        else:
+            data = bytes(skus)
+        byte_ordinals = self.byte_ordinals
+        counts = {}
+        # Bytes come out in order of first appearance, so the first invalid
+        # one found is also the first in the basket
+        for byte, num_items in Counter(data).items():
+            ordinal = byte_ordinals[byte]
+            if ordinal < 0:
+                position = data.index(byte)
+                raise ValueError(f"Invalid SKU {chr(byte)!r} at position {position}")
+            counts[ordinal] = num_items
+        return counts
+
+    def price(self, counts: dict[int, int]) -> int:
+        """Run the offer pipeline over the counts from count(), consuming them."""
+        # Offers the basket takes part in, by index so they run in plan order
+        trigger_offsets = self.trigger_offsets
+        membership_offsets = self.membership_offsets
+        triggered = []
+        groups = []
+        for ordinal in counts:
+            start = trigger_offsets[ordinal]
+            end = trigger_offsets[ordinal + 1]
+            if start != end:
+                triggered.extend(self.trigger_offers[start:end])
+            start = membership_offsets[ordinal]
+            end = membership_offsets[ordinal + 1]
+            if start != end:
+                groups.extend(self.memberships[start:end])
+
+        # Free item offers
+        if triggered:
+            triggered.sort()
+            free_item_offers = self.free_item_offers
+            for index in triggered:
+                trigger, quantity, gift, gift_quantity = free_item_offers[
+                    4 * index : 4 * index + 4
+                ]
+                num_gifts = counts.get(gift)
+                if num_gifts:
+                    free_items = (counts[trigger] // quantity) * gift_quantity
+                    counts[gift] = max(0, num_gifts - free_items)
+
+        # Group offers, removing the most expensive members first
+        total_cost = 0
+        if groups:
+            group_offsets = self.group_offsets
+            for group in sorted(set(groups)):
+                members = self.group_members[
+                    group_offsets[group] : group_offsets[group + 1]
+                ]
+                quantity = self.group_quantities[group]
+                num_available = 0
+                for ordinal in members:
+                    num_available += counts.get(ordinal, 0)
+                num_offers = num_available // quantity
+                if num_offers:
+                    items_to_remove = num_offers * quantity
+                    for ordinal in members:
+                        removed = min(counts.get(ordinal, 0), items_to_remove)
+                        if removed:
+                            counts[ordinal] -= removed
+                            items_to_remove -= removed
+                            if not items_to_remove:
+                                break
+                    total_cost += num_offers * self.group_prices[group]
+
+        # Multibuy offers along each SKU's cost curve, then base prices
+        base_prices = self.base_prices
+        curve_offsets = self.curve_offsets
+        curve_costs = self.curve_costs
+        for ordinal, num_items in counts.items():
+            if num_items:
+                start = curve_offsets[ordinal]
+                size = curve_offsets[ordinal + 1] - start
+                if not size:
+                    total_cost += num_items * base_prices[ordinal]
+                elif num_items < size:
+                    total_cost += curve_costs[start + num_items]
+                else:
+                    period = self.periods[ordinal]
+                    repeats = (num_items - size) // period + 1
+                    total_cost += (
+                        curve_costs[start + num_items - repeats * period]
+                        + repeats * self.period_prices[ordinal]
+                    )
+        return total_cost
+
+    def checkout(self, skus: SkuInput) -> int:
+        """Price one basket, -1 if it holds an invalid SKU."""
+        try:
+            counts = self.count(skus)
+        except ValueError:
+            return -1
+        return self.price(counts)
+
+
+class SharedCheckoutPool:
+    """Prices baskets on worker processes forked around one SharedPlan.
+
+    The plan is compiled into shared memory once and each worker freezes the
+    heap it was forked with, so it neither copies the catalog nor has its
+    garbage collector write to the pages of the parent's objects: memory per
+    worker stays flat however large the catalog grows. The parent's own
+    garbage collector is left alone. Baskets go to the workers in batches,
+    spreading them across all cores at the cost of one round trip per batch,
+    and the totals come back in order. Where fork is not available the
+    workers attach to the segment by name instead.
+    """
+
+    def __init__(
+        self, plan: PricingPlan, workers: int | None = None, batch_size: int = 256
+    ):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.workers = workers
+        self.batch_size = batch_size
+        self._shared = SharedPlan.create(plan)
+        self._executor = self._fork()
+
+    def _fork(self) -> ProcessPoolExecutor:
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:  # pragma: no cover - platforms without fork
+            context = multiprocessing.get_context()
+        executor = ProcessPoolExecutor(
+            self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self._shared,),
+        )
+        # Forked workers all start on the first task
+        executor.submit(int).result()
+        return executor
+
+    def checkout(self, skus: SkuInput) -> int:
+        return self.checkout_many([skus])[0]
+
+    def checkout_many(self, baskets: Iterable[SkuInput]) -> list[int]:
+        """Price many baskets across the workers, -1 for each invalid one."""
+        baskets = list(baskets)
+        batches = [
+            baskets[start : start + self.batch_size]
+            for start in range(0, len(baskets), self.batch_size)
+        ]
+        totals: list[int] = []
+        for batch_totals in self._executor.map(_price_batch, batches):
+            totals.extend(batch_totals)
+        return totals
+
+    def update(self, plan: PricingPlan) -> None:
+        """Switch to a new plan.
+
+        It is compiled into a new segment and the workers are forked again
+        around it; baskets already sent finish on the old plan.
+        """
+        shared = SharedPlan.create(plan)
+        old_shared, old_executor = self._shared, self._executor
+        self._shared = shared
+        self._executor = self._fork()
+        old_executor.shutdown()
+        old_shared.close()
+        old_shared.unlink()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        self._shared.close()
+        self._shared.unlink()
+
+    def __enter__(self) -> "SharedCheckoutPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class _SharedTrie:
+    """Trie transitions read from a shared open addressing table."""
+
+    __slots__ = ("_keys", "_states", "_mask", "_shift")
+
+    def __init__(self, keys: Sequence[int], states: Sequence[int]):
+        self._keys = keys
+        self._states = states
+        self._mask = len(keys) - 1
+        self._shift = 64 - self._mask.bit_length()
+
+    def get(self, key: int, default: int | None = None) -> int | None:
+        keys = self._keys
+        if not keys:
+            return default
+        slot = ((key * _GOLDEN) & _WORD) >> self._shift
+        while True:
+            found = keys[slot]
+            if found == key:
+                return self._states[slot]
+            if found < 0:
+                return default
+            slot = (slot + 1) & self._mask
+
+
+class _WholeTokens:
+    """Looks up whole SKU codes by walking the trie, in place of a dict."""
+
+    __slots__ = ("_transitions", "_accepting")
+
+    def __init__(self, transitions: _SharedTrie, accepting: Sequence[int]):
+        self._transitions = transitions
+        self._accepting = accepting
+
+    def get(self, token: str, default: int | None = None) -> int | None:
+        state = 0
+        for char in token:
+            state = self._transitions.get(state << _CHAR_BITS | ord(char))
+            if state is None:
+                return default
+        ordinal = self._accepting[state]
+        return ordinal if ordinal >= 0 else default
+
+
+def _compile(plan: PricingPlan) -> dict[str, array]:
+    num_skus = len(plan.skus)
+    sections = {section: array("q") for section in _SECTIONS}
+    sections["base_prices"].extend(plan.base_prices)
+
+    curve_offsets = sections["curve_offsets"]
+    curve_costs = sections["curve_costs"]
+    for curve in plan.cost_curves:
+        curve_offsets.append(len(curve_costs))
+        if curve is None:
+            sections["periods"].append(0)
+            sections["period_prices"].append(0)
+        else:
+            curve_costs.extend(curve.costs)
+            sections["periods"].append(curve.period)
+            sections["period_prices"].append(curve.period_price)
+    curve_offsets.append(len(curve_costs))
+
+    triggered: list[list[int]] = [[] for _ in range(num_skus)]
+    for index, offer in enumerate(plan.free_item_offers):
+        sections["free_item_offers"].extend(offer)
+        triggered[offer[0]].append(index)
+    _csr(triggered, sections["trigger_offsets"], sections["trigger_offers"])
+
+    _csr(
+        [members for members, _, _ in plan.group_offers],
+        sections["group_offsets"],
+        sections["group_members"],
+    )
+    sections["group_quantities"].extend(
+        quantity for _, quantity, _ in plan.group_offers
+    )
+    sections["group_prices"].extend(price for _, _, price in plan.group_offers)
+    _csr(plan.group_membership, sections["membership_offsets"], sections["memberships"])
+
+    if isinstance(plan.parser, SkuParser):
+        byte_ordinals = [-1] * 256
+        for sku, ordinal in plan.ordinals.items():
+            byte_ordinals[ord(sku)] = ordinal
+        sections["byte_ordinals"].extend(byte_ordinals)
+    else:
+        transitions, accepting = plan.parser.trie()
+        capacity = 1
+        while capacity < 2 * len(transitions):
+            capacity *= 2
+        keys = [-1] * capacity if transitions else []
+        states = [-1] * len(keys)
+        shift = 64 - (capacity - 1).bit_length()
+        for key, state in transitions.items():
+            slot = ((key * _GOLDEN) & _WORD) >> shift
+            while keys[slot] >= 0:
+                slot = (slot + 1) & (capacity - 1)
+            keys[slot] = key
+            states[slot] = state
+        sections["trie_keys"].extend(keys)
+        sections["trie_states"].extend(states)
+        sections["accepting"].extend(accepting)
+    return sections
+
+
+def _csr(rows: Iterable[Iterable[int]], offsets: array, values: array) -> None:
+    for row in rows:
+        offsets.append(len(values))
+        values.extend(row)
+    offsets.append(len(values))
+
+
+# ~~~~ Worker processes
+
+_worker_plan: SharedPlan | None = None
+
+
+def _init_worker(shared: SharedPlan) -> None:
+    global _worker_plan
+    # Move everything inherited from the parent out of reach of this
+    # worker's collections, which would otherwise copy its pages
+    gc.freeze()
+    _worker_plan = shared
+
+
+def _price_batch(baskets: list[SkuInput]) -> list[int]:
+    checkout = _worker_plan.checkout
+    return [checkout(skus) for skus in baskets]
@@ -0,0 +1,91 @@
+from array import array
+from collections.abc import MutableSequence, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+
+# Below this many bytes a Counter beats the fixed cost of a numpy bincount
+BINCOUNT_MIN_BYTES = 256
+
+SkuInput = str | bytes | bytearray | memoryview
+
+
+class SkuParser:
+    """Validates and counts baskets of single-character ASCII SKUs.
+
+    Works directly on bytes through a 256-slot table mapping each byte to its
+    SKU ordinal (-1 for invalid bytes), so queue payloads never need to be
+    decoded. Counts come back as an array('q') indexed by SKU ordinal.
+    """
+
+    __slots__ = ("num_skus", "_ordinals", "_sku_bytes", "_invalid_bytes", "_zeros")
+
+    def __init__(self, skus: Sequence[str]):
+        if not self.supports(skus):
+            raise ValueError("SkuParser only handles single-character ASCII SKUs")
+        ordinals = [-1] * 256
+        for ordinal, sku in enumerate(skus):
+            ordinals[ord(sku)] = ordinal
+        self.num_skus = len(skus)
+        self._ordinals = tuple(ordinals)
+        self._sku_bytes = [ord(sku) for sku in skus]
+        self._invalid_bytes = [byte for byte in range(256) if ordinals[byte] < 0]
+        self._zeros = array("q", bytes(8 * len(skus)))
+
+    @staticmethod
+    def supports(skus: Sequence[str]) -> bool:
+        return all(len(sku) == 1 and sku.isascii() for sku in skus)
+
+    def count(self, skus: SkuInput) -> array:
+        """Count a basket into a new array indexed by SKU ordinal.
+
+        Raises ValueError naming the first invalid SKU and its position.
+        """
+        counts = self._zeros[:]
+        self.count_into(skus, counts)
+        return counts
+
+    def count_into(self, skus: SkuInput, counts: MutableSequence[int]) -> int:
+        """Count a basket into an existing buffer, overwriting its contents.
+
+        Returns the number of items in the basket.
+        """
+        if isinstance(skus, str):
+            if not skus.isascii():
+                raise self._invalid_sku(skus)
+            data: bytes | bytearray | memoryview = skus.encode("ascii")
+        elif isinstance(skus, memoryview):
+            data = skus.cast("B") if skus.format != "B" else skus
+        else:
+            data = skus
+
+        if np is not None and len(data) >= BINCOUNT_MIN_BYTES:
+            byte_counts = np.bincount(
+                np.frombuffer(data, dtype=np.uint8), minlength=256
+            )
+            if byte_counts[self._invalid_bytes].any():
+                raise self._invalid_sku(data)
+            counts[:] = array(
+                "q", byte_counts[self._sku_bytes].astype(np.int64).tobytes()
+            )
+            return len(data)
+
+        # Short baskets: one allocation-free pass that stops at the first
+        # invalid byte
+        counts[:] = self._zeros
+        ordinals = self._ordinals
+        for byte in data:
+            ordinal = ordinals[byte]
+            if ordinal < 0:
+                raise self._invalid_sku(data)
+            counts[ordinal] += 1
+        return len(data)
+
+    def _invalid_sku(self, skus: SkuInput) -> ValueError:
+        for position, sku in enumerate(skus):
+            code = ord(sku) if isinstance(sku, str) else sku
+            if code > 255 or self._ordinals[code] < 0:
+                return ValueError(f"Invalid SKU {chr(code)!r} at position {position}")
+        return ValueError("Invalid SKU")
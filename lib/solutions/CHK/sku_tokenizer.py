@@ -0,0 +1,335 @@
+import re
+from array import array
+from collections.abc import Iterable, Iterator, Mapping, MutableMapping, Sequence
+
+from solutions.CHK.sku_parser import SkuInput
+
+# Characters separating SKU codes in a delimited basket
+DELIMITERS = " \t\r\n\f\v,"
+
+_TOKEN = re.compile(r"[^\s,]+")
+
+# Trie transitions are keyed by state << _CHAR_BITS | code point
+_CHAR_BITS = 21
+
+
+class SkuTokenizer:
+    """Splits baskets of multi-character SKU codes into SKU ordinals.
+
+    Baskets may be delimited ("AB12, CD34 EF56") or concatenated
+    ("AB12CD34EF56"), or a mix of both. A delimited token that is a SKU code
+    is taken as-is; any other token is split into SKU codes by walking a trie
+    compiled from the catalog, which must give exactly one split. Each
+    position is walked at most as far as the longest SKU code, so tokenizing
+    is linear in the basket length whatever the size of the catalog, and
+    baskets are counted into sparse {ordinal: quantity} maps so nothing else
+    grows with it either.
+    """
+
+    __slots__ = ("skus", "_ordinals", "_transitions", "_accepting")
+
+    def __init__(self, skus: Sequence[str]):
+        if any(not sku or _TOKEN.fullmatch(sku) is None for sku in skus):
+            raise ValueError("SKU codes must be non-empty, without spaces or commas")
+        self.skus = tuple(skus)
+        self._ordinals = {sku: ordinal for ordinal, sku in enumerate(skus)}
+        # The trie is flattened into one dict so 100k SKU codes do not cost a
+        # dict per node
+        transitions: dict[int, int] = {}
+        accepting = [-1]
+        for ordinal, sku in enumerate(skus):
+            state = 0
+            for char in sku:
+                key = state << _CHAR_BITS | ord(char)
+                next_state = transitions.get(key)
+                if next_state is None:
+                    next_state = transitions[key] = len(accepting)
+                    accepting.append(-1)
+                state = next_state
+            accepting[state] = ordinal
+        self._transitions = transitions
+        self._accepting = array("q", accepting)
+
+    @classmethod
+    def from_trie(
+        cls,
+        transitions: Mapping[int, int],
+        accepting: Sequence[int],
+        ordinals: Mapping[str, int],
+    ) -> "SkuTokenizer":
+        """Wrap a trie compiled elsewhere, e.g. laid out in shared memory.
+
+        transitions and ordinals are only ever read with get(), so they can
+        be any lookup that behaves like a dict's get(). The SKU codes
+        themselves are not kept, and skus is empty.
+        """
+        tokenizer = cls.__new__(cls)
+        tokenizer.skus = ()
+        tokenizer._ordinals = ordinals
+        tokenizer._transitions = transitions
+        tokenizer._accepting = accepting
+        return tokenizer
+
+    def trie(self) -> tuple[Mapping[int, int], Sequence[int]]:
+        """The flattened trie: (transitions, accepting ordinal of each state).
+
+        Transitions are keyed by state << 21 | code point; a state's accepting
+        ordinal is -1 if no SKU code ends there. State 0 is the root.
+        """
+        return self._transitions, self._accepting
+
+    def count(self, skus: SkuInput) -> dict[int, int]:
+        """Count a basket into {ordinal: quantity} for the SKUs it holds."""
+        counts: dict[int, int] = {}
+        self.count_into(skus, counts)
+        return counts
+
+    def count_into(self, skus: SkuInput, counts: MutableMapping[int, int]) -> int:
+        """Count a basket into an existing map, replacing its contents.
+
+        Returns the number of items in the basket. Raises ValueError naming
+        the first unknown or ambiguous token and its position.
+        """
+        counts.clear()
+        num_items = 0
+        for ordinal in self.tokens(skus):
+            counts[ordinal] = counts.get(ordinal, 0) + 1
+            num_items += 1
+        return num_items
+
+    def count_chunks(
+        self, chunks: Iterable[str], counts: MutableMapping[int, int]
+    ) -> int:
+        """Count a basket read as chunks of text, adding to the counts.
+
+        Tokens may straddle chunks. Tokens within a chunk are counted as by
+        tokens(); one running on into the next chunk is split as it arrives,
+        holding over only its last characters, fewer than the longest SKU
+        code, and the counts of the splits still in play. Returns the number
+        of items. Raises ValueError like count().
+        """
+        num_items = 0
+        run = None
+        offset = 0
+        ordinals = self._ordinals
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if run is not None and _TOKEN.match(chunk) is None:
+                # The chunk starts with a delimiter: the token ended with
+                # the last chunk
+                num_items += run.finish(counts)
+                run = None
+            for match in _TOKEN.finditer(chunk):
+                if run is None and match.end() == len(chunk):
+                    run = _TokenRun(self, offset + match.start())
+                if run is not None:
+                    run.feed(match.group(), counts)
+                    if match.end() < len(chunk):
+                        num_items += run.finish(counts)
+                        run = None
+                    continue
+                ordinal = ordinals.get(match.group())
+                if ordinal is not None:
+                    split = [ordinal]
+                else:
+                    split = self._split(chunk, match.start(), match.end())
+                for ordinal in split:
+                    counts[ordinal] = counts.get(ordinal, 0) + 1
+                num_items += len(split)
+            offset += len(chunk)
+        if run is not None:
+            num_items += run.finish(counts)
+        return num_items
+
+    def tokens(self, skus: SkuInput) -> Iterator[int]:
+        """Yield the ordinal of every SKU in the basket, in order."""
+        if not isinstance(skus, str):
+            skus = bytes(skus).decode("utf-8")
+        ordinals = self._ordinals
+        for match in _TOKEN.finditer(skus):
+            ordinal = ordinals.get(match.group())
+            if ordinal is not None:
+                yield ordinal
+            else:
+                yield from self._split(skus, match.start(), match.end())
+
+    def _split(self, text: str, start: int, end: int) -> list[int]:
+        # ways[i] counts the splits of text[start:start + i], capped at 2;
+        # last[i] is the final SKU and previous[i] the start of it for one of
+        # those splits
+        length = end - start
+        ways = bytearray(length + 1)
+        ways[0] = 1
+        last = [-1] * (length + 1)
+        previous = [0] * (length + 1)
+        furthest = 0
+        for offset in range(length):
+            if not ways[offset]:
+                continue
+            furthest = offset
+            for end_offset, ordinal in self._matches(text, start + offset, end):
+                end_offset -= start
+                if not ways[end_offset]:
+                    last[end_offset] = ordinal
+                    previous[end_offset] = offset
+                ways[end_offset] = min(2, ways[end_offset] + ways[offset])
+
+        if not ways[length]:
+            position = start + furthest
+            raise ValueError(
+                f"Invalid SKU {text[position:end]!r} at position {position}"
+            )
+        if ways[length] > 1:
+            position = start + self._first_ambiguity(text, start, end, ways)
+            raise ValueError(
+                f"Ambiguous SKUs {text[start:position]!r} at position {start}: "
+                "they split into SKU codes more than one way"
+            )
+
+        split = []
+        offset = length
+        while offset:
+            split.append(last[offset])
+            offset = previous[offset]
+        split.reverse()
+        return split
+
+    def _matches(self, text: str, start: int, end: int) -> Iterator[tuple[int, int]]:
+        """Yield (end, ordinal) for every SKU code text[start:end] begins with."""
+        transitions = self._transitions
+        accepting = self._accepting
+        state = 0
+        for position in range(start, end):
+            state = transitions.get(state << _CHAR_BITS | ord(text[position]))
+            if state is None:
+                return
+            if accepting[state] >= 0:
+                yield position + 1, accepting[state]
+
+    def _first_ambiguity(self, text: str, start: int, end: int, ways: bytearray) -> int:
+        # The first offset reached more than one way that can still be split
+        # through to the end of the token
+        length = end - start
+        finishes = bytearray(length + 1)
+        finishes[length] = 1
+        for offset in range(length - 1, -1, -1):
+            finishes[offset] = any(
+                finishes[end_offset - start]
+                for end_offset, _ in self._matches(text, start + offset, end)
+            )
+        return next(
+            offset
+            for offset in range(length + 1)
+            if ways[offset] > 1 and finishes[offset]
+        )
+
+
+class _TokenRun:
+    """A token read in pieces, split into SKU codes as it arrives.
+
+    Works as SkuTokenizer._split(), reaching forward from each offset with a
+    way there, but only once no longer SKU code can start there: until the
+    trie walk from an offset stops short of the text received, it and every
+    offset after it wait for more. The text held is thus shorter than the
+    longest SKU code. Each split in play carries its counts since the last
+    offset every split went through, and they are flushed there.
+    """
+
+    __slots__ = ("tokenizer", "start", "text", "base", "ways", "pending", "furthest")
+
+    def __init__(self, tokenizer: SkuTokenizer, start: int):
+        self.tokenizer = tokenizer
+        # Stream offset of the token
+        self.start = start
+        # The token from stream offset base on
+        self.text = ""
+        self.base = start
+        # Stream offset -> [ways there capped at 2, counts of the split that
+        # got there or None once there is more than one]
+        self.ways: dict[int, list] = {start: [1, {}]}
+        # Items flushed so far
+        self.pending = 0
+        self.furthest = start
+
+    def feed(self, piece: str, counts: MutableMapping[int, int]) -> None:
+        self.text += piece
+        self._advance(False, counts)
+
+    def finish(self, counts: MutableMapping[int, int]) -> int:
+        """Split what is left of the token and return its number of items."""
+        if self.base == self.start:
+            ordinal = self.tokenizer._ordinals.get(self.text)
+            if ordinal is not None:
+                # A whole token that is a SKU code is taken as-is
+                counts[ordinal] = counts.get(ordinal, 0) + 1
+                return 1
+        self._advance(True, counts)
+        ((num_ways, split),) = self.ways.values()
+        if num_ways > 1:
+            raise ValueError(
+                f"Ambiguous SKUs at position {self.start}: "
+                "they split into SKU codes more than one way"
+            )
+        _add(counts, split)
+        return self.pending + sum(split.values())
+
+    def _advance(self, final: bool, counts: MutableMapping[int, int]) -> None:
+        transitions = self.tokenizer._transitions
+        accepting = self.tokenizer._accepting
+        text = self.text
+        base = self.base
+        end = base + len(text)
+        ways = self.ways
+        while ways:
+            offset = min(ways)
+            if offset == end:
+                break
+            matches = []
+            state = 0
+            for position in range(offset - base, len(text)):
+                state = transitions.get(state << _CHAR_BITS | ord(text[position]))
+                if state is None:
+                    break
+                if accepting[state] >= 0:
+                    matches.append((base + position + 1, accepting[state]))
+            else:
+                if not final:
+                    # A longer SKU code may yet start here
+                    break
+
+            num_ways, split = ways.pop(offset)
+            self.furthest = offset
+            for index, (match_end, ordinal) in enumerate(matches):
+                reached = ways.get(match_end)
+                if reached is not None:
+                    reached[0] = 2
+                    reached[1] = None
+                elif split is None:
+                    ways[match_end] = [2, None]
+                else:
+                    # The last match can take over the split itself
+                    reached = split if index == len(matches) - 1 else dict(split)
+                    reached[ordinal] = reached.get(ordinal, 0) + 1
+                    ways[match_end] = [1, reached]
+            if len(ways) == 1:
+                # Every split goes through the one offset left: what came
+                # before it is settled
+                (reached,) = ways.values()
+                if reached[1]:
+                    _add(counts, reached[1])
+                    self.pending += sum(reached[1].values())
+                    reached[1] = {}
+
+        if not ways:
+            position = self.furthest
+            raise ValueError(
+                f"Invalid SKU {text[position - base :]!r} at position {position}"
+            )
+        self.base = min(ways)
+        self.text = text[self.base - base :]
+
+
+def _add(counts: MutableMapping[int, int], split: Mapping[int, int]) -> None:
+    for ordinal, quantity in split.items():
+        counts[ordinal] = counts.get(ordinal, 0) + quantity
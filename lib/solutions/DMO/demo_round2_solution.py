@@ -1,11 +1,15 @@
+from solutions.DMO.numeric_kernels import Numbers, array_sum, filter_pass
+
 
 class DemoRound2Solution:
-    
-    def array_sum(self, list_of_integers):
-        raise NotImplementedError()
-    
-    def int_range(self, start, end):
-        raise NotImplementedError()
-    
-    def filter_pass(self, list_of_integers, threshold):
-        raise NotImplementedError()
+
+    def array_sum(self, list_of_integers: Numbers) -> int | float:
+        return array_sum(list_of_integers)
+
+    def int_range(self, start: int, end: int) -> range:
+        # A range knows its length and holds no elements; callers that need
+        # a list, e.g. to send it as JSON, build one
+        return range(start, end)
+
+    def filter_pass(self, list_of_integers: Numbers, threshold: int) -> Numbers:
+        return filter_pass(list_of_integers, threshold)
@@ -1,12 +1,20 @@
+from typing import Any
+
+from solutions.DMO.inventory_item import InventoryItem
+from solutions.DMO.inventory_store import InventoryStore
+
 
 class DemoRound3Solution:
-    
-    def inventory_add(self, inventory_item, number):
-        raise NotImplementedError()
-    
-    def inventory_size(self):
-        raise NotImplementedError()
-
-    def inventory_get(self, item_sku):
-        raise NotImplementedError()
-        
\ No newline at end of file
+    def __init__(self, store: InventoryStore | None = None):
+        # Pass a store opened on a log file to keep the inventory across restarts
+        self.store = store if store is not None else InventoryStore()
+
+    def inventory_add(self, inventory_item: InventoryItem, number: int) -> None:
+        self.store.add(inventory_item, number)
+
+    def inventory_size(self) -> int:
+        return self.store.size
+
+    def inventory_get(self, item_sku: str) -> dict[str, Any] | None:
+        record = self.store.get(item_sku)
+        return None if record is None else record.as_dict()
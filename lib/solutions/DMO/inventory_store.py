@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+from typing import Any
+
+from solutions.DMO.inventory_item import InventoryItem
+
+
+class InventoryRecord:
+    """One SKU in stock: the item's fields plus how many units are held."""
+
+    __slots__ = ("sku", "name", "price", "quantity", "_projection")
+
+    def __init__(self, sku: str, name: str, price: int, quantity: int = 0):
+        self.sku = sku
+        self.name = name
+        self.price = price
+        self.quantity = quantity
+        self._projection: dict[str, Any] | None = None
+
+    def as_dict(self) -> dict[str, Any]:
+        """The item as a dict, built once and shared: do not mutate it."""
+        projection = self._projection
+        if projection is None:
+            projection = self._projection = {
+                "sku": self.sku,
+                "name": self.name,
+                "price": self.price,
+            }
+        return projection
+
+    def __repr__(self) -> str:
+        return (
+            f"InventoryRecord(sku={self.sku!r}, name={self.name!r}, "
+            f"price={self.price!r}, quantity={self.quantity!r})"
+        )
+
+
+class InventoryStore:
+    """Items indexed by SKU, with the total number of units kept up to date.
+
+    Given a log_path, every add is appended to that file as a JSON array
+    [sku, name, price, number] and the file is replayed when the store is
+    opened, so the inventory survives restarts. A line torn by a crash is
+    dropped on replay. compact() rewrites the log with one line per SKU.
+    """
+
+    def __init__(self, log_path: str | os.PathLike | None = None):
+        self._records: dict[str, InventoryRecord] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self.log_path = log_path
+        self._log = None
+        if log_path is not None:
+            self._replay(log_path)
+            self._log = open(log_path, "a", encoding="utf-8")
+
+    def add(self, item: InventoryItem, number: int) -> InventoryRecord:
+        """Add number units of item, updating its name and price if they changed."""
+        with self._lock:
+            record = self._apply(item.sku, item.name, item.price, number)
+            if self._log is not None:
+                self._log.write(_log_line(item.sku, item.name, item.price, number))
+                self._log.flush()
+        return record
+
+    def get(self, sku: str) -> InventoryRecord | None:
+        return self._records.get(sku)
+
+    @property
+    def size(self) -> int:
+        """Units in stock across every SKU."""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, sku: object) -> bool:
+        return sku in self._records
+
+    def compact(self) -> None:
+        """Rewrite the log as one add per SKU holding its current quantity."""
+        if self._log is None:
+            return
+        with self._lock:
+            temporary_path = f"{self.log_path}.compact"
+            with open(temporary_path, "w", encoding="utf-8") as compacted:
+                compacted.writelines(
+                    _log_line(record.sku, record.name, record.price, record.quantity)
+                    for record in self._records.values()
+                )
+            self._log.close()
+            os.replace(temporary_path, self.log_path)
+            self._log = open(self.log_path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def __enter__(self) -> "InventoryStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _apply(self, sku: str, name: str, price: int, number: int) -> InventoryRecord:
+        record = self._records.get(sku)
+        if record is None:
+            record = self._records[sku] = InventoryRecord(sku, name, price)
+        elif record.name != name or record.price != price:
+            record.name = name
+            record.price = price
+            record._projection = None
+        record.quantity += number
+        self._size += number
+        return record
+
+    def _replay(self, log_path: str | os.PathLike) -> None:
+        try:
+            with open(log_path, "rb") as log:
+                data = log.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            # The last add never finished: forget it, as the caller never heard back
+            with open(log_path, "r+b") as log:
+                log.truncate(end)
+        if not end:
+            return
+        # One parse over the whole log is far faster than one per line
+        try:
+            adds = json.loads(b"[" + data[: end - 1].replace(b"\n", b",") + b"]")
+        except ValueError:
+            adds = [
+                _parse_line(log_path, number, line)
+                for number, line in enumerate(data[:end].splitlines(), 1)
+            ]
+        # _apply inlined, as this loop runs once per add ever logged
+        records = self._records
+        size = 0
+        for sku, name, price, number in adds:
+            record = records.get(sku)
+            if record is None:
+                records[sku] = InventoryRecord(sku, name, price, number)
+            else:
+                if record.name != name or record.price != price:
+                    record.name = name
+                    record.price = price
+                    record._projection = None
+                record.quantity += number
+            size += number
+        self._size += size
+
+
+def _log_line(sku: str, name: str, price: int, number: int) -> str:
+    return json.dumps([sku, name, price, number], separators=(",", ":")) + "\n"
+
+
+def _parse_line(log_path, number: int, line: bytes) -> list:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        raise ValueError(
+            f"Corrupt inventory log {log_path}, line {number}: {e}"
+        ) from None
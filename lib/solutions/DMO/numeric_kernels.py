@@ -0,0 +1,121 @@
+from array import array
+from collections.abc import Sequence
+from typing import Union
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+
+# Elements filtered per step into an array.array, bounding the temporary
+# list or ndarray to CHUNK_SIZE elements whatever the size of the input
+CHUNK_SIZE = 1 << 20
+
+_INT64_LIMIT = 1 << 63
+
+# array typecodes numpy can view without copying
+_NUMPY_TYPECODES = {
+    "b": "i1",
+    "B": "u1",
+    "h": "i2",
+    "H": "u2",
+    "i": "i4",
+    "I": "u4",
+    "l": "i8" if array("l").itemsize == 8 else "i4",
+    "L": "u8" if array("L").itemsize == 8 else "u4",
+    "q": "i8",
+    "Q": "u8",
+    "f": "f4",
+    "d": "f8",
+}
+
+# Numbers as decoded from JSON, an array.array or a numpy array
+Numbers = Union[Sequence[int], array, "np.ndarray"]
+
+
+def array_sum(values: Numbers) -> int | float:
+    """Sum values exactly, however large the total."""
+    if isinstance(values, (list, tuple)):
+        # Python ints never overflow, and turning a list into an ndarray
+        # costs more than summing it
+        return sum(values)
+    vector = _as_ndarray(values)
+    if vector is None:
+        return sum(values)
+    if vector.dtype.kind in "iub":
+        return _exact_sum(vector)
+    if vector.dtype.kind == "f":
+        return float(vector.sum())
+    return sum(vector.tolist())
+
+
+def filter_pass(values: Numbers, threshold: int | float) -> Numbers:
+    """The values at or above threshold, in order.
+
+    Arrays and ndarrays come back as the same kind of array, anything else
+    as a list.
+    """
+    if isinstance(values, (list, tuple)):
+        # As for array_sum: a list comprehension beats any conversion
+        return [value for value in values if value >= threshold]
+    vector = _as_ndarray(values)
+    if vector is None:
+        if isinstance(values, array):
+            passed = array(values.typecode)
+            for start in range(0, len(values), CHUNK_SIZE):
+                chunk = values[start : start + CHUNK_SIZE]
+                passed.extend([value for value in chunk if value >= threshold])
+            return passed
+        return [value for value in values if value >= threshold]
+    if vector.dtype == object:
+        return np.array(
+            [value for value in vector.tolist() if value >= threshold], dtype=object
+        )
+    # One boolean mask, a byte per element, is all the working memory
+    mask = vector >= threshold
+    if not isinstance(values, array):
+        return vector[mask]
+    # Select straight into the array handed back, a chunk at a time, rather
+    # than into an ndarray as large that would then be copied
+    count = int(mask.sum())
+    passed = array(values.typecode, [0]) * count
+    if not count:
+        return passed
+    out = np.frombuffer(passed, dtype=vector.dtype)
+    filled = 0
+    for start in range(0, len(vector), CHUNK_SIZE):
+        chunk = vector[start : start + CHUNK_SIZE][mask[start : start + CHUNK_SIZE]]
+        out[filled : filled + len(chunk)] = chunk
+        filled += len(chunk)
+    return passed
+
+
+def _as_ndarray(values: Numbers):
+    """A numpy view of values, or None without numpy or for other sequences."""
+    if np is None:
+        return None
+    if isinstance(values, np.ndarray):
+        return values.ravel()
+    if isinstance(values, array) and values.typecode in _NUMPY_TYPECODES:
+        return np.frombuffer(values, dtype=_NUMPY_TYPECODES[values.typecode])
+    return None
+
+
+def _exact_sum(vector) -> int:
+    if not len(vector):
+        return 0
+    largest = max(abs(int(vector.min())), abs(int(vector.max())))
+    if not largest:
+        return 0
+    # Sum in int64 chunks short enough that no chunk can overflow, and add
+    # the chunk totals as Python ints
+    chunk_size = (_INT64_LIMIT - 1) // largest
+    if not chunk_size:
+        # Values of 2**63 and over, only possible in uint64
+        return sum(vector.tolist())
+    if chunk_size >= len(vector):
+        return int(vector.sum(dtype=np.int64))
+    return sum(
+        int(vector[start : start + chunk_size].sum(dtype=np.int64))
+        for start in range(0, len(vector), chunk_size)
+    )
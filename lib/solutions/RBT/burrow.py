@@ -0,0 +1,143 @@
+import re
+from array import array
+from typing import Any
+
+from pydantic import BaseModel, Field
+
+UP, DOWN, LEFT, RIGHT = b"UDLR"
+
+_INVALID_MOVE = re.compile(r"[^UDLR]")
+
+# Rendered rows are kept for this many different rendering options
+_RENDER_CACHE_SIZE = 8
+
+
+class RenderingOptions(BaseModel, frozen=True):
+    # Options this version does not know are ignored rather than rejected
+
+    earth: str = Field("#", min_length=1, max_length=1)
+    tunnel: str = Field(" ", min_length=1, max_length=1)
+    # None leaves the rabbit out of the drawing
+    rabbit: str | None = Field("R", min_length=1, max_length=1)
+
+
+class _RenderedRows:
+    __slots__ = ("rows", "generation", "table")
+
+    def __init__(self, rows: int, table: dict[int, str]):
+        self.rows: list[str | None] = [None] * rows
+        # Rows dug after this generation are drawn again
+        self.generation = -1
+        self.table = table
+
+
+class Burrow:
+    """A grid of earth that a rabbit digs tunnels through.
+
+    The rabbit starts in the top left cell, already dug, and each move in
+    U, D, L or R digs one cell further. Moves into the edge of the grid are
+    ignored. Cells are one byte each in a bytearray, 1 once dug.
+
+    Every row remembers the last dig that changed it, so render() only draws
+    the rows dug since the same options were last rendered.
+    """
+
+    __slots__ = (
+        "rows",
+        "columns",
+        "cells",
+        "rabbit",
+        "_generation",
+        "_dug_at",
+        "_rendered",
+    )
+
+    def __init__(self, rows: int, columns: int):
+        if rows < 1 or columns < 1:
+            raise ValueError(f"A burrow needs at least one cell, not {rows}x{columns}")
+        self.rows = rows
+        self.columns = columns
+        self.cells = bytearray(rows * columns)
+        self.cells[0] = 1
+        # (row, column) of the rabbit
+        self.rabbit = (0, 0)
+        self._generation = 0
+        self._dug_at = array("q", [0]) * rows
+        self._rendered: dict[RenderingOptions, _RenderedRows] = {}
+
+    def dig(self, moves: str) -> None:
+        """Follow moves, a string of U, D, L and R, digging as the rabbit goes."""
+        invalid = _INVALID_MOVE.search(moves)
+        if invalid:
+            raise ValueError(
+                f"Invalid move {invalid.group()!r} at position {invalid.start()}"
+            )
+        self._generation += 1
+        generation = self._generation
+        cells = self.cells
+        dug_at = self._dug_at
+        columns = self.columns
+        last_row = self.rows - 1
+        last_column = columns - 1
+        row, column = self.rabbit
+        cell = row * columns + column
+        # Moves are all ASCII: iterating the bytes yields cached small ints
+        for move in moves.encode("ascii"):
+            if move == RIGHT:
+                if column == last_column:
+                    continue
+                column += 1
+                cell += 1
+            elif move == LEFT:
+                if not column:
+                    continue
+                column -= 1
+                cell -= 1
+            elif move == DOWN:
+                if row == last_row:
+                    continue
+                row += 1
+                cell += columns
+            else:
+                if not row:
+                    continue
+                row -= 1
+                cell -= columns
+            if not cells[cell]:
+                cells[cell] = 1
+                dug_at[row] = generation
+        self.rabbit = (row, column)
+
+    def render(self, options: RenderingOptions | dict[str, Any] | None = None) -> str:
+        """Draw the burrow one character per cell, a line per row."""
+        if not isinstance(options, RenderingOptions):
+            options = RenderingOptions.model_validate(options or {})
+        rendered = self._rendered.pop(options, None)
+        if rendered is None:
+            if len(self._rendered) >= _RENDER_CACHE_SIZE:
+                # Forget the least recently rendered options
+                del self._rendered[next(iter(self._rendered))]
+            rendered = _RenderedRows(self.rows, {0: options.earth, 1: options.tunnel})
+        self._rendered[options] = rendered
+
+        lines = rendered.rows
+        since = rendered.generation
+        cells = self.cells
+        columns = self.columns
+        table = rendered.table
+        for row, dug_at in enumerate(self._dug_at):
+            if dug_at > since or lines[row] is None:
+                start = row * columns
+                lines[row] = (
+                    cells[start : start + columns].decode("latin-1").translate(table)
+                )
+        rendered.generation = self._generation
+
+        if options.rabbit is None:
+            return "\n".join(lines)
+        # The rabbit moves on every dig, so it is drawn over a copy of its row
+        row, column = self.rabbit
+        line = lines[row]
+        drawing = lines[:]
+        drawing[row] = line[:column] + options.rabbit + line[column + 1 :]
+        return "\n".join(drawing)
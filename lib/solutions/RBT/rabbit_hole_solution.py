@@ -1,5 +1,29 @@
+import threading
+
+from solutions.RBT.burrow import Burrow
+
 
 class RabbitHoleSolution:
+    def __init__(self):
+        # The last burrow dug, so that a request continuing the previous
+        # one's moves only digs, and draws, what is new
+        self._burrow = None
+        self._moves = ""
+        self._lock = threading.Lock()
 
     def rabbit_hole(self, rows, columns, digging_moves, rendering_options):
-        raise NotImplementedError()
+        # digging_moves = a string of U, D, L and R, or a list of them
+        if not isinstance(digging_moves, str):
+            digging_moves = "".join(digging_moves)
+        with self._lock:
+            burrow = self._burrow
+            if (
+                burrow is None
+                or (burrow.rows, burrow.columns) != (rows, columns)
+                or not digging_moves.startswith(self._moves)
+            ):
+                burrow = Burrow(rows, columns)
+                self._burrow, self._moves = None, ""
+            burrow.dig(digging_moves[len(self._moves) :])
+            self._burrow, self._moves = burrow, digging_moves
+            return burrow.render(rendering_options)
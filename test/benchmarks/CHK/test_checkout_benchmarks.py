@@ -0,0 +1,327 @@
+"""Throughput and latency benchmarks for the CHK pricing engine.
+
+Under pytest the quick self-checks at the bottom of this file run, along with
+a regression gate marked "benchmark": the small GATE_SIZES baskets against
+the committed baseline.json, within GATE_TOLERANCE. Deselect it with
+-m "not benchmark". The full sweep, over basket sizes from 1 to 10^6, runs
+from the command line:
+
+    PYTHONPATH=lib python test/benchmarks/CHK/test_checkout_benchmarks.py \\
+        --output results.json --baseline baseline.json
+
+--save-baseline stores the results as the new baseline instead. A benchmark
+slower per call than its baseline by more than --tolerance fails the run with
+exit status 1. Baselines only mean something on the machine that made them;
+refresh the committed one, for the gate sizes, with:
+
+    PYTHONPATH=lib python test/benchmarks/CHK/test_checkout_benchmarks.py \\
+        --sizes 1 1000 --baseline test/benchmarks/CHK/baseline.json \\
+        --save-baseline --output /dev/null
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from collections.abc import Callable, Sequence
+from pathlib import Path
+from typing import NamedTuple
+
+import pytest
+
+from solutions.CHK.checkout_solution import (
+    DEFAULT_BASE_PRICES,
+    DEFAULT_FREE_ITEM_OFFERS,
+    DEFAULT_GROUP_DISCOUNT_OFFERS,
+    DEFAULT_MULTIBUY_OFFERS,
+    CheckoutSolution,
+)
+
+SIZES = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+SEED = 20240101
+
+# The regression gate run under pytest: a baseline for these sizes is
+# committed next to this file, and a benchmark may be up to twice as slow,
+# since the gate's shorter runs are noisier and machines differ
+BASELINE = Path(__file__).with_name("baseline.json")
+GATE_SIZES = (1, 1_000)
+GATE_TOLERANCE = 1.0
+
+
+class BasketProfile(NamedTuple):
+    name: str
+    # Zipf exponent of SKU popularity, 0 for uniform
+    skew: float = 0.0
+    # Draw only SKUs that take part in some offer
+    offer_heavy: bool = False
+    # Fraction of characters that are not SKUs; any rate above 0 makes
+    # every basket invalid
+    invalid_rate: float = 0.0
+
+
+PROFILES = (
+    BasketProfile("uniform"),
+    BasketProfile("skewed", skew=1.2),
+    BasketProfile("offer_heavy", offer_heavy=True),
+    BasketProfile("invalid", invalid_rate=0.01),
+)
+
+
+def offer_skus() -> list[str]:
+    skus = {offer.sku for offer in DEFAULT_FREE_ITEM_OFFERS}
+    skus |= {offer.gift_sku for offer in DEFAULT_FREE_ITEM_OFFERS}
+    skus |= set(DEFAULT_MULTIBUY_OFFERS)
+    skus |= {sku for offer in DEFAULT_GROUP_DISCOUNT_OFFERS for sku in offer.skus}
+    return sorted(skus)
+
+
+def generate_basket(profile: BasketProfile, size: int, rng: random.Random) -> str:
+    """Draw a basket of size characters following the profile."""
+    skus = offer_skus() if profile.offer_heavy else sorted(DEFAULT_BASE_PRICES)
+    weights = [1 / rank**profile.skew for rank in range(1, len(skus) + 1)]
+    basket = rng.choices(skus, weights, k=size)
+    if profile.invalid_rate and size:
+        # At least one invalid character, so even tiny baskets are invalid
+        invalid = [rng.randrange(size)]
+        invalid += [
+            position for position in range(size) if rng.random() < profile.invalid_rate
+        ]
+        for position in invalid:
+            basket[position] = rng.choice("abc123-")
+    return "".join(basket)
+
+
+def generate_baskets(
+    sizes: Sequence[int] = SIZES,
+    profiles: Sequence[BasketProfile] = PROFILES,
+    seed: int = SEED,
+) -> dict[tuple[str, int], str]:
+    """One basket per profile and size, the same for the same seed."""
+    rng = random.Random(seed)
+    return {
+        (profile.name, size): generate_basket(profile, size, rng)
+        for profile in profiles
+        for size in sizes
+    }
+
+
+def benchmarks(skus: str) -> dict[str, Callable[[], object]]:
+    """Checkout and each stage of its pricing pipeline, on one basket.
+
+    The stages are the PricingPlan calls checkout() makes without a solver
+    budget. Stages that update the counts in place get a fresh copy of them
+    every call, so their timings include copying the count buffer.
+    """
+    solution = CheckoutSolution()
+    plan = solution.pricing_plan
+    calls: dict[str, Callable[[], object]] = {
+        "checkout": lambda: solution.checkout(skus)
+    }
+    counts = plan.new_counts()
+    try:
+        plan.count_into(skus, counts)
+    except ValueError:
+        # Invalid baskets stop at parsing, so only checkout is measured
+        return calls
+    freed = counts.__copy__()
+    plan.apply_free_item_offers(freed)
+    grouped = freed.__copy__()
+    plan.apply_group_offers(grouped)
+
+    buffer = plan.new_counts()
+    calls["count_into"] = lambda: plan.count_into(skus, buffer)
+    calls["apply_free_item_offers"] = lambda: plan.apply_free_item_offers(
+        counts.__copy__()
+    )
+    calls["apply_group_offers"] = lambda: plan.apply_group_offers(freed.__copy__())
+    calls["multibuy_cost"] = lambda: plan.multibuy_cost(grouped)
+    return calls
+
+
+def measure(
+    call: Callable[[], object], min_time: float, repeat: int
+) -> tuple[float, int]:
+    """Best seconds per call over repeat runs of at least min_time each."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best, number
+
+
+def run_benchmarks(
+    sizes: Sequence[int] = SIZES,
+    profiles: Sequence[BasketProfile] = PROFILES,
+    seed: int = SEED,
+    min_time: float = 0.2,
+    repeat: int = 5,
+) -> dict:
+    """Time every benchmark on every basket, keyed benchmark/profile/size."""
+    results = {}
+    for (profile, size), skus in generate_baskets(sizes, profiles, seed).items():
+        for name, call in benchmarks(skus).items():
+            seconds, number = measure(call, min_time, repeat)
+            results[f"{name}/{profile}/{size}"] = {
+                "ns_per_call": round(seconds * 1e9, 1),
+                "items_per_second": round(size / seconds),
+                "calls": number,
+            }
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def find_regressions(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Describe every benchmark slower than its baseline beyond tolerance."""
+    regressions = []
+    for key, result in report["results"].items():
+        expected = baseline["results"].get(key)
+        if expected is None:
+            continue
+        limit = expected["ns_per_call"] * (1 + tolerance)
+        if result["ns_per_call"] > limit:
+            regressions.append(
+                f"{key}: {result['ns_per_call']:.0f} ns per call, baseline "
+                f"{expected['ns_per_call']:.0f} ns (limit {limit:.0f} ns)"
+            )
+    return regressions
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        choices=[profile.name for profile in PROFILES],
+        default=[profile.name for profile in PROFILES],
+    )
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="write the results to --baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown per call, as a fraction of the baseline",
+    )
+    args = parser.parse_args(argv)
+
+    profiles = [profile for profile in PROFILES if profile.name in args.profiles]
+    report = run_benchmarks(args.sizes, profiles, args.seed, args.min_time, args.repeat)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            baseline_file.write(output + "\n")
+    elif args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = find_regressions(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+class TestBasketGenerator:
+    def test_same_seed_gives_same_baskets(self):
+        assert generate_baskets((10, 100), seed=1) == generate_baskets(
+            (10, 100), seed=1
+        )
+        assert generate_baskets((100,), seed=1) != generate_baskets((100,), seed=2)
+
+    def test_profiles_shape_baskets(self):
+        baskets = generate_baskets((10_000,))
+        assert all(len(basket) == 10_000 for basket in baskets.values())
+        assert set(baskets["offer_heavy", 10_000]) <= set(offer_skus())
+        assert set(baskets["uniform", 10_000]) <= set(DEFAULT_BASE_PRICES)
+        assert not set(baskets["invalid", 10_000]) <= set(DEFAULT_BASE_PRICES)
+        skewed = baskets["skewed", 10_000]
+        assert skewed.count("A") > 5 * skewed.count("Z")
+
+
+class TestBenchmarkGate:
+    @staticmethod
+    def quick_report():
+        return run_benchmarks(sizes=(1, 10), min_time=0.001, repeat=1)
+
+    def test_reports_every_stage(self):
+        results = self.quick_report()["results"]
+        assert "checkout/invalid/10" in results
+        assert "count_into/invalid/10" not in results
+        for stage in benchmarks("A"):
+            assert f"{stage}/uniform/10" in results
+        assert all(result["ns_per_call"] > 0 for result in results.values())
+
+    def test_flags_regression_beyond_tolerance(self):
+        report = self.quick_report()
+        assert find_regressions(report, report, tolerance=0.0) == []
+        faster = {
+            "results": {
+                key: {**result, "ns_per_call": result["ns_per_call"] / 2}
+                for key, result in report["results"].items()
+            }
+        }
+        assert len(find_regressions(report, faster, tolerance=0.5)) == len(
+            report["results"]
+        )
+        assert find_regressions(report, faster, tolerance=1.5) == []
+
+    def test_main_fails_on_regression(self, tmp_path):
+        baseline = tmp_path / "baseline.json"
+        args = ["--sizes", "1", "--profiles", "uniform", "--min-time", "0.001"]
+        args += ["--repeat", "1", "--output", str(tmp_path / "results.json")]
+        assert main(args + ["--baseline", str(baseline), "--save-baseline"]) == 0
+        assert main(args + ["--baseline", str(baseline), "--tolerance", "100"]) == 0
+
+        report = json.loads(baseline.read_text())
+        for result in report["results"].values():
+            result["ns_per_call"] = 0.001
+        baseline.write_text(json.dumps(report))
+        assert main(args + ["--baseline", str(baseline)]) == 1
+
+    def test_baseline_covers_the_gate(self):
+        baseline = json.loads(BASELINE.read_text())["results"]
+        for (profile, size), skus in generate_baskets(GATE_SIZES).items():
+            for name in benchmarks(skus):
+                assert f"{name}/{profile}/{size}" in baseline
+
+    @pytest.mark.benchmark
+    def test_no_regression_against_baseline(self):
+        baseline = json.loads(BASELINE.read_text())
+        report = run_benchmarks(GATE_SIZES, min_time=0.02, repeat=3)
+        assert find_regressions(report, baseline, GATE_TOLERANCE) == []
+
+
+if __name__ == "__main__":
+    sys.exit(main())
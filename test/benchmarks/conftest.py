@@ -0,0 +1,6 @@
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "benchmark: timing gate against a committed baseline, "
+        "deselect with -m 'not benchmark'",
+    )
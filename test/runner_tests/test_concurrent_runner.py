@@ -0,0 +1,183 @@
+import threading
+import time
+
+import pytest
+from runner.concurrent_runner import (
+    ConcurrentImplementationRunnerBuilder,
+    OrderedDispatcher,
+)
+from tdl.queue.abstractions.request import Request
+from tdl.queue.processing_rules import ProcessingRules
+
+
+class FakeAudit:
+    def __init__(self):
+        self.lines = []
+        self._line = []
+
+    def start_line(self):
+        self._line = []
+
+    def log_request(self, request):
+        self._line.append(request.id)
+
+    def log_response(self, response):
+        self._line.append(response.result)
+
+    def end_line(self):
+        self.lines.append(tuple(self._line))
+
+
+class FakeBroker:
+    def __init__(self):
+        self.published = []
+        self.stopped = False
+
+    def respond_to(self, headers, response):
+        self.published.append((headers["message-id"], response.id, response.result))
+
+    def stop(self):
+        self.stopped = True
+
+
+class SlowEntryPoints:
+    """Entry points whose first argument is how long to take, in seconds."""
+
+    def echo(self, delay, value):
+        time.sleep(delay)
+        return value
+
+    def fail(self, delay):
+        time.sleep(delay)
+        raise ValueError("boom")
+
+
+def rules_for(entry_points):
+    rules = ProcessingRules()
+    rules.on("echo").call(entry_points.echo).build()
+    rules.on("fail").call(entry_points.fail).build()
+    return rules
+
+
+def dispatch(dispatcher, requests):
+    broker = FakeBroker()
+    for number, (method, params) in enumerate(requests):
+        headers = {"message-id": f"m{number}", "subscription": "this"}
+        request = Request(method, params, f"r{number}")
+        dispatcher.process_next_request_from(broker, headers, request)
+    assert dispatcher.drain(timeout=10)
+    dispatcher.shutdown()
+    return broker
+
+
+class TestOrderedDispatcher:
+    def test_publishes_in_request_order(self):
+        audit = FakeAudit()
+        dispatcher = OrderedDispatcher(rules_for(SlowEntryPoints()), audit)
+        delays = [0.05, 0.0, 0.03, 0.0, 0.01]
+        broker = dispatch(
+            dispatcher, [("echo", [delay, index]) for index, delay in enumerate(delays)]
+        )
+        assert broker.published == [
+            (f"m{index}", f"r{index}", index) for index in range(len(delays))
+        ]
+        assert audit.lines == [(f"r{index}", index) for index in range(len(delays))]
+
+    def test_runs_requests_concurrently(self):
+        dispatcher = OrderedDispatcher(rules_for(SlowEntryPoints()), FakeAudit())
+        start = time.perf_counter()
+        broker = dispatch(dispatcher, [("echo", [0.2, index]) for index in range(8)])
+        assert time.perf_counter() - start < 1.0
+        assert len(broker.published) == 8
+
+    def test_in_flight_window_blocks_receiver(self):
+        dispatcher = OrderedDispatcher(
+            rules_for(SlowEntryPoints()), FakeAudit(), max_in_flight=2
+        )
+        broker = FakeBroker()
+        accepted = []
+
+        def receive():
+            for number in range(4):
+                request = Request("echo", [0.2, number], f"r{number}")
+                dispatcher.process_next_request_from(
+                    broker, {"message-id": f"m{number}"}, request
+                )
+                accepted.append(number)
+
+        receiver = threading.Thread(target=receive)
+        receiver.start()
+        time.sleep(0.1)
+        assert accepted == [0, 1]
+        receiver.join()
+        assert dispatcher.drain(timeout=10)
+        dispatcher.shutdown()
+        assert [result for _, _, result in broker.published] == [0, 1, 2, 3]
+
+    def test_fatal_response_stops_publishing(self):
+        dispatcher = OrderedDispatcher(rules_for(SlowEntryPoints()), FakeAudit())
+        broker = dispatch(
+            dispatcher,
+            [("echo", [0.05, "a"]), ("fail", [0.0]), ("echo", [0.0, "c"])],
+        )
+        assert [result for _, _, result in broker.published] == ["a"]
+        assert broker.stopped
+
+    def test_unknown_method_is_fatal(self):
+        dispatcher = OrderedDispatcher(rules_for(SlowEntryPoints()), FakeAudit())
+        broker = dispatch(dispatcher, [("missing", [])])
+        assert broker.published == []
+        assert broker.stopped
+
+    def test_serial_methods_run_one_at_a_time(self):
+        log = []
+
+        class Recording:
+            def echo(self, delay, value):
+                log.append(("start", value))
+                time.sleep(delay)
+                log.append(("end", value))
+                return value
+
+            def fail(self, delay):
+                raise ValueError
+
+        dispatcher = OrderedDispatcher(
+            rules_for(Recording()), FakeAudit(), serial_methods=["echo"]
+        )
+        dispatch(dispatcher, [("echo", [0.02, index]) for index in range(3)])
+        assert log == [
+            (event, index) for index in range(3) for event in ("start", "end")
+        ]
+
+    def test_process_methods_run_in_worker_processes(self):
+        dispatcher = OrderedDispatcher(
+            rules_for(SlowEntryPoints()),
+            FakeAudit(),
+            process_methods=["echo", "fail"],
+            entry_point_factory=SlowEntryPoints,
+            worker_processes=2,
+        )
+        dispatcher.start()
+        broker = dispatch(
+            dispatcher,
+            [("echo", [0.05, "a"]), ("echo", [0.0, "b"]), ("fail", [0.0])],
+        )
+        assert broker.published == [("m0", "r0", "a"), ("m1", "r1", "b")]
+        assert broker.stopped
+
+    def test_rejects_process_methods_without_factory(self):
+        with pytest.raises(ValueError):
+            OrderedDispatcher(ProcessingRules(), FakeAudit(), process_methods=["echo"])
+
+
+class TestConcurrentImplementationRunnerBuilder:
+    def test_process_methods_need_a_solution(self):
+        entry_points = SlowEntryPoints()
+        builder = (
+            ConcurrentImplementationRunnerBuilder()
+            .with_process_pool(SlowEntryPoints, "echo", "fail")
+            .with_solution_for("echo", entry_points.echo)
+        )
+        with pytest.raises(ValueError, match="without a solution: fail$"):
+            builder.create()
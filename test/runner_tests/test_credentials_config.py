@@ -0,0 +1,74 @@
+import os
+
+import pytest
+from runner import credentials_config_file
+from runner.credentials_config_file import CredentialsConfig
+
+
+def write_config(path, text, mtime_ns):
+    path.write_text(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / "credentials.config"
+    write_config(
+        path,
+        "# comment\n"
+        "tdl_hostname=run.example.com\n"
+        'tdl_journey_id="abc\\=\\="\n'
+        "tdl_use_coloured_output=false\n",
+        1_000_000_000,
+    )
+    return path
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+    load_properties = credentials_config_file.load_properties
+
+    def counting_load_properties(filepath):
+        calls.append(filepath)
+        return load_properties(filepath)
+
+    monkeypatch.setattr(
+        credentials_config_file, "load_properties", counting_load_properties
+    )
+    return calls
+
+
+class TestCredentialsConfig:
+    def test_parses_typed_values_once(self, config_file, loads):
+        config = CredentialsConfig(config_file, environ={})
+        assert config.get("tdl_hostname") == "run.example.com"
+        assert config.get("tdl_journey_id") == "abc=="
+        assert config.get("tdl_use_coloured_output") is False
+        assert config.get("tdl_require_rec", True) is True
+        with pytest.raises(KeyError):
+            config.get("tdl_request_queue_name")
+        assert len(loads) == 1
+
+    def test_rereads_when_file_changes(self, config_file, loads):
+        config = CredentialsConfig(config_file, environ={})
+        assert config.get("tdl_hostname") == "run.example.com"
+        write_config(config_file, "tdl_hostname=other.example.com\n", 2_000_000_000)
+        assert config.get("tdl_hostname") == "other.example.com"
+        assert config.get("tdl_hostname") == "other.example.com"
+        assert len(loads) == 2
+
+    def test_keeps_last_version_when_file_disappears(self, config_file):
+        config = CredentialsConfig(config_file, environ={})
+        assert config.get("tdl_hostname") == "run.example.com"
+        config_file.unlink()
+        assert config.get("tdl_hostname") == "run.example.com"
+
+    def test_environment_overrides(self, config_file, loads):
+        config = CredentialsConfig(
+            config_file,
+            environ={"TDL_HOSTNAME": "localhost", "TDL_REQUIRE_REC": "false"},
+        )
+        assert config.get("tdl_hostname") == "localhost"
+        assert config.get("tdl_require_rec", True) is False
+        assert loads == []
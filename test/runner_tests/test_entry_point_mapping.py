@@ -0,0 +1,133 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from entry_point_mapping import PURE_METHODS, SOLUTIONS, EntryPointMapping
+from runner.response_cache import MAX_ARGUMENT_SIZE
+
+LIB_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "lib")
+
+
+class TestEntryPointMapping:
+    def test_serves_registry_methods(self):
+        mapping = EntryPointMapping()
+        assert mapping.sum(1, 2) == 3
+        assert mapping.hello("Ada") == "Hello, Ada!"
+        assert mapping.checkout("AAA") == 130
+
+    def test_every_registry_entry_resolves(self):
+        mapping = EntryPointMapping()
+        mapping.prewarm(*SOLUTIONS)
+        assert all(callable(mapping.resolve(name)) for name in SOLUTIONS)
+
+    def test_methods_of_one_class_share_an_instance(self):
+        mapping = EntryPointMapping()
+        inventory_add = mapping.resolve("inventory_add")
+        inventory_size = mapping.resolve("inventory_size")
+        assert inventory_add.__self__ is inventory_size.__self__
+        assert mapping.resolve("inventory_add") is inventory_add
+
+    def test_unknown_method(self):
+        mapping = EntryPointMapping()
+        with pytest.raises(AttributeError):
+            mapping.missing
+        with pytest.raises(KeyError):
+            mapping.resolve("missing")
+
+    def test_custom_registry_and_prewarm(self):
+        with pytest.raises(ImportError):
+            EntryPointMapping({"broken": "solutions.NOPE.nope:Nope.run"}, ["broken"])
+        mapping = EntryPointMapping(
+            {"add": "solutions.SUM.sum_solution:SumSolution.compute"}, ["add"]
+        )
+        assert mapping.add(2, 2) == 4
+        with pytest.raises(AttributeError):
+            mapping.sum
+
+    def test_imports_only_what_is_used(self):
+        script = (
+            "import sys\n"
+            "from entry_point_mapping import EntryPointMapping\n"
+            "mapping = EntryPointMapping()\n"
+            "assert mapping.sum(1, 2) == 3\n"
+            "print(sorted(name for name in sys.modules if name.startswith('solutions.')))\n"
+            "print('pydantic' in sys.modules)\n"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=LIB_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.splitlines()
+        assert output == ["['solutions.SUM', 'solutions.SUM.sum_solution']", "False"]
+
+
+class TestPureMethods:
+    def test_memoizes_only_when_asked(self):
+        mapping = EntryPointMapping()
+        assert mapping.checkout("AAA") == mapping.checkout("AAA") == 130
+        assert mapping.cache_stats() == {}
+
+    def test_memoizes_pure_methods(self):
+        mapping = EntryPointMapping(pure_methods=PURE_METHODS)
+        assert mapping.checkout("AAA") == 130
+        assert mapping.checkout("AAA") == 130
+        assert mapping.checkout("B") == 30
+        assert mapping.cache_stats()["checkout"] == (1, 2, 0, 2)
+
+    def test_skips_pure_methods_the_registry_does_not_serve(self):
+        mapping = EntryPointMapping(
+            {"sum": SOLUTIONS["sum"]}, pure_methods=PURE_METHODS
+        )
+        assert mapping.sum(1, 2) == 3
+        assert set(mapping.cache_stats()) == {"sum"}
+
+    def test_keys_keep_argument_types(self):
+        mapping = EntryPointMapping(pure_methods=PURE_METHODS)
+        assert mapping.hello(1) == "Hello, 1!"
+        assert mapping.hello(1.0) == "Hello, 1.0!"
+        assert mapping.hello(True) == "Hello, True!"
+        assert mapping.cache_stats()["hello"].misses == 3
+
+    def test_evicts_least_recently_used(self):
+        mapping = EntryPointMapping(pure_methods={"sum": 2})
+        mapping.sum(1, 1)
+        mapping.sum(1, 2)
+        mapping.sum(1, 1)
+        mapping.sum(1, 3)
+        mapping.sum(1, 1)
+        mapping.sum(1, 2)
+        assert mapping.cache_stats()["sum"] == (2, 4, 2, 2)
+
+    def test_unhashable_arguments_bypass_the_cache(self):
+        mapping = EntryPointMapping(
+            {"echo": "solutions.HLO.hello_solution:HelloSolution.hello"},
+            pure_methods={"echo": 8},
+        )
+        assert mapping.echo({1, 2}) == "Hello, {1, 2}!"
+        assert mapping.echo({"a": [1]}) == "Hello, {'a': [1]}!"
+        assert mapping.echo({"a": [1]}) == "Hello, {'a': [1]}!"
+        assert mapping.cache_stats()["echo"] == (1, 1, 0, 1)
+
+    def test_large_arguments_bypass_the_cache(self):
+        mapping = EntryPointMapping(pure_methods={"checkout": 4})
+        largest = "A" * (MAX_ARGUMENT_SIZE - 1)
+        for _ in range(2):
+            assert mapping.checkout("AAA") == 130
+            assert mapping.checkout(largest + "AA") == 163_900
+            assert mapping.checkout(largest) == 163_800
+        assert mapping.cache_stats()["checkout"] == (2, 2, 0, 2)
+
+    def test_stateful_methods_are_never_memoized(self):
+        assert not {"inventory_add", "inventory_size", "inventory_get"} & set(
+            PURE_METHODS
+        )
+        with pytest.raises(ValueError, match="shares a solution instance"):
+            EntryPointMapping(pure_methods={"inventory_get": 16})
+        with pytest.raises(ValueError, match="not in the registry"):
+            EntryPointMapping(pure_methods={"missing": 16})
+        mapping = EntryPointMapping(pure_methods=PURE_METHODS)
+        mapping.prewarm("inventory_add", "inventory_size", "inventory_get")
+        assert mapping.cache_stats() == {}
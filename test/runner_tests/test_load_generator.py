@@ -0,0 +1,105 @@
+import pytest
+from runner import load_generator
+from runner.load_generator import (
+    LoadRequest,
+    RunnerOptions,
+    format_report,
+    load_requests,
+    run_load,
+    synthetic_requests,
+)
+
+
+class TestRequestStreams:
+    def test_synthetic_requests_are_repeatable(self):
+        requests = synthetic_requests(["sum", "checkout"], 50, seed=3)
+        assert requests == synthetic_requests(["sum", "checkout"], 50, seed=3)
+        assert {request.method for request in requests} == {"sum", "checkout"}
+        with pytest.raises(ValueError, match="nope"):
+            synthetic_requests(["nope"], 1)
+
+    def test_load_recorded_requests(self, tmp_path):
+        path = tmp_path / "requests.jsonl"
+        path.write_text(
+            '{"method": "sum", "params": [1, 2], "id": "X1"}\n'
+            "\n"
+            '{"method": "hello", "params": ["Ada"]}\n'
+        )
+        assert load_requests(path) == [
+            LoadRequest("sum", [1, 2]),
+            LoadRequest("hello", ["Ada"]),
+        ]
+        path.write_text('{"method": "sum"}\n')
+        with pytest.raises(ValueError, match="line 1"):
+            load_requests(path)
+
+
+class TestRunLoad:
+    @pytest.mark.parametrize("sequential", [True, False])
+    def test_answers_every_request(self, sequential):
+        requests = synthetic_requests(["sum", "hello", "checkout"], 200)
+        report = run_load(
+            requests,
+            RunnerOptions(sequential=sequential, process_methods=()),
+            rate=2000,
+            timeout=10,
+            idle_millis=200,
+            isolated=False,
+            warmup=requests[:10],
+        )
+        assert report.sent == report.answered == 200
+        assert report.overall.count == 200
+        assert sum(latency.count for latency in report.methods) == 200
+        assert [latency.method for latency in report.methods] == [
+            "checkout",
+            "hello",
+            "sum",
+        ]
+        assert 0 < report.overall.p50 <= report.overall.p99 <= report.overall.max
+        assert "200 requests" not in format_report(report)
+
+    def test_reports_requests_left_unanswered(self):
+        requests = [
+            LoadRequest("sum", [1, 2]),
+            LoadRequest("nope", []),
+            LoadRequest("sum", [3, 4]),
+        ]
+        report = run_load(
+            requests,
+            RunnerOptions(sequential=True),
+            timeout=10,
+            idle_millis=200,
+            isolated=False,
+        )
+        assert report.answered == 1
+        assert report.unanswered == 2
+        assert "2 requests were not answered" in format_report(report)
+
+
+class TestMain:
+    class Stop(Exception):
+        pass
+
+    def run_main(self, monkeypatch, argv):
+        sent = []
+
+        def run_load(requests, create_runner, warmup, **options):
+            sent.append((len(warmup), len(requests)))
+            raise self.Stop()
+
+        monkeypatch.setattr(load_generator, "run_load", run_load)
+        with pytest.raises(self.Stop):
+            load_generator.main(argv)
+        return sent[0]
+
+    def test_replays_are_measured_whole_by_default(self, tmp_path, monkeypatch):
+        path = tmp_path / "requests.jsonl"
+        path.write_text('{"method": "sum", "params": [1, 2]}\n' * 3)
+        assert self.run_main(monkeypatch, ["--replay", str(path)]) == (0, 3)
+        argv = ["--replay", str(path), "--warmup", "2"]
+        assert self.run_main(monkeypatch, argv) == (2, 1)
+        with pytest.raises(SystemExit):
+            load_generator.main(["--replay", str(path), "--warmup", "3"])
+
+    def test_generated_streams_warm_up_first(self, monkeypatch):
+        assert self.run_main(monkeypatch, ["--count", "5"]) == (1000, 5)
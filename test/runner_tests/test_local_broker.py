@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+import stomp
+from runner.local_broker import LocalBroker
+
+
+class Collector(stomp.ConnectionListener):
+    def __init__(self, connection=None, ack=False):
+        self.messages = []
+        self.received = threading.Event()
+        self._connection = connection
+        self._ack = ack
+
+    def on_message(self, frame):
+        self.messages.append((frame.headers, frame.body))
+        if self._ack:
+            self._connection.ack(
+                frame.headers["message-id"], frame.headers["subscription"]
+            )
+        self.received.set()
+
+    def wait_for(self, count, timeout=5):
+        while len(self.messages) < count:
+            self.received.clear()
+            if len(self.messages) < count and not self.received.wait(timeout):
+                raise AssertionError(f"Got {len(self.messages)} of {count} messages")
+
+
+@pytest.fixture
+def broker():
+    with LocalBroker() as broker:
+        yield broker
+
+
+def connect(broker):
+    connection = stomp.Connection([(broker.hostname, broker.port)])
+    connection.connect(wait=True)
+    return connection
+
+
+class TestLocalBroker:
+    def test_round_trip_through_stomp(self, broker):
+        responses = []
+        responded = threading.Event()
+
+        def on_response(headers, body):
+            responses.append(body)
+            responded.set()
+
+        broker.on_message("resp", on_response)
+        connection = connect(broker)
+        collector = Collector(connection, ack=True)
+        connection.set_listener("collector", collector)
+        connection.subscribe("req", id="this", ack="client-individual")
+        broker.send("req", '{"id":"1"}')
+        broker.send("req", 'line\nwith "escapes":\\')
+        collector.wait_for(2)
+        connection.send(body='{"result":3}', destination="resp")
+        assert responded.wait(5)
+        connection.disconnect()
+
+        assert [body for _, body in collector.messages] == [
+            '{"id":"1"}',
+            'line\nwith "escapes":\\',
+        ]
+        assert collector.messages[0][0]["destination"] == "req"
+        assert collector.messages[0][0]["subscription"] == "this"
+        assert responses == ['{"result":3}']
+        assert broker.queue_depth("req") == 0
+
+    def test_queues_messages_until_subscribed(self, broker):
+        for body in ("a", "b", "c"):
+            broker.send("req", body)
+        assert broker.queue_depth("req") == 3
+        connection = connect(broker)
+        collector = Collector()
+        connection.set_listener("collector", collector)
+        connection.subscribe("req", id="this", ack="auto")
+        assert broker.wait_for_subscriber("req", timeout=5)
+        collector.wait_for(3)
+        connection.disconnect()
+        assert [body for _, body in collector.messages] == ["a", "b", "c"]
+
+    def test_redelivers_unacknowledged_messages(self, broker):
+        for body in ("a", "b", "c"):
+            broker.send("req", body)
+        first = connect(broker)
+        collector = Collector()
+        first.set_listener("collector", collector)
+        first.subscribe("req", id="this", ack="client-individual")
+        collector.wait_for(3)
+        first.ack(collector.messages[0][0]["message-id"], "this")
+        first.unsubscribe("this")
+        first.disconnect()
+
+        second = connect(broker)
+        redelivered = Collector(second, ack=True)
+        second.set_listener("collector", redelivered)
+        second.subscribe("req", id="that", ack="client-individual")
+        redelivered.wait_for(2)
+        second.disconnect()
+        assert [body for _, body in redelivered.messages] == ["b", "c"]
+
+    def test_limits_unacknowledged_messages(self):
+        with LocalBroker(prefetch=2) as broker:
+            for body in ("a", "b", "c"):
+                broker.send("req", body)
+            connection = connect(broker)
+            collector = Collector()
+            connection.set_listener("collector", collector)
+            connection.subscribe("req", id="this", ack="client-individual")
+            collector.wait_for(2)
+            assert broker.queue_depth("req") == 1
+            connection.ack(collector.messages[0][0]["message-id"], "this")
+            collector.wait_for(3)
+            connection.disconnect()
+            assert [body for _, body in collector.messages] == ["a", "b", "c"]
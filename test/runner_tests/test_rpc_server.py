@@ -0,0 +1,239 @@
+import asyncio
+import http.client
+import json
+import threading
+
+from entry_point_mapping import EntryPointMapping
+from runner.rpc_server import JsonRpcServer
+from solutions.DMO.demo_round3_solution import DemoRound3Solution
+from solutions.DMO.inventory_item import InventoryItem
+from solutions.SUM.sum_solution import SumSolution
+
+SUM_AND_CHECKOUT = {
+    "sum": "solutions.SUM.sum_solution:SumSolution.compute",
+    "checkout": "solutions.CHK.checkout_solution:CheckoutSolution.checkout",
+}
+
+
+def rpc_server(**kwargs):
+    return JsonRpcServer(EntryPointMapping(SUM_AND_CHECKOUT), **kwargs)
+
+
+def handle(server, payload):
+    async def run():
+        async with server:
+            response = await server.handle(json.dumps(payload))
+        return None if response is None else json.loads(response)
+
+    return asyncio.run(run())
+
+
+def call(method, params, request_id=1):
+    return {"jsonrpc": "2.0", "method": method, "params": params, "id": request_id}
+
+
+class TestJsonRpc:
+    def test_single_call(self):
+        assert handle(rpc_server(), call("sum", [1, 2])) == {
+            "jsonrpc": "2.0",
+            "result": 3,
+            "id": 1,
+        }
+        assert handle(rpc_server(), call("sum", {"x": 4, "y": 5}))["result"] == 9
+
+    def test_batch_keeps_order_and_skips_notifications(self):
+        batch = [
+            call("checkout", ["AAA"], "a"),
+            call("sum", [1, 2], "b"),
+            {"jsonrpc": "2.0", "method": "sum", "params": [3, 4]},
+            call("checkout", ["x"], "c"),
+        ]
+        responses = handle(rpc_server(), batch)
+        assert [(r["id"], r["result"]) for r in responses] == [
+            ("a", 130),
+            ("b", 3),
+            ("c", -1),
+        ]
+        assert handle(rpc_server(), batch[2:3]) is None
+
+    def test_errors(self):
+        server = rpc_server()
+
+        async def run():
+            async with server:
+                return [
+                    json.loads(await server.handle(payload))
+                    for payload in (
+                        b"{nope",
+                        b"[]",
+                        json.dumps({"method": "sum"}),
+                        json.dumps(call("rabbit_hole", [])),
+                        json.dumps(call("sum", 3)),
+                        json.dumps(call("checkout", [1])),
+                    )
+                ]
+
+        codes = [response["error"]["code"] for response in asyncio.run(run())]
+        assert codes == [-32700, -32600, -32600, -32601, -32602, -32000]
+
+
+class TestBatching:
+    def test_concurrent_checkouts_are_priced_together(self):
+        batches = []
+
+        def price(calls):
+            batches.append(calls)
+            return [len(params[0]) for params in calls]
+
+        server = rpc_server(batch_handlers={"checkout": price}, batch_window_ms=50)
+
+        async def run():
+            async with server:
+                return await asyncio.gather(
+                    *(server.call("checkout", ["A" * n]) for n in range(5)),
+                    server.call("sum", [1, 1]),
+                )
+
+        assert asyncio.run(run()) == [0, 1, 2, 3, 4, 2]
+        assert batches == [[[""], ["A"], ["AA"], ["AAA"], ["AAAA"]]]
+
+    def test_flushes_full_batches_early(self):
+        batches = []
+
+        def price(calls):
+            batches.append(len(calls))
+            return [0] * len(calls)
+
+        server = rpc_server(
+            batch_handlers={"checkout": price}, batch_window_ms=10_000, max_batch=2
+        )
+
+        async def run():
+            async with server:
+                await asyncio.wait_for(
+                    asyncio.gather(*(server.call("checkout", ["A"]) for _ in range(4))),
+                    timeout=5,
+                )
+
+        asyncio.run(run())
+        assert batches == [2, 2]
+
+    def test_answers_calls_one_by_one_when_the_batch_fails(self):
+        def price(calls):
+            raise ValueError("batch pricing failed")
+
+        server = rpc_server(batch_handlers={"checkout": price})
+        responses = handle(server, [call("checkout", ["AB"]), call("checkout", [1])])
+        assert responses[0]["result"] == 80
+        assert responses[1]["error"]["code"] == -32000
+
+    def test_default_handler_resolves_checkout_on_the_first_batch(self):
+        server = JsonRpcServer(
+            EntryPointMapping(SUM_AND_CHECKOUT, pure_methods={"checkout": 16})
+        )
+        assert "checkout" not in server.entry_points.cache_stats()
+        handle(server, [call("checkout", ["A"]), call("checkout", ["B"], 2)])
+        assert "checkout" in server.entry_points.cache_stats()
+
+    def test_default_handler_prices_with_the_checkout_solution(self):
+        requests = [call("checkout", [skus], skus) for skus in ("AAA", "B", "-", "")]
+        responses = handle(rpc_server(), requests)
+        assert {r["id"]: r["result"] for r in responses} == {
+            "AAA": 130,
+            "B": 30,
+            "-": -1,
+            "": 0,
+        }
+
+
+class TestConversions:
+    def test_arguments_go_through_the_mapping_conversions(self, monkeypatch):
+        received = []
+        monkeypatch.setattr(
+            DemoRound3Solution,
+            "inventory_add",
+            lambda self, item, number: received.append((item, number)),
+        )
+        server = JsonRpcServer(EntryPointMapping())
+        item = {"sku": "A", "name": "Apple", "price": 50}
+        assert handle(server, call("inventory_add", [item, 2]))["result"] is None
+        assert received == [(InventoryItem(sku="A", name="Apple", price=50), 2)]
+
+    def test_results_go_through_the_mapping_conversions(self):
+        server = JsonRpcServer(EntryPointMapping())
+        item = {"sku": "A", "name": "Apple", "price": 50}
+
+        async def run():
+            async with server:
+                # One at a time: the calls of a batch run concurrently
+                return [
+                    json.loads(await server.handle(json.dumps(request)))["result"]
+                    for request in (
+                        call("int_range", [2, 5]),
+                        call("inventory_add", [item, 2]),
+                        call("inventory_get", ["A"]),
+                    )
+                ]
+
+        assert asyncio.run(run()) == [[2, 3, 4], None, item]
+
+
+class TestBackpressure:
+    def test_callers_wait_once_queue_and_slots_are_full(self, monkeypatch):
+        release = threading.Event()
+        started = threading.Semaphore(0)
+
+        def compute(self, x, y):
+            started.release()
+            release.wait(5)
+            return x + y
+
+        monkeypatch.setattr(SumSolution, "compute", compute)
+        server = rpc_server(max_in_flight=1, max_pending=1)
+
+        async def run():
+            async with server:
+                calls = [
+                    asyncio.create_task(server.call("sum", [n, 0])) for n in range(4)
+                ]
+                await asyncio.to_thread(started.acquire)
+                await asyncio.sleep(0.05)
+                # One call running, one held by the dispatcher, one queued,
+                # one still waiting to get into the queue
+                assert server._queue.full()
+                assert sum(not call.done() for call in calls) == 4
+                release.set()
+                return await asyncio.gather(*calls)
+
+        assert asyncio.run(run()) == [0, 1, 2, 3]
+
+
+class TestHttp:
+    def test_round_trip_over_keep_alive_connection(self):
+        server = rpc_server()
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+            connection.request("POST", "/", json.dumps(call("checkout", ["AAA"])))
+            response = connection.getresponse()
+            assert response.status == 200
+            assert json.loads(response.read())["result"] == 130
+
+            notification = {"jsonrpc": "2.0", "method": "sum", "params": [1, 2]}
+            connection.request("POST", "/", json.dumps(notification))
+            response = connection.getresponse()
+            assert (response.status, response.read()) == (204, b"")
+
+            connection.request("GET", "/")
+            response = connection.getresponse()
+            response.read()
+            assert response.status == 405
+            connection.close()
+        finally:
+            asyncio.run_coroutine_threadsafe(server.close(), loop).result(5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(5)
+            loop.close()
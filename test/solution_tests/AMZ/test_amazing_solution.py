@@ -0,0 +1,112 @@
+import pytest
+from pydantic import ValidationError
+from solutions.AMZ import maze as maze_module
+from solutions.AMZ.amazing_solution import AmazingSolution
+from solutions.AMZ.maze import OPEN_EAST, OPEN_SOUTH, ON_ROUTE, Maze
+
+
+def passages(maze):
+    """Every open wall as a pair of neighbouring cells."""
+    pairs = []
+    for cell, flags in enumerate(maze.cells):
+        if flags & OPEN_EAST:
+            assert cell % maze.columns != maze.columns - 1
+            pairs.append((cell, cell + 1))
+        if flags & OPEN_SOUTH:
+            assert cell + maze.columns < len(maze.cells)
+            pairs.append((cell, cell + maze.columns))
+    return pairs
+
+
+def reachable(maze):
+    neighbours = {cell: [] for cell in range(len(maze.cells))}
+    for a, b in passages(maze):
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+    seen = {0}
+    frontier = [0]
+    while frontier:
+        for neighbour in neighbours[frontier.pop()]:
+            if neighbour not in seen:
+                seen.add(neighbour)
+                frontier.append(neighbour)
+    return seen
+
+
+@pytest.fixture(params=["numpy", "pure"])
+def numpy_or_not(request, monkeypatch):
+    if request.param == "pure":
+        monkeypatch.setattr(maze_module, "np", None)
+
+
+class TestMaze:
+    @pytest.mark.parametrize("algorithm", ["backtracker", "kruskal", None])
+    @pytest.mark.parametrize("rows, columns", [(1, 1), (1, 7), (6, 1), (9, 13)])
+    def test_generates_perfect_mazes(self, numpy_or_not, algorithm, rows, columns):
+        maze = Maze.generate(rows, columns, {"seed": 4, "algorithm": algorithm})
+        # Connected with one fewer passage than cells: a spanning tree
+        assert len(passages(maze)) == rows * columns - 1
+        assert len(reachable(maze)) == rows * columns
+
+    def test_same_seed_same_maze(self):
+        assert Maze.generate(20, 30, {"seed": 7}).cells == (
+            Maze.generate(20, 30, {"seed": 7}).cells
+        )
+        assert Maze.generate(20, 30, {"seed": 7}).cells != (
+            Maze.generate(20, 30, {"seed": 8}).cells
+        )
+
+    @pytest.mark.parametrize("algorithm", ["backtracker", "kruskal"])
+    def test_marks_the_route(self, numpy_or_not, algorithm):
+        options = {"seed": 1, "algorithm": algorithm, "show_route": True}
+        maze = Maze.generate(15, 25, options)
+        route = list(maze.route())
+        assert route[0] == 0 and route[-1] == 15 * 25 - 1
+        steps = {tuple(sorted(step)) for step in zip(route, route[1:])}
+        assert steps <= set(passages(maze))
+        assert [
+            cell for cell, flags in enumerate(maze.cells) if flags & ON_ROUTE
+        ] == sorted(route)
+        options["show_route"] = False
+        assert not any(
+            flags & ON_ROUTE for flags in Maze.generate(15, 25, options).cells
+        )
+
+    def test_renders_walls_and_openings(self):
+        maze = Maze(2, 2, bytearray([OPEN_EAST, OPEN_SOUTH, OPEN_EAST, 0]))
+        assert maze.render().splitlines() == [
+            "+   +---+",
+            "|       |",
+            "+---+   +",
+            "|       |",
+            "+---+   +",
+        ]
+        maze.cells[0] |= ON_ROUTE
+        assert maze.render().splitlines()[1] == "| *     |"
+
+    def test_rejects_bad_options(self):
+        with pytest.raises(ValueError, match="at least one cell"):
+            Maze.generate(0, 5)
+        with pytest.raises(ValidationError):
+            Maze.generate(3, 3, {"algorithm": "prim"})
+
+    def test_ignores_unknown_options(self):
+        assert Maze.generate(3, 3, {"seed": 5, "colour": "red"}).cells == (
+            Maze.generate(3, 3, {"seed": 5}).cells
+        )
+
+
+class TestAmazing:
+    def test_amazing_maze(self):
+        drawing = AmazingSolution().amazing_maze(3, 4, {"seed": 2})
+        lines = drawing.splitlines()
+        assert len(lines) == 2 * 3 + 1
+        assert {len(line) for line in lines} == {4 * 4 + 1}
+        assert lines[0].startswith("+   +")
+        assert lines[-1].endswith("+   +")
+        assert "*" not in drawing
+        assert drawing == AmazingSolution().amazing_maze(3, 4, {"seed": 2})
+
+    def test_large_maze(self):
+        drawing = AmazingSolution().amazing_maze(300, 400, None)
+        assert len(drawing) == (2 * 300 + 1) * (4 * 400 + 2) - 1
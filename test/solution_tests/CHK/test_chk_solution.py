@@ -1,11 +1,32 @@
+import gc
+import itertools
+import json
+import os
+import random
+import string
+import time
+import threading
+import tracemalloc
+from array import array
 from collections import Counter
+from multiprocessing.shared_memory import SharedMemory
 
 import pytest
+from solutions.CHK import batch_pricing, checkout_metrics, checkout_solution
+from solutions.CHK.basket_cache import BasketCache, basket_signature
+from solutions.CHK.catalog import CatalogWatcher, load_catalog
+from solutions.CHK.checkout_metrics import CheckoutMetrics, to_prometheus
 from solutions.CHK.checkout_solution import (
     CheckoutSolution,
     FreeItemOffer,
     MultiBuyOffer,
 )
+from solutions.CHK.cost_curve import cost_curve
+from solutions.CHK.offer_graph import OfferCycleError, order_free_item_offers
+from solutions.CHK.offer_solver import solve_group_offers
+from solutions.CHK.shared_plan import SharedCheckoutPool, SharedPlan
+from solutions.CHK.sku_parser import SkuParser
+from solutions.CHK.sku_tokenizer import SkuTokenizer
 
 from lib.solutions.CHK.checkout_solution import GroupDiscountOffer, GroupOfferResult
 
@@ -112,6 +133,32 @@ class TestCalculateSKUCost:
                 250,
                 id="greedy_applies_largest_offer_first",
             ),
+            pytest.param(
+                "A",
+                6,
+                {"A": 50},
+                {
+                    "A": [
+                        MultiBuyOffer(quantity=4, price=120),
+                        MultiBuyOffer(quantity=3, price=60),
+                    ]
+                },
+                120,
+                id="overlapping_offers_priced_best_for_customer",
+            ),
+            pytest.param(
+                "V",
+                4,
+                {"V": 50},
+                {
+                    "V": [
+                        MultiBuyOffer(quantity=2, price=90),
+                        MultiBuyOffer(quantity=3, price=130),
+                    ]
+                },
+                180,
+                id="offer_order_does_not_matter",
+            ),
         ],
     )
     def test_calculate_sku_cost(
@@ -242,6 +289,1125 @@ class TestIntegratedCheckout:
         assert result == 1205
 
 
+def legacy_checkout(solution: CheckoutSolution, skus: str) -> int:
+    """Price a basket through the model-based stage helpers."""
+    try:
+        items = solution.parse_skus(skus, solution.base_prices)
+    except ValueError:
+        return -1
+    items = solution.apply_free_item_offers(items, solution.free_item_offers)
+    group_result = solution.calculate_group_offer_discount(
+        items, solution.group_discount_offers
+    )
+    return group_result.offer_cost + solution.calculate_multibuy_cost(
+        group_result.remaining_items,
+        solution.base_prices,
+        solution.multibuy_offers,
+    )
+
 
+class TestPricingPlan:
+    def test_plan_uses_dense_ordinals(self):
+        plan = CheckoutSolution().pricing_plan
+        assert plan.skus[plan.ordinals["Z"]] == "Z"
+        assert plan.base_prices[plan.ordinals["A"]] == 50
+        assert plan.multibuy_tiers[plan.ordinals["A"]] == ((5, 200), (3, 130))
+        assert plan.group_membership[plan.ordinals["S"]] == (0,)
+
+    def test_offer_with_unknown_sku_is_rejected(self):
+        with pytest.raises(ValueError, match="unknown SKU"):
+            CheckoutSolution(
+                free_item_offers=[
+                    FreeItemOffer(sku="E", quantity=2, gift_sku="?", gift_quantity=1)
+                ]
+            )
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_checkout_matches_stage_helpers(self, seed):
+        rng = random.Random(seed)
+        solution = CheckoutSolution()
+        for _ in range(200):
+            skus = "".join(
+                rng.choices(string.ascii_uppercase + "a", k=rng.randint(0, 40))
+            )
+            assert solution.checkout(skus) == legacy_checkout(solution, skus)
 
 
+class TestCheckoutMany:
+    def test_empty_batch(self):
+        assert CheckoutSolution().checkout_many([]) == []
+
+    @pytest.mark.parametrize("seed", range(3))
+    def test_matches_scalar_checkout(self, seed):
+        rng = random.Random(seed)
+        solution = CheckoutSolution()
+        baskets = [
+            "".join(rng.choices(string.ascii_uppercase + "aé", k=rng.randint(0, 60)))
+            for _ in range(500)
+        ]
+        assert solution.checkout_many(baskets) == [
+            solution.checkout(skus) for skus in baskets
+        ]
+
+    def test_invalid_rows_are_isolated(self):
+        solution = CheckoutSolution()
+        assert solution.checkout_many(["AAA", "A-A", "", "?"]) == [130, -1, 0, -1]
+
+    def test_chunks_bound_matrix_cells_and_characters(self, monkeypatch):
+        monkeypatch.setattr(batch_pricing, "CHUNK_CELLS", 100)
+        chunks = list(batch_pricing._chunks(["A" * 30] * 5 + ["B" * 150, "C"], 27))
+        assert [len(chunk) for chunk in chunks] == [3, 2, 1, 1]
+        solution = CheckoutSolution()
+        baskets = ["AAAB", "E" * 150, "EEB", "x", "FFF"] * 20
+        assert solution.checkout_many(baskets) == [
+            solution.checkout(skus) for skus in baskets
+        ]
+
+    def test_prices_multi_character_skus_one_by_one(self):
+        solution = fruit_solution()
+        baskets = ["APPLE APPLE", "PEARPEARPLUM", "FIG", ""]
+        assert solution.checkout_many(baskets) == [
+            solution.checkout(skus) for skus in baskets
+        ]
+
+
+class TestCostCurve:
+    @staticmethod
+    def brute_force_cost(num_items, base_price, tiers):
+        best = [0] + [None] * num_items
+        for n in range(1, num_items + 1):
+            best[n] = min(
+                best[n - quantity] + price
+                for quantity, price in ((1, base_price),) + tiers
+                if quantity <= n
+            )
+        return best[num_items]
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_matches_brute_force_past_the_table(self, seed):
+        rng = random.Random(seed)
+        base_price = rng.randint(1, 60)
+        tiers = tuple(
+            (quantity, rng.randint(1, quantity * base_price))
+            for quantity in rng.sample(range(2, 12), rng.randint(1, 3))
+        )
+        curve = cost_curve(base_price, tiers)
+        for num_items in range(3 * len(curve.costs)):
+            assert curve(num_items) == self.brute_force_cost(
+                num_items, base_price, tiers
+            )
+
+    def test_large_quantities_use_closed_form(self):
+        curve = cost_curve(50, ((5, 200), (3, 130)))
+        assert curve(10**9 + 1) == (10**9 // 5) * 200 + 50
+
+    def test_rejects_non_positive_quantity(self):
+        with pytest.raises(ValueError):
+            cost_curve(10, ((0, 5),))
+
+
+class TestBasketCache:
+    def test_reordered_basket_is_a_hit(self):
+        solution = CheckoutSolution(basket_cache=BasketCache())
+        assert solution.checkout("ABCA") == solution.checkout("AABC") == 150
+        stats = solution.basket_cache.stats()
+        assert (stats.hits, stats.misses, stats.entries) == (1, 1, 1)
+
+    def test_keys_hold_only_the_skus_in_the_basket(self):
+        counts = array("q", bytes(8 * 1000))
+        counts[3], counts[700] = 2, 1
+        assert basket_signature(counts) == (3, 2, 700, 1)
+        assert basket_signature({700: 1, 5: 0, 3: 2}) == (3, 2, 700, 1)
+        assert basket_signature({}) == ()
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = BasketCache(max_entries=2)
+        solution = CheckoutSolution(basket_cache=cache)
+        solution.checkout("A")
+        solution.checkout("B")
+        solution.checkout("A")
+        solution.checkout("C")
+        solution.checkout("A")
+        stats = cache.stats()
+        assert (stats.hits, stats.evictions, stats.entries) == (2, 1, 2)
+
+    def test_memory_bound_evicts(self):
+        cache = BasketCache(max_bytes=1000)
+        solution = CheckoutSolution(basket_cache=cache)
+        for skus in string.ascii_uppercase:
+            solution.checkout(skus)
+        stats = cache.stats()
+        assert 0 < stats.size_bytes <= 1000
+        assert stats.evictions == 26 - stats.entries
+
+    def test_price_change_invalidates(self):
+        solution = CheckoutSolution(basket_cache=BasketCache())
+        assert solution.checkout("C") == 20
+        solution.base_prices = {**solution.base_prices, "C": 25}
+        assert solution.checkout("C") == 25
+        assert solution.basket_cache.stats().invalidations == 1
+
+    def test_offer_change_invalidates(self):
+        solution = CheckoutSolution(basket_cache=BasketCache())
+        assert solution.checkout("CC") == 40
+        solution.multibuy_offers = {"C": [MultiBuyOffer(quantity=2, price=30)]}
+        assert solution.checkout("CC") == 30
+
+    def test_invalid_basket_is_not_cached(self):
+        solution = CheckoutSolution(basket_cache=BasketCache())
+        assert solution.checkout("a") == -1
+        assert solution.basket_cache.stats().entries == 0
+
+
+class TestSkuParser:
+    @pytest.mark.parametrize(
+        "skus",
+        ["AABZ", b"AABZ", bytearray(b"AABZ"), memoryview(b"AABZ")],
+        ids=["str", "bytes", "bytearray", "memoryview"],
+    )
+    def test_counts_any_input_type(self, skus):
+        counts = SkuParser("ABZ").count(skus)
+        assert list(counts) == [2, 1, 1]
+
+    @pytest.mark.parametrize("length", [10, 10_000])
+    def test_long_and_short_baskets_agree(self, length):
+        rng = random.Random(length)
+        skus = "".join(rng.choices(string.ascii_uppercase, k=length))
+        expected = Counter(skus)
+        counts = SkuParser(string.ascii_uppercase).count(skus)
+        assert list(counts) == [expected[sku] for sku in string.ascii_uppercase]
+
+    @pytest.mark.parametrize("length", [10, 10_000])
+    @pytest.mark.parametrize("invalid", ["a", "é", "\x00"])
+    def test_reports_first_invalid_position(self, length, invalid):
+        skus = "A" * (length - 3) + invalid + "B" + invalid
+        with pytest.raises(ValueError, match=f"at position {length - 3}$"):
+            SkuParser("AB").count(skus)
+
+    def test_rejects_multi_character_skus(self):
+        with pytest.raises(ValueError):
+            SkuParser(["AB"])
+
+    def test_checkout_accepts_bytes(self):
+        solution = CheckoutSolution()
+        assert solution.checkout(b"AAA") == solution.checkout("AAA") == 130
+        assert solution.checkout(memoryview(b"AAx")) == -1
+
+
+class TestSkuTokenizer:
+    SKUS = ["AB12", "CD34", "EF5", "EF56", "X", "XY"]
+
+    @pytest.mark.parametrize(
+        "skus",
+        [
+            "AB12CD34EF56",
+            "AB12, CD34 EF56",
+            "CD34EF56\nAB12",
+            b"AB12,CD34,EF56",
+            memoryview(b"EF56AB12CD34"),
+        ],
+    )
+    def test_splits_delimited_and_concatenated_baskets(self, skus):
+        counts = SkuTokenizer(self.SKUS).count(skus)
+        assert counts == {0: 1, 1: 1, 3: 1}
+
+    def test_delimited_sku_code_is_taken_as_is(self):
+        tokenizer = SkuTokenizer(["A", "B", "AB"])
+        assert tokenizer.count("AB, A B") == {2: 1, 0: 1, 1: 1}
+
+    @pytest.mark.parametrize(
+        "skus,message",
+        [
+            ("AB12 CD35", "Invalid SKU 'CD35' at position 5"),
+            ("AB12CD34Q", "Invalid SKU 'Q' at position 8"),
+            ("AB12, XYZ", "Invalid SKU 'Z' at position 8"),
+        ],
+    )
+    def test_reports_unknown_sku_position(self, skus, message):
+        with pytest.raises(ValueError, match=f"^{message}$"):
+            SkuTokenizer(self.SKUS).count(skus)
+
+    def test_rejects_ambiguous_split(self):
+        tokenizer = SkuTokenizer(["A", "AB", "BC", "C", "D"])
+        with pytest.raises(ValueError, match="^Ambiguous SKUs 'ABC' at position 3"):
+            tokenizer.count("D, ABCD")
+
+    def test_rejects_sku_codes_with_delimiters(self):
+        with pytest.raises(ValueError):
+            SkuTokenizer(["A B"])
+
+    def test_large_catalog_and_basket(self):
+        skus = [f"S{number:05d}" for number in range(100_000)]
+        rng = random.Random(0)
+        basket = rng.choices(skus, k=20_000)
+        counts = SkuTokenizer(skus).count("".join(basket))
+        expected = Counter(basket)
+        assert counts == {int(sku[1:]): n for sku, n in expected.items()}
+
+    def test_checkout_counts_only_the_skus_in_the_basket(self):
+        solution = CheckoutSolution(
+            base_prices={f"S{number:05d}": number for number in range(10_000)},
+            multibuy_offers={"S00003": [MultiBuyOffer(quantity=2, price=5)]},
+            free_item_offers=[],
+            group_discount_offers=[],
+            basket_cache=BasketCache(),
+            metrics=CheckoutMetrics(),
+        )
+        assert solution.pricing_plan.count("S00003 S00007S00003") == {3: 2, 7: 1}
+        assert solution.checkout("S00003 S00007S00003") == 12
+        assert solution.checkout("S00007, S00003S00003") == 12
+        snapshot = solution.metrics.snapshot()
+        assert (snapshot.cache_hits, snapshot.group_items) == (1, 0)
+        assert snapshot.basket_sizes.total == 6
+
+    def test_checkout_with_multi_character_skus(self):
+        solution = CheckoutSolution(
+            base_prices={"APPLE": 30, "PEAR": 20, "PLUM": 10},
+            multibuy_offers={"APPLE": [MultiBuyOffer(quantity=2, price=50)]},
+            free_item_offers=[
+                FreeItemOffer(sku="PEAR", quantity=2, gift_sku="PLUM", gift_quantity=1)
+            ],
+            group_discount_offers=[],
+        )
+        assert solution.checkout("APPLE APPLE PEAR PEAR PLUM") == 90
+        assert solution.checkout("APPLEAPPLEPEARPEARPLUM") == 90
+        assert solution.checkout_stream(["APPLE AP", "PLE PE", "AR"]) == 70
+        assert solution.checkout("APPLE GRAPE") == -1
+        assert solution.parse_skus("PEAR,PLUM", solution.base_prices) == Counter(
+            {"PEAR": 1, "PLUM": 1}
+        )
+
+
+class TestBulkInput:
+    def test_stream_matches_checkout(self):
+        solution = CheckoutSolution()
+        skus = "AAAAAABBBBEEEFFFNNNMKKPPPPPQQQRRRSSTXYZ"
+        chunks = [skus[i : i + 4] for i in range(0, len(skus), 4)]
+        assert solution.checkout_stream(chunks) == solution.checkout(skus)
+
+    def test_stream_reads_file_objects(self, tmp_path):
+        path = tmp_path / "basket.txt"
+        path.write_text("AAA\nBB\n")
+        solution = CheckoutSolution()
+        with open(path, "rb") as basket:
+            assert solution.checkout_stream(basket) == 130 + 45
+
+    def test_stream_with_invalid_chunk(self):
+        assert CheckoutSolution().checkout_stream(["AA", b"Ax"]) == -1
+
+    @pytest.mark.parametrize(
+        "skus",
+        [
+            ["AB12", "CD34", "EF5", "EF56", "X", "XY"],
+            ["A", "AB", "BC", "C", "D"],
+            ["AB", "A", "BB"],
+        ],
+    )
+    def test_split_chunks_count_as_the_whole_basket(self, skus):
+        tokenizer = SkuTokenizer(skus)
+        rng = random.Random(0)
+        for _ in range(300):
+            parts = rng.choices(
+                skus + [" ", ",", "Q"],
+                weights=[8] * len(skus) + [2, 1, 1],
+                k=rng.randint(0, 12),
+            )
+            text = "".join(parts)
+            cuts = sorted(rng.sample(range(len(text) + 1), min(3, len(text) + 1)))
+            chunks = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+            try:
+                expected = tokenizer.count(text)
+            except ValueError:
+                expected = None
+            counts = {}
+            try:
+                num_items = tokenizer.count_chunks(chunks, counts)
+            except ValueError:
+                counts = None
+            else:
+                assert num_items == sum(counts.values())
+            assert counts == expected, (text, chunks)
+
+    def test_stream_without_delimiters_carries_little(self):
+        solution = CheckoutSolution(
+            base_prices={f"S{number:05d}": 1 for number in range(100)},
+            multibuy_offers={},
+            free_item_offers=[],
+            group_discount_offers=[],
+        )
+        basket = "".join(f"S{number % 100:05d}" for number in range(20_000))
+
+        def chunks():
+            for start in range(0, len(basket), 4096):
+                yield basket[start : start + 4096].encode("ascii")
+
+        tracemalloc.start()
+        try:
+            assert solution.checkout_stream(chunks()) == 20_000
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # The basket is 120KB: only a chunk, a few characters and the counts
+        # may be held at once
+        assert peak < 40_000
+
+    @pytest.mark.parametrize(
+        "encoded,expected",
+        [
+            ("", 0),
+            ("A*3", 130),
+            ("A*3 B*2 C", 130 + 45 + 20),
+            ("A*1 A*2", 130),
+            ("A*1000000", 200 * 200000),
+            ("A*0", 0),
+        ],
+    )
+    def test_run_length(self, encoded, expected):
+        assert CheckoutSolution().checkout_run_length(encoded) == expected
+
+    @pytest.mark.parametrize("encoded", ["a*3", "A*", "A*-1", "A*x", "AB*2"])
+    def test_invalid_run_length(self, encoded):
+        assert CheckoutSolution().checkout_run_length(encoded) == -1
+
+
+class TestBasket:
+    def test_offer_components_are_independent(self):
+        plan = CheckoutSolution().pricing_plan
+        components = plan.sku_components
+        assert components[plan.ordinals["E"]] == components[plan.ordinals["B"]]
+        assert components[plan.ordinals["S"]] == components[plan.ordinals["X"]]
+        assert components[plan.ordinals["A"]] != components[plan.ordinals["B"]]
+
+    def test_scans_match_checkout(self):
+        solution = CheckoutSolution()
+        basket = solution.basket()
+        rng = random.Random(7)
+        scanned = []
+        for _ in range(300):
+            if scanned and rng.random() < 0.3:
+                sku = scanned.pop(rng.randrange(len(scanned)))
+                total = basket.remove(sku)
+            else:
+                sku = rng.choice(string.ascii_uppercase)
+                scanned.append(sku)
+                total = basket.add(sku)
+            assert total == basket.total() == solution.checkout("".join(scanned))
+
+    def test_bulk_quantities(self):
+        basket = CheckoutSolution().basket()
+        basket.add("A", 8)
+        basket.add("E", 2)
+        basket.add("B")
+        assert basket.total() == 330 + 80
+        assert basket.count("A") == 8
+
+    def test_tokenized_catalog_counts_stay_sparse(self):
+        solution = fruit_solution()
+        basket = solution.basket()
+        for sku in ["PEAR", "PEAR", "APPLE", "KIWI", "APPLE"]:
+            basket.add(sku)
+        assert basket.total() == solution.checkout("PEAR PEAR APPLE KIWI APPLE")
+        assert basket.count("PLUM") == 0
+        assert len(basket._counts) == 3
+
+    def test_invalid_scans(self):
+        basket = CheckoutSolution().basket()
+        with pytest.raises(ValueError):
+            basket.add("a")
+        with pytest.raises(ValueError):
+            basket.remove("A")
+        assert basket.total() == 0
+
+
+class TestOfferGraph:
+    CHAIN = [
+        FreeItemOffer(sku="B", quantity=1, gift_sku="C", gift_quantity=1),
+        FreeItemOffer(sku="A", quantity=1, gift_sku="B", gift_quantity=1),
+    ]
+
+    @pytest.mark.parametrize("offers", [CHAIN, CHAIN[::-1]])
+    def test_gifts_settle_before_triggering(self, offers):
+        solution = CheckoutSolution(
+            free_item_offers=offers,
+            multibuy_offers={},
+            group_discount_offers=[],
+            base_prices={"A": 10, "B": 20, "C": 40},
+        )
+        # The free B cannot also earn a free C
+        assert solution.checkout("ABC") == 10 + 40
+        assert solution.apply_free_item_offers(Counter("ABC"), offers) == Counter(
+            {"A": 1, "B": 0, "C": 1}
+        )
+
+    def test_plan_indexes_offers_by_trigger(self):
+        plan = CheckoutSolution(
+            free_item_offers=self.CHAIN,
+            multibuy_offers={},
+            group_discount_offers=[],
+            base_prices={"A": 10, "B": 20, "C": 40},
+        ).pricing_plan
+        assert plan.free_item_triggers == ((0, ((1, 1, 1),)), (1, ((1, 2, 1),)))
+
+    @pytest.mark.parametrize("offers", [CHAIN, CHAIN[::-1]])
+    def test_sparse_baskets_visit_their_triggers_in_order(self, offers):
+        solution = CheckoutSolution(
+            free_item_offers=[
+                FreeItemOffer(
+                    sku=offer.sku * 2,
+                    quantity=offer.quantity,
+                    gift_sku=offer.gift_sku * 2,
+                    gift_quantity=offer.gift_quantity,
+                )
+                for offer in offers
+            ],
+            multibuy_offers={},
+            group_discount_offers=[],
+            base_prices={"AA": 10, "BB": 20, "CC": 40, "DD": 5},
+        )
+        counts = solution.pricing_plan.count("AA BB CC")
+        assert solution.pricing_plan.apply_free_item_offers(counts) == 1
+        assert {ordinal: n for ordinal, n in counts.items() if n} == {0: 1, 2: 1}
+        assert solution.checkout("AA BB CC") == 10 + 40
+        assert solution.checkout("BB CC DD") == 20 + 5
+
+    def test_sparse_baskets_only_visit_their_group_offers(self, monkeypatch):
+        solution = CheckoutSolution(
+            free_item_offers=[],
+            multibuy_offers={},
+            group_discount_offers=[
+                GroupDiscountOffer(skus=["CC", "DD"], quantity=2, price=1),
+                GroupDiscountOffer(skus=["AA", "BB"], quantity=2, price=25),
+            ],
+            base_prices={"AA": 20, "BB": 20, "CC": 40, "DD": 5},
+        )
+        plan = solution.pricing_plan
+        assert plan.basket_group_offers(plan.count("AA BB AA")) == [
+            plan.group_offers[1]
+        ]
+        for budget in (None, 10**9):
+            counts = plan.count("AA BB AA")
+            assert plan.resolve_offers(counts, budget) == (0, 25)
+            # Members the basket does not hold never show up in the counts
+            assert set(counts) == {0, 1}
+            assert sum(counts.values()) == 1
+            assert plan.multibuy_cost(counts) == 20
+
+    def test_static_application_orders_each_offer_list_once(self, monkeypatch):
+        calls = []
+
+        def order(offers, trigger, gift):
+            calls.append(offers)
+            return order_free_item_offers(offers, trigger, gift)
+
+        monkeypatch.setattr(checkout_solution, "order_free_item_offers", order)
+        offers = [FreeItemOffer(sku="A", quantity=7, gift_sku="D", gift_quantity=3)]
+        for _ in range(3):
+            CheckoutSolution.apply_free_item_offers(Counter("AAAAAAAD"), offers)
+        assert len(calls) == 1
+
+    def test_self_referencing_offers_are_allowed(self):
+        plan = CheckoutSolution().pricing_plan
+        assert plan.ordinals["F"] in dict(plan.free_item_triggers)
+
+    def test_cycles_are_rejected(self):
+        offers = self.CHAIN + [
+            FreeItemOffer(sku="C", quantity=2, gift_sku="A", gift_quantity=1)
+        ]
+        with pytest.raises(OfferCycleError, match="B -> C -> A -> B"):
+            CheckoutSolution(free_item_offers=offers)
+
+
+class TestOfferSolver:
+    @staticmethod
+    def solution(**kwargs):
+        return CheckoutSolution(free_item_offers=[], **kwargs)
+
+    def test_group_overlapping_multibuy(self):
+        config = dict(
+            multibuy_offers={"A": [MultiBuyOffer(quantity=3, price=100)]},
+            group_discount_offers=[
+                GroupDiscountOffer(skus=["A", "C"], quantity=2, price=90)
+            ],
+            base_prices={"A": 50, "C": 45},
+        )
+        assert self.solution(**config).checkout("AAAC") == 180
+        assert self.solution(solver_budget_ms=100, **config).checkout("AAAC") == 145
+
+    def test_overlapping_groups(self):
+        config = dict(
+            multibuy_offers={},
+            group_discount_offers=[
+                GroupDiscountOffer(skus=["A", "B"], quantity=2, price=50),
+                GroupDiscountOffer(skus=["B", "C"], quantity=2, price=30),
+            ],
+            base_prices={"A": 40, "B": 30, "C": 25},
+        )
+        assert self.solution(**config).checkout("ABC") == 75
+        solver = self.solution(solver_budget_ms=100, **config)
+        assert solver.checkout("ABC") == 70
+        assert solver.basket().add("A") == 40
+        assert solver.checkout_many(["ABC", "AB", "x"]) == [70, 50, -1]
+
+    def test_matches_greedy_where_greedy_is_optimal(self):
+        greedy = CheckoutSolution()
+        solver = CheckoutSolution(solver_budget_ms=100)
+        rng = random.Random(3)
+        for _ in range(200):
+            skus = "".join(rng.choices("STXYZAE", k=rng.randint(0, 15)))
+            assert solver.checkout(skus) == greedy.checkout(skus)
+
+    @staticmethod
+    def brute_force(plan, skus):
+        """Cheapest total over every way of applying the offers."""
+        counts = dict(Counter(plan.ordinals[sku] for sku in skus))
+        for trigger, _, gift, _ in plan.free_item_offers:
+            counts.setdefault(trigger, 0)
+            counts.setdefault(gift, 0)
+        for members, _, _ in plan.group_offers:
+            for sku in members:
+                counts.setdefault(sku, 0)
+
+        def groups_cost(index):
+            if index == len(plan.group_offers):
+                return sum(plan.sku_cost(sku, n) for sku, n in counts.items())
+            members, quantity, price = plan.group_offers[index]
+            best = groups_cost(index + 1)
+            for taken in itertools.product(
+                *(range(counts[sku] + 1) for sku in members)
+            ):
+                if sum(taken) and not sum(taken) % quantity:
+                    for sku, n in zip(members, taken):
+                        counts[sku] -= n
+                    cost = sum(taken) // quantity * price + groups_cost(index + 1)
+                    best = min(best, cost)
+                    for sku, n in zip(members, taken):
+                        counts[sku] += n
+            return best
+
+        def free_cost(index):
+            if index == len(plan.free_item_offers):
+                return groups_cost(0)
+            trigger, quantity, gift, gift_quantity = plan.free_item_offers[index]
+            most = min(counts[gift], counts[trigger] // quantity * gift_quantity)
+            best = None
+            for num_free in range(most + 1):
+                counts[gift] -= num_free
+                cost = free_cost(index + 1)
+                counts[gift] += num_free
+                best = cost if best is None else min(best, cost)
+            return best
+
+        return free_cost(0)
+
+    def test_free_items_can_go_to_a_group_instead(self):
+        config = dict(
+            free_item_offers=[
+                FreeItemOffer(sku="E", quantity=2, gift_sku="B", gift_quantity=1)
+            ],
+            multibuy_offers={},
+            group_discount_offers=[
+                GroupDiscountOffer(skus=["B", "C", "D"], quantity=3, price=50)
+            ],
+            base_prices={"E": 40, "B": 30, "C": 30, "D": 30},
+        )
+        greedy = CheckoutSolution(**config)
+        solver = CheckoutSolution(solver_budget_ms=100, **config)
+        assert greedy.checkout("EEBCD") == 140
+        assert solver.checkout("EEBCD") == 130
+        assert self.brute_force(solver.pricing_plan, "EEBCD") == 130
+        assert solver.checkout_many(["EEBCD", "EEB"]) == [130, 80]
+        basket = solver.basket()
+        for sku in "EEBCD":
+            basket.add(sku)
+        assert basket.total() == 130
+
+    def test_matches_brute_force_on_overlapping_offers(self):
+        config = dict(
+            free_item_offers=[
+                FreeItemOffer(sku="E", quantity=2, gift_sku="B", gift_quantity=1),
+                FreeItemOffer(sku="F", quantity=3, gift_sku="F", gift_quantity=1),
+                FreeItemOffer(sku="B", quantity=2, gift_sku="C", gift_quantity=1),
+            ],
+            multibuy_offers={
+                "B": [MultiBuyOffer(quantity=2, price=45)],
+                "F": [MultiBuyOffer(quantity=2, price=15)],
+            },
+            group_discount_offers=[
+                GroupDiscountOffer(skus=["B", "C", "F"], quantity=3, price=50),
+                GroupDiscountOffer(skus=["C", "D"], quantity=2, price=35),
+            ],
+            base_prices={"E": 40, "B": 30, "C": 30, "D": 30, "F": 25},
+        )
+        solver = CheckoutSolution(solver_budget_ms=1000, **config)
+        rng = random.Random(9)
+        for _ in range(100):
+            skus = "".join(rng.choices("EBCDF", k=rng.randint(0, 8)))
+            assert solver.checkout(skus) == self.brute_force(
+                solver.pricing_plan, skus
+            ), skus
+
+    def test_exhausted_budget_returns_best_found(self):
+        solution = self.solution(
+            multibuy_offers={"A": [MultiBuyOffer(quantity=3, price=100)]},
+            group_discount_offers=[
+                GroupDiscountOffer(skus=["A", "B", "C", "D"], quantity=3, price=100)
+            ],
+            base_prices={"A": 50, "B": 45, "C": 40, "D": 35},
+        )
+        plan = solution.pricing_plan
+        counts = plan.count("ABCD" * 50)
+        greedy_counts = list(counts)
+        greedy = plan.apply_group_offers(greedy_counts) + plan.multibuy_cost(
+            greedy_counts
+        )
+        result = solve_group_offers(plan, counts, budget_ns=0)
+        assert not result.optimal
+        assert result.cost <= greedy
+
+
+class TestCatalog:
+    CATALOG = {
+        "base_prices": {"A": 50, "B": 30, "E": 40},
+        "multibuy_offers": {"A": [{"quantity": 3, "price": 130}]},
+        "free_item_offers": [
+            {"sku": "E", "quantity": 2, "gift_sku": "B", "gift_quantity": 1}
+        ],
+        "group_discount_offers": [],
+    }
+
+    @staticmethod
+    def write(path, catalog, mtime_ns):
+        path.write_text(json.dumps(catalog))
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def test_json_and_csv_load_the_same_catalog(self, tmp_path):
+        json_path = tmp_path / "catalog.json"
+        json_path.write_text(json.dumps(self.CATALOG))
+        csv_path = tmp_path / "catalog.csv"
+        csv_path.write_text(
+            "type,sku,price,quantity,gift_sku,gift_quantity,skus\n"
+            "price,A,50,,,,\n"
+            "price,B,30,,,,\n"
+            "price,E,40,,,,\n"
+            "multibuy,A,130,3,,,\n"
+            "free_item,E,,2,B,1,\n"
+        )
+        for path in (json_path, csv_path):
+            solution = CheckoutSolution()
+            load_catalog(path).install(solution)
+            assert solution.checkout("AAAEEB") == 210
+            assert solution.checkout("C") == -1
+
+    def test_csv_rejects_unknown_row_type(self, tmp_path):
+        path = tmp_path / "catalog.csv"
+        path.write_text("type,sku,price\ndiscount,A,10\n")
+        with pytest.raises(ValueError, match="line 2"):
+            load_catalog(path)
+
+    def test_watcher_swaps_in_changed_catalog(self, tmp_path):
+        path = tmp_path / "catalog.json"
+        self.write(path, self.CATALOG, 1_000_000_000)
+        solution = CheckoutSolution()
+        watcher = CatalogWatcher(path, solution)
+        assert solution.checkout("AAA") == 130
+        assert not watcher.poll()
+
+        self.write(
+            path,
+            {**self.CATALOG, "base_prices": {"A": 20, "B": 30, "E": 40}},
+            2_000_000_000,
+        )
+        assert watcher.poll()
+        assert solution.checkout("A") == 20
+        assert solution.base_prices == {"A": 20, "B": 30, "E": 40}
+
+    def test_watcher_keeps_old_plan_on_bad_catalog(self, tmp_path):
+        path = tmp_path / "catalog.json"
+        self.write(path, self.CATALOG, 1_000_000_000)
+        solution = CheckoutSolution()
+        watcher = CatalogWatcher(path, solution)
+        plan = solution.pricing_plan
+
+        bad = {**self.CATALOG, "multibuy_offers": {"Z": [{"quantity": 2, "price": 1}]}}
+        self.write(path, bad, 2_000_000_000)
+        assert not watcher.poll()
+        assert isinstance(watcher.last_error, ValueError)
+        assert solution.pricing_plan is plan
+        # The broken version is not retried until the file changes again
+        assert not watcher.poll()
+
+        self.write(path, self.CATALOG, 3_000_000_000)
+        assert watcher.poll()
+        assert watcher.last_error is None
+
+    def test_watcher_survives_a_catalog_of_the_wrong_shape(self, tmp_path):
+        path = tmp_path / "catalog.json"
+        self.write(path, self.CATALOG, 1_000_000_000)
+        solution = CheckoutSolution()
+        watcher = CatalogWatcher(path, solution)
+        plan = solution.pricing_plan
+
+        self.write(path, [self.CATALOG], 2_000_000_000)
+        assert not watcher.poll()
+        assert watcher.last_error is not None
+        assert solution.pricing_plan is plan
+
+        watcher.start(interval=0.01)
+        try:
+            self.write(path, {**self.CATALOG, "base_prices": []}, 3_000_000_000)
+            deadline = time.monotonic() + 5
+            while watcher._signature[0] != 3_000_000_000:
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+            self.write(path, self.CATALOG, 4_000_000_000)
+            while solution.pricing_plan is plan:
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+        finally:
+            watcher.stop()
+        assert watcher.last_error is None
+
+
+class TestCheckoutMetrics:
+    def test_disabled_by_default(self):
+        assert CheckoutSolution().metrics is None
+
+    def test_records_stages_and_offers(self):
+        metrics = CheckoutMetrics(sample_interval=1)
+        solution = CheckoutSolution(metrics=metrics)
+        assert solution.checkout("EEB") == 80
+        assert solution.checkout("STXA") == 95
+        assert solution.checkout("Ax") == -1
+
+        snapshot = metrics.snapshot()
+        assert (snapshot.priced, snapshot.invalid) == (2, 1)
+        assert snapshot.free_items == 1
+        assert snapshot.group_items == 3
+        assert snapshot.stages["parse"].count == 3
+        assert snapshot.stages["total"].count == 3
+        assert snapshot.stages["multibuy"].count == 2
+        assert snapshot.stages["total"].total >= snapshot.stages["parse"].total
+        sizes = snapshot.basket_sizes
+        assert sizes.count == 2 and sizes.total == 7
+        # 3 items fall in the (2, 4] bucket, and so do 4
+        assert sizes.counts[sizes.bounds.index(4)] == 2
+
+    def test_empty_basket_falls_in_the_first_bucket(self):
+        metrics = CheckoutMetrics()
+        assert CheckoutSolution(metrics=metrics).checkout("") == 0
+        sizes = metrics.snapshot().basket_sizes
+        assert sizes.bounds[0] == 1
+        assert sizes.counts[0] == sizes.count == 1
+        assert (
+            'checkout_basket_items_bucket{le="1"} 1'
+            in to_prometheus(metrics.snapshot()).splitlines()
+        )
+
+    def test_matches_uninstrumented_totals(self):
+        plain = CheckoutSolution()
+        measured = CheckoutSolution(metrics=CheckoutMetrics(), solver_budget_ms=10)
+        rng = random.Random(7)
+        for _ in range(200):
+            skus = "".join(rng.choices(string.ascii_uppercase, k=rng.randrange(30)))
+            assert measured.checkout(skus) == legacy_checkout(plain, skus)
+
+    def test_counts_cache_hits(self):
+        metrics = CheckoutMetrics()
+        solution = CheckoutSolution(basket_cache=BasketCache(), metrics=metrics)
+        assert solution.checkout("AAB") == solution.checkout("ABA") == 130
+        snapshot = metrics.snapshot()
+        assert (snapshot.priced, snapshot.cache_hits) == (2, 1)
+        assert snapshot.stages["free_items"].count == 1
+
+    def test_reset_and_threads(self):
+        metrics = CheckoutMetrics()
+        solution = CheckoutSolution(metrics=metrics)
+        solution.checkout("A")
+        metrics.reset()
+        assert metrics.snapshot().priced == 0
+
+        def run():
+            for _ in range(500):
+                solution.checkout("ABC")
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        snapshot = metrics.snapshot()
+        assert snapshot.priced == 2000
+        assert snapshot.basket_sizes.total == 6000
+
+    def test_samples_stage_timings(self):
+        metrics = CheckoutMetrics(sample_interval=4)
+        solution = CheckoutSolution(metrics=metrics)
+        for _ in range(10):
+            solution.checkout("EEB")
+        snapshot = metrics.snapshot()
+        assert snapshot.priced == snapshot.stages["total"].count == 10
+        assert snapshot.free_items == 10
+        # The first checkout of every four is timed stage by stage
+        assert snapshot.stages["parse"].count == 3
+        assert snapshot.stages["multibuy"].count == 3
+        with pytest.raises(ValueError):
+            CheckoutMetrics(sample_interval=0)
+
+    @pytest.mark.parametrize("vectorized", [True, False])
+    def test_buckets_pending_records_in_batches(self, vectorized, monkeypatch):
+        if not vectorized:
+            monkeypatch.setattr(checkout_metrics, "np", None)
+        metrics = CheckoutMetrics()
+        solution = CheckoutSolution(metrics=metrics)
+        baskets = ["", "A", "AB", "EEB", "STXA", "Ax"] * 400
+        for skus in baskets:
+            solution.checkout(skus)
+        recorder = metrics.recorder()
+        # Over FLUSH_SIZE values were recorded: some have been bucketed
+        pending = len(recorder.priced) + len(recorder.invalid)
+        assert 0 < pending < checkout_metrics.FLUSH_SIZE
+        snapshot = metrics.snapshot()
+        assert (snapshot.priced, snapshot.invalid) == (2000, 400)
+        assert snapshot.stages["total"].count == 2400
+        assert snapshot.basket_sizes.total == 400 * (1 + 2 + 3 + 4)
+        assert snapshot.free_items == 400
+        assert snapshot.group_items == 400 * 3
+        # Empty baskets land in the first bucket, 3 and 4 items in (2, 4]
+        sizes = snapshot.basket_sizes
+        assert sizes.counts[0] == 800
+        assert sizes.counts[sizes.bounds.index(4)] == 800
+        recorder.flush()
+        assert not recorder.priced
+        assert metrics.snapshot() == snapshot
+
+    def test_new_metrics_get_new_recorders(self):
+        solution = CheckoutSolution(metrics=CheckoutMetrics())
+        solution.checkout("A")
+        solution.metrics = metrics = CheckoutMetrics()
+        solution.checkout("AB")
+        assert metrics.snapshot().basket_sizes.total == 2
+        solution.metrics = None
+        assert solution.checkout("AB") == 80
+
+    def test_counts_free_groups(self):
+        solution = CheckoutSolution(
+            base_prices={"A": 10, "B": 20},
+            multibuy_offers={},
+            free_item_offers=[],
+            group_discount_offers=[
+                GroupDiscountOffer(skus=["B", "A"], quantity=2, price=0)
+            ],
+            metrics=CheckoutMetrics(),
+        )
+        assert solution.checkout("ABA") == 10
+        assert solution.metrics.snapshot().group_items == 2
+
+    @pytest.mark.parametrize("solver_budget_ms", [None, 10])
+    @pytest.mark.parametrize("vectorized", [True, False])
+    def test_records_every_checkout_method(
+        self, solver_budget_ms, vectorized, monkeypatch
+    ):
+        if not vectorized:
+            monkeypatch.setattr(batch_pricing, "np", None)
+        baskets = ["EEB", "STXA", "Ax", "", "EEEEBBSTXYZ", "KKKFFF"] * 3
+        expected = CheckoutMetrics(sample_interval=1)
+        solution = CheckoutSolution(
+            solver_budget_ms=solver_budget_ms, metrics=expected
+        )
+        totals = [solution.checkout(skus) for skus in baskets]
+        expected = expected.snapshot()
+
+        for price in (
+            lambda solution: solution.checkout_many(baskets),
+            lambda solution: [
+                solution.checkout_stream(iter(skus)) for skus in baskets
+            ],
+            lambda solution: [
+                solution.checkout_run_length(" ".join(skus)) for skus in baskets
+            ],
+        ):
+            metrics = CheckoutMetrics()
+            solution = CheckoutSolution(
+                solver_budget_ms=solver_budget_ms, metrics=metrics
+            )
+            assert price(solution) == totals
+            snapshot = metrics.snapshot()
+            assert snapshot.basket_sizes == expected.basket_sizes
+            assert snapshot[2:] == expected[2:]
+            assert snapshot.stages["parse"].count == len(baskets)
+            assert snapshot.stages["multibuy"].count == expected.priced
+
+    def test_prometheus_text(self):
+        metrics = CheckoutMetrics(sample_interval=1)
+        solution = CheckoutSolution(metrics=metrics)
+        solution.checkout("EEB")
+        solution.checkout("x")
+        text = to_prometheus(metrics.snapshot())
+        lines = text.splitlines()
+        assert "# TYPE checkout_stage_duration_seconds histogram" in lines
+        assert 'checkout_stage_duration_seconds_bucket{stage="parse",le="+Inf"} 2' in (
+            lines
+        )
+        assert 'checkout_stage_duration_seconds_count{stage="multibuy"} 1' in lines
+        assert 'checkout_basket_items_bucket{le="4"} 1' in lines
+        assert 'checkout_baskets_total{result="invalid"} 1' in lines
+        assert 'checkout_offer_items_total{offer="free_item"} 1' in lines
+        # Bucket counts are cumulative
+        parse_buckets = [
+            int(line.rsplit(" ", 1)[1])
+            for line in lines
+            if line.startswith('checkout_stage_duration_seconds_bucket{stage="parse"')
+        ]
+        assert parse_buckets == sorted(parse_buckets)
+
+
+def fruit_solution() -> CheckoutSolution:
+    return CheckoutSolution(
+        base_prices={"APPLE": 30, "PEAR": 20, "PLUM": 10, "KIWI": 25},
+        multibuy_offers={"APPLE": [MultiBuyOffer(quantity=2, price=50)]},
+        free_item_offers=[
+            FreeItemOffer(sku="PEAR", quantity=2, gift_sku="PLUM", gift_quantity=1)
+        ],
+        group_discount_offers=[
+            GroupDiscountOffer(skus=["KIWI", "PEAR", "PLUM"], quantity=2, price=30)
+        ],
+    )
+
+
+@pytest.fixture
+def shared_plan():
+    plans = []
+
+    def share(solution: CheckoutSolution) -> SharedPlan:
+        plans.append(SharedPlan.create(solution.pricing_plan))
+        return plans[-1]
+
+    yield share
+    for plan in plans:
+        plan.close()
+        plan.unlink()
+
+
+class TestSharedPlan:
+    @pytest.mark.parametrize("seed", range(3))
+    def test_matches_checkout(self, shared_plan, seed):
+        rng = random.Random(seed)
+        solution = CheckoutSolution()
+        plan = shared_plan(solution)
+        for _ in range(500):
+            skus = "".join(
+                rng.choices(string.ascii_uppercase + "aé", k=rng.randint(0, 60))
+            )
+            assert plan.checkout(skus) == solution.checkout(skus)
+
+    def test_matches_checkout_with_multi_character_skus(self, shared_plan):
+        rng = random.Random(0)
+        solution = fruit_solution()
+        plan = shared_plan(solution)
+        fruit = ["APPLE", "PEAR", "PLUM", "KIWI"]
+        for _ in range(200):
+            basket = rng.choices(fruit, k=rng.randint(0, 12))
+            for skus in (" ".join(basket), "".join(basket), ",".join(basket)):
+                assert plan.checkout(skus) == solution.checkout(skus)
+        assert plan.checkout("APPLE GRAPE") == -1
+
+    def test_reports_first_invalid_sku(self, shared_plan):
+        plan = shared_plan(CheckoutSolution())
+        with pytest.raises(ValueError, match="Invalid SKU 'x' at position 2"):
+            plan.count("ABxCy")
+        with pytest.raises(ValueError, match="Invalid SKU 'é' at position 1"):
+            plan.count("Aé")
+        assert plan.count(b"ABA") == {0: 2, 1: 1}
+
+    def test_attaches_by_name(self, shared_plan):
+        plan = shared_plan(fruit_solution())
+        attached = SharedPlan.attach(plan.name)
+        try:
+            assert attached.checkout("APPLEAPPLEKIWI") == 75
+        finally:
+            attached.close()
+
+    def test_rejects_other_segments(self):
+        memory = SharedMemory(create=True, size=1024)
+        try:
+            with pytest.raises(ValueError, match="does not hold"):
+                SharedPlan.attach(memory.name)
+        finally:
+            memory.close()
+            memory.unlink()
+
+
+class TestSharedCheckoutPool:
+    def test_prices_batches_in_order(self):
+        rng = random.Random(0)
+        solution = CheckoutSolution()
+        baskets = [
+            "".join(rng.choices(string.ascii_uppercase + "a", k=rng.randint(0, 30)))
+            for _ in range(300)
+        ]
+        with SharedCheckoutPool(solution.pricing_plan, workers=2, batch_size=7) as pool:
+            assert pool.checkout_many(baskets) == [
+                solution.checkout(skus) for skus in baskets
+            ]
+            assert pool.checkout_many([]) == []
+            assert pool.checkout("AAA") == 130
+
+    def test_update_switches_plans(self):
+        solution = CheckoutSolution()
+        with SharedCheckoutPool(solution.pricing_plan, workers=1) as pool:
+            solution.base_prices = dict(solution.base_prices, C=25)
+            pool.update(solution.pricing_plan)
+            assert pool.checkout("CC") == 50
+            fruit = fruit_solution()
+            pool.update(fruit.pricing_plan)
+            assert pool.checkout("PEAR PEAR PLUM KIWI") == fruit.checkout(
+                "PEAR PEAR PLUM KIWI"
+            )
+
+    def test_leaves_the_parent_heap_alone(self):
+        gc.freeze()
+        try:
+            frozen = gc.get_freeze_count()
+            with SharedCheckoutPool(CheckoutSolution().pricing_plan, workers=1) as pool:
+                assert gc.get_freeze_count() == frozen
+                assert gc.isenabled()
+                # The worker froze what it inherited instead
+                assert pool._executor.submit(gc.get_freeze_count).result() > 0
+            assert gc.get_freeze_count() == frozen
+        finally:
+            gc.unfreeze()
+
+
+class TestAllocations:
+    BASKET = "AAAAAABBBBEEEFFFNNNMKKPPPPPQQQRRRSSTXYZ"
+
+    @staticmethod
+    def traced_growth(checkout, skus, calls=1000):
+        gc.disable()
+        tracemalloc.start()
+        try:
+            for _ in range(calls):
+                checkout(skus)
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            for _ in range(calls):
+                checkout(skus)
+            after, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            gc.enable()
+        return after - before, peak - before
+
+    def test_checkout_keeps_nothing_and_allocates_little(self):
+        solution = CheckoutSolution()
+        retained, peak = self.traced_growth(solution.checkout, self.BASKET)
+        # Nothing survives a call, and only the encoded basket and a few ints
+        # are alive at any one time: a Counter or a copied basket per call
+        # would blow well past this
+        assert retained < 256
+        assert peak < 512
+
+    def test_invalid_basket_keeps_nothing(self):
+        solution = CheckoutSolution()
+        retained, _ = self.traced_growth(solution.checkout, "ABCx")
+        assert retained < 256
@@ -0,0 +1,87 @@
+from array import array
+
+import numpy as np
+import pytest
+from entry_point_mapping import EntryPointMapping
+from solutions.DMO import numeric_kernels
+from solutions.DMO.demo_round2_solution import DemoRound2Solution
+
+
+@pytest.fixture(params=["numpy", "pure"])
+def solution(request, monkeypatch):
+    if request.param == "pure":
+        monkeypatch.setattr(numeric_kernels, "np", None)
+    return DemoRound2Solution()
+
+
+class TestArraySum:
+    def test_sums_every_kind_of_sequence(self, solution):
+        values = [3, -1, 7, 0, 12]
+        assert solution.array_sum(values) == 21
+        assert solution.array_sum(array("q", values)) == 21
+        assert solution.array_sum(array("B", [255, 255])) == 510
+        assert solution.array_sum([]) == 0
+        assert solution.array_sum(array("q")) == 0
+
+    def test_never_overflows(self, solution):
+        largest = 2**63 - 1
+        assert solution.array_sum(array("q", [largest] * 5)) == 5 * largest
+        assert solution.array_sum(array("Q", [2**64 - 1] * 3)) == 3 * (2**64 - 1)
+        assert solution.array_sum([10**30, -1]) == 10**30 - 1
+
+    def test_sums_numpy_arrays_exactly(self):
+        solution = DemoRound2Solution()
+        assert solution.array_sum(np.array([3, -1, 7])) == 9
+        assert solution.array_sum(np.full(5, -(2**63))) == -5 * 2**63
+        assert solution.array_sum(np.array([2**64 - 1] * 3, dtype=np.uint64)) == (
+            3 * (2**64 - 1)
+        )
+        assert solution.array_sum(np.array([10**30, 1], dtype=object)) == 10**30 + 1
+        assert solution.array_sum(np.array([0.5, 0.25])) == 0.75
+
+    def test_sums_in_chunks_when_int64_could_overflow(self):
+        values = np.full(1000, 2**60, dtype=np.int64)
+        assert numeric_kernels.array_sum(values) == 1000 * 2**60
+        assert numeric_kernels.array_sum(values.reshape(10, 100)) == 1000 * 2**60
+
+
+class TestIntRange:
+    def test_is_a_lazy_range(self):
+        numbers = DemoRound2Solution().int_range(3, 10**12)
+        assert isinstance(numbers, range)
+        assert len(numbers) == 10**12 - 3
+        assert numbers[:3] == range(3, 6)
+        assert list(DemoRound2Solution().int_range(5, 2)) == []
+
+    def test_mapping_sends_a_list(self):
+        assert EntryPointMapping().int_range(2, 6) == [2, 3, 4, 5]
+
+
+class TestFilterPass:
+    def test_keeps_values_at_or_above_the_threshold(self, solution):
+        values = [5, -3, 8, 5, 1, 9]
+        assert solution.filter_pass(values, 5) == [5, 8, 5, 9]
+        assert solution.filter_pass(values, 100) == []
+        assert solution.filter_pass(values, 2**70) == []
+        assert solution.filter_pass(values, -(2**70)) == values
+
+    def test_returns_the_same_kind_of_sequence(self, solution):
+        passed = solution.filter_pass(array("q", [5, -3, 8]), 0)
+        assert passed == array("q", [5, 8])
+        passed = solution.filter_pass(array("d", [0.5, 2.5]), 1)
+        assert passed == array("d", [2.5])
+
+    def test_filters_numpy_arrays(self):
+        solution = DemoRound2Solution()
+        passed = solution.filter_pass(np.array([5, -3, 8]), 0)
+        assert isinstance(passed, np.ndarray)
+        assert passed.tolist() == [5, 8]
+        assert solution.filter_pass(np.array([5, -3]), 2**70).tolist() == []
+        passed = solution.filter_pass(np.array([10**30, 1], dtype=object), 2)
+        assert passed.tolist() == [10**30]
+
+    def test_filters_arrays_in_chunks(self, solution, monkeypatch):
+        monkeypatch.setattr(numeric_kernels, "CHUNK_SIZE", 4)
+        passed = solution.filter_pass(array("q", range(-10, 11)), 3)
+        assert passed == array("q", range(3, 11))
+        assert solution.filter_pass(array("q", range(5)), 10) == array("q")
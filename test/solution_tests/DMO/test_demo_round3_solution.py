@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from entry_point_mapping import EntryPointMapping
+from solutions.DMO.demo_round3_solution import DemoRound3Solution
+from solutions.DMO.inventory_item import InventoryItem
+from solutions.DMO.inventory_store import InventoryStore
+
+APPLE = InventoryItem(sku="A", name="Apple", price=50)
+BANANA = InventoryItem(sku="B", name="Banana", price=20)
+
+
+class TestDemoRound3:
+    def test_empty_inventory(self):
+        solution = DemoRound3Solution()
+        assert solution.inventory_size() == 0
+        assert solution.inventory_get("A") is None
+
+    def test_adds_up_units_per_sku(self):
+        solution = DemoRound3Solution()
+        solution.inventory_add(APPLE, 3)
+        solution.inventory_add(BANANA, 1)
+        solution.inventory_add(APPLE, 2)
+        assert solution.inventory_size() == 6
+        assert solution.inventory_get("A") == {"sku": "A", "name": "Apple", "price": 50}
+        assert solution.store.get("A").quantity == 5
+        assert len(solution.store) == 2
+
+    def test_projection_is_cached_until_the_item_changes(self):
+        solution = DemoRound3Solution()
+        solution.inventory_add(APPLE, 1)
+        projection = solution.inventory_get("A")
+        solution.inventory_add(APPLE, 1)
+        assert solution.inventory_get("A") is projection
+        solution.inventory_add(InventoryItem(sku="A", name="Apple", price=45), 1)
+        assert solution.inventory_get("A") == {"sku": "A", "name": "Apple", "price": 45}
+        assert solution.inventory_size() == 3
+
+    def test_through_the_entry_point_mapping(self):
+        mapping = EntryPointMapping()
+        mapping.inventory_add({"sku": "A", "name": "Apple", "price": 50}, 2)
+        assert mapping.inventory_size() == 2
+        assert json.loads(json.dumps(mapping.inventory_get("A")))["name"] == "Apple"
+        assert mapping.inventory_get("Z") is None
+
+
+class TestInventoryLog:
+    def test_replays_adds_on_open(self, tmp_path):
+        path = tmp_path / "inventory.log"
+        with InventoryStore(path) as store:
+            store.add(APPLE, 3)
+            store.add(BANANA, 2)
+            store.add(InventoryItem(sku="A", name="Green apple", price=55), 1)
+
+        with InventoryStore(path) as store:
+            assert store.size == 6
+            assert store.get("A").as_dict() == {
+                "sku": "A",
+                "name": "Green apple",
+                "price": 55,
+            }
+            store.add(BANANA, 1)
+
+        assert InventoryStore(path).get("B").quantity == 3
+
+    def test_drops_a_torn_last_line(self, tmp_path):
+        path = tmp_path / "inventory.log"
+        with InventoryStore(path) as store:
+            store.add(APPLE, 3)
+        with open(path, "a") as log:
+            log.write('["B","Ban')
+
+        with InventoryStore(path) as store:
+            assert store.size == 3
+            assert "B" not in store
+            store.add(BANANA, 1)
+        assert InventoryStore(path).size == 4
+
+    def test_reports_corrupt_lines(self, tmp_path):
+        path = tmp_path / "inventory.log"
+        path.write_text('["A","Apple",50,1]\nnot json\n')
+        with pytest.raises(ValueError, match="line 2"):
+            InventoryStore(path)
+
+    def test_compact_keeps_one_line_per_sku(self, tmp_path):
+        path = tmp_path / "inventory.log"
+        with InventoryStore(path) as store:
+            for _ in range(10):
+                store.add(APPLE, 1)
+            store.add(BANANA, 4)
+            store.compact()
+            store.add(BANANA, 1)
+
+        assert len(path.read_text().splitlines()) == 3
+        with InventoryStore(path) as store:
+            assert (store.get("A").quantity, store.get("B").quantity) == (10, 5)
+            assert store.size == 15
@@ -0,0 +1,105 @@
+import pytest
+from pydantic import ValidationError
+from solutions.RBT.burrow import Burrow, RenderingOptions
+from solutions.RBT.rabbit_hole_solution import RabbitHoleSolution
+
+
+class TestBurrow:
+    def test_digs_along_the_moves(self):
+        burrow = Burrow(4, 6)
+        burrow.dig("RRDDLUUUURRRRRRRDDDD")
+        assert burrow.rabbit == (3, 5)
+        assert burrow.render({"rabbit": None}).splitlines() == [
+            "      ",
+            "#  ## ",
+            "#  ## ",
+            "##### ",
+        ]
+        assert burrow.render().splitlines()[-1] == "#####R"
+
+    def test_stops_at_the_edges(self):
+        burrow = Burrow(2, 3)
+        burrow.dig("ULLLDDDRRRRRU")
+        assert burrow.rabbit == (0, 2)
+        assert burrow.render({"earth": "."}) == " .R\n   "
+
+    def test_rejects_invalid_moves_before_digging(self):
+        burrow = Burrow(3, 3)
+        with pytest.raises(ValueError, match="'X' at position 2"):
+            burrow.dig("RDXR")
+        assert burrow.rabbit == (0, 0)
+        assert burrow.render() == "R##\n###\n###"
+        with pytest.raises(ValueError, match="at least one cell"):
+            Burrow(0, 3)
+
+    def test_rejects_bad_rendering_options(self):
+        with pytest.raises(ValidationError):
+            Burrow(1, 1).render({"earth": "##"})
+
+    def test_ignores_unknown_rendering_options(self):
+        assert Burrow(1, 2).render({"colour": "brown"}) == "R#"
+
+    def test_only_redraws_rows_dug_since_the_last_render(self):
+        burrow = Burrow(5, 5)
+        burrow.dig("DDRR")
+        options = RenderingOptions(rabbit=None)
+        burrow.render(options)
+        first = burrow._rendered[options].rows[:]
+        burrow.dig("RRUU")
+        assert burrow.render(options).splitlines() == [
+            " ### ",
+            " ### ",
+            "     ",
+            "#####",
+            "#####",
+        ]
+        second = burrow._rendered[options].rows
+        # Untouched rows are the very same strings as last time
+        assert [a is b for a, b in zip(first, second)] == [
+            False,
+            False,
+            False,
+            True,
+            True,
+        ]
+
+    def test_keeps_rendered_rows_per_options(self):
+        burrow = Burrow(3, 3)
+        burrow.dig("RD")
+        assert burrow.render({"earth": "."}) == "  .\n.R.\n..."
+        assert burrow.render({"earth": "%"}) == "  %\n%R%\n%%%"
+        burrow.dig("D")
+        assert burrow.render({"earth": "."}) == "  .\n. .\n.R."
+
+
+class TestRabbitHole:
+    def test_rabbit_hole(self):
+        drawing = RabbitHoleSolution().rabbit_hole(3, 4, "RRDD", {"tunnel": "o"})
+        assert drawing == "ooo#\n##o#\n##R#"
+
+    def test_accepts_a_list_of_moves(self):
+        assert RabbitHoleSolution().rabbit_hole(2, 2, ["R", "D"], None) == (
+            RabbitHoleSolution().rabbit_hole(2, 2, "RD", None)
+        )
+
+    def test_continues_the_previous_burrow(self):
+        solution = RabbitHoleSolution()
+        solution.rabbit_hole(4, 4, "RRD", None)
+        burrow = solution._burrow
+        assert solution.rabbit_hole(4, 4, "RRDD", None) == (
+            RabbitHoleSolution().rabbit_hole(4, 4, "RRDD", None)
+        )
+        assert solution._burrow is burrow
+        # Other moves or another grid start again
+        assert solution.rabbit_hole(4, 4, "D", None) == (
+            RabbitHoleSolution().rabbit_hole(4, 4, "D", None)
+        )
+        assert solution._burrow is not burrow
+        assert solution.rabbit_hole(2, 2, "D", None) == " #\nR#"
+
+    def test_invalid_moves_leave_the_previous_burrow_alone(self):
+        solution = RabbitHoleSolution()
+        solution.rabbit_hole(3, 3, "R", None)
+        with pytest.raises(ValueError):
+            solution.rabbit_hole(3, 3, "RQ", None)
+        assert solution.rabbit_hole(3, 3, "RD", None) == "  #\n#R#\n###"
@@ -0,0 +1,13 @@
+from solutions.ULT.ultimate_solution import UltimateSolution
+
+
+class TestUltimate:
+    def test_draws_the_route(self):
+        drawing = UltimateSolution().ultimate_maze(5, 5, {"seed": 3})
+        lines = drawing.splitlines()
+        assert lines[1].startswith("| * ")
+        assert lines[-2].endswith(" * |")
+
+    def test_route_can_be_hidden(self):
+        options = {"seed": 3, "show_route": False}
+        assert "*" not in UltimateSolution().ultimate_maze(5, 5, options)